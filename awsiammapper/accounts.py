@@ -0,0 +1,194 @@
+"""accounts - fan out mapping across multiple accounts and regions"""
+
+import collections
+import dataclasses
+import functools
+import logging
+import time
+
+from awsiammapper.client import _build_boto3_client, get_client
+from awsiammapper.metrics import default_metrics
+from awsiammapper.scheduler import default_scheduler
+
+GLOBAL_SERVICES = {"s3", "iam"}  # services mapped once per account, not per region
+SESSION_NAME = "awsiammapper"
+SESSION_REFRESH_MARGIN = 300  # seconds before expiry an assumed role is renewed
+
+_sessions = {}  # boto3 sessions and their expiry per role, reused by each process
+
+
+def account_id(role_arn: str) -> str:
+    """return the account id of an IAM role arn"""
+    return role_arn.split(":")[4]
+
+
+def get_session(role_arn: str):
+    """return a boto3 session for an assumed role, cached per process
+
+    Sessions outlive a single invocation of a warm Lambda, the role is assumed
+    again once its credentials are within SESSION_REFRESH_MARGIN of expiring.
+
+    Keyword arguments:
+    role_arn -- arn of the role to assume within the target account
+    """
+    # pylint: disable=import-outside-toplevel
+    import boto3
+
+    session, expiry = _sessions.get(role_arn, (None, 0))
+    if session is None or expiry - time.time() < SESSION_REFRESH_MARGIN:
+        credentials = _build_boto3_client("sts").assume_role(
+            RoleArn=role_arn, RoleSessionName=SESSION_NAME
+        )["Credentials"]
+        session = boto3.Session(
+            aws_access_key_id=credentials["AccessKeyId"],
+            aws_secret_access_key=credentials["SecretAccessKey"],
+            aws_session_token=credentials["SessionToken"],
+        )
+        _sessions[role_arn] = (session, credentials["Expiration"].timestamp())
+
+    return session
+
+
+def iter_account(role_arn, regions, services, workers=1, get_service_client=get_client):
+    """stream the statements of every service of an account, tagged with its id
+
+    Global services are mapped once in the first region.
+
+    Keyword arguments:
+    role_arn -- arn of the role to assume within the target account
+    regions -- list of regions to map
+    services -- list of services to map
+    workers -- number of concurrent requests used by each client
+    get_service_client -- factory function returning a client for a service
+    """
+    session = get_session(role_arn)
+    account = account_id(role_arn)
+
+    for i, region in enumerate(regions):
+        for service in services:
+            if service in GLOBAL_SERVICES and i > 0:
+                continue
+
+            client = get_service_client(
+                service, workers, session=session, region=region
+            )
+            with default_metrics.stage("list"):
+                resources = client.list()
+            default_metrics.inc("resources_total", len(resources), service=service)
+            for statement in client.iter_policies(resources, exit_on_error=False):
+                yield dataclasses.replace(statement, account=account)
+
+
+def map_account(role_arn, regions, services, workers=1, get_service_client=get_client):
+    """map every service of an account into a list, see iter_account for arguments"""
+    statements = list(
+        iter_account(role_arn, regions, services, workers, get_service_client)
+    )
+
+    logging.debug(
+        "account [%s] mapped %d statements", account_id(role_arn), len(statements)
+    )
+
+    return statements
+
+
+def _configure_process(rate_limit: float):
+    """initialize the scheduler of a pool process, pickled by reference"""
+    default_scheduler.configure(rate=rate_limit)
+
+
+def iter_accounts(
+    roles,
+    regions,
+    services,
+    workers=1,
+    processes=1,
+    rate_limit=0.0,
+    mp_context=None,
+):
+    """stream the statements of each account in the order of the roles given
+
+    Accounts are mapped within a process pool when processes is greater than one,
+    each process pacing its calls with its own scheduler. Processes are spawned
+    rather than forked, as the pool is started from a thread of the engine while
+    other threads hold locks. At most one account per
+    process is mapped ahead of the account being streamed, so memory is bounded
+    by the largest accounts rather than every account. Without a pool each
+    account is streamed as it is mapped.
+
+    Keyword arguments:
+    roles -- list of role arns, one per account
+    regions -- list of regions to map
+    services -- list of services to map
+    workers -- number of concurrent requests used by each client
+    processes -- number of accounts mapped at the same time
+    rate_limit -- requests per second budget of each API operation within a process
+    mp_context -- multiprocessing context of the pool, defaults to spawn
+    """
+    if processes <= 1:
+        for role in roles:
+            yield from iter_account(role, regions, services, workers)
+        return
+
+    # pylint: disable=import-outside-toplevel
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    map_role = functools.partial(
+        map_account, regions=regions, services=services, workers=workers
+    )
+    executor = ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=mp_context or multiprocessing.get_context("spawn"),
+        initializer=_configure_process,
+        initargs=(rate_limit,),
+    )
+    pending = collections.deque()
+    try:
+        for role in roles:
+            pending.append(executor.submit(map_role, role))
+            if len(pending) > processes:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+class AccountsClient:
+    """map the accounts of roles as the resources of a single client
+
+    Lets the fan out run within the engine, which streams it into the output and
+    ends the output at the deadline of the run. See iter_accounts for arguments.
+    """
+
+    service = "accounts"
+
+    def __init__(
+        self, roles, regions, services, workers=1, processes=1, rate_limit=0.0
+    ):
+        self.roles = roles
+        self.regions = regions
+        self.services = services
+        self.workers = workers
+        self.processes = processes
+        self.rate_limit = rate_limit
+
+    def list(self) -> list[str]:
+        """list - list the role arn of each account"""
+        return list(self.roles)
+
+    def iter_policies(self, resources, exit_on_error=True):
+        # pylint: disable=unused-argument
+        """iter_policies - stream the statements of the account of each role
+
+        Errors of a resource are skipped within the clients of each account.
+        """
+        return iter_accounts(
+            resources,
+            self.regions,
+            self.services,
+            workers=self.workers,
+            processes=self.processes,
+            rate_limit=self.rate_limit,
+        )
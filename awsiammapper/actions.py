@@ -0,0 +1,146 @@
+"""actions - match wildcard policy actions against a bundled action catalog
+
+The catalog in data/actions.json lists the actions of the supported services,
+S3 from the AWS Service Authorization Reference and the remaining services from
+the botocore service models.
+"""
+
+import bisect
+import functools
+import json
+import re
+from collections.abc import Iterable, Iterator
+from importlib import resources
+
+from awsiammapper.policy import PolicyStatement
+
+CATALOG_RESOURCE = "data/actions.json"
+MATCH_CACHE_SIZE = 1_000_000
+
+
+class ActionCatalog:
+    """index of service actions for expanding and matching wildcard actions
+
+    Actions are held per service in sorted lower case order so the literal prefix
+    of a pattern, the text before its first wildcard, selects a contiguous range
+    of candidates by binary search. Only candidates are tested against the
+    compiled pattern and results are memoized per pattern.
+
+    Keyword arguments:
+    actions -- mapping of service prefix to its action names
+    """
+
+    def __init__(self, actions: dict[str, Iterable[str]]):
+        self._actions = {}
+        self._keys = {}
+        for service, names in actions.items():
+            entries = sorted(
+                (f"{service}:{name}".lower(), f"{service}:{name}") for name in names
+            )
+            self._keys[service.lower()] = [key for key, _ in entries]
+            self._actions[service.lower()] = [action for _, action in entries]
+        self._expanded = {}
+
+    def services(self) -> list[str]:
+        """service prefixes within the catalog"""
+        return list(self._actions)
+
+    def expand(self, pattern: str) -> tuple[str, ...]:
+        """catalog actions matching an action pattern such as s3:Get*
+
+        Patterns of services outside the catalog expand to nothing.
+
+        Keyword arguments:
+        pattern -- IAM action, * and ? are wildcards, matched case insensitively
+        """
+        if pattern not in self._expanded:
+            self._expanded[pattern] = tuple(self._expand(pattern))
+
+        return self._expanded[pattern]
+
+    def _expand(self, pattern: str) -> Iterator[str]:
+        lowered = pattern.lower()
+        prefix = re.split(r"[*?]", lowered, maxsplit=1)[0]
+        service = prefix.split(":", 1)[0] if ":" in prefix else None
+        regex = compile_pattern(pattern)
+
+        for name in [service] if service is not None else self._actions:
+            keys = self._keys.get(name, [])
+            start = bisect.bisect_left(keys, prefix)
+            end = bisect.bisect_left(keys, prefix + "\uffff")
+            for i in range(start, end):
+                if regex.fullmatch(keys[i]):
+                    yield self._actions[name][i]
+
+
+@functools.cache
+def load_catalog() -> ActionCatalog:
+    """the action catalog bundled with the package"""
+    with resources.files("awsiammapper").joinpath(CATALOG_RESOURCE).open(
+        "r", encoding="utf-8"
+    ) as f:
+        return ActionCatalog(json.load(f))
+
+
+@functools.cache
+def compile_pattern(pattern: str, case_sensitive: bool = False) -> re.Pattern:
+    """compile an IAM wildcard pattern to a regex, lower case unless case sensitive
+
+    Keyword arguments:
+    pattern -- IAM pattern, * and ? are wildcards
+    case_sensitive -- keep the case of the pattern, as for resource arns
+    """
+    return re.compile(
+        "".join(
+            ".*" if char == "*" else "." if char == "?" else re.escape(char)
+            for char in (pattern if case_sensitive else pattern.lower())
+        ),
+        re.DOTALL,
+    )
+
+
+@functools.lru_cache(maxsize=MATCH_CACHE_SIZE)
+def matches(pattern: str, action: str) -> bool:
+    """whether an IAM action pattern matches an action, memoized
+
+    Keyword arguments:
+    pattern -- IAM action pattern, * and ? are wildcards
+    action -- action to test, such as s3:GetObject
+    """
+    return compile_pattern(pattern).fullmatch(action.lower()) is not None
+
+
+def expand_statements(
+    statements: Iterable[PolicyStatement], catalog: ActionCatalog | None = None
+) -> Iterator[PolicyStatement]:
+    """replace wildcard actions with a statement per matching catalog action
+
+    Actions without wildcards, or of services outside the catalog, are kept.
+
+    Keyword arguments:
+    statements -- iterable of Policy Statements
+    catalog -- action catalog, defaults to the bundled catalog
+    """
+    catalog = catalog if catalog else load_catalog()
+
+    for statement in statements:
+        expanded = (
+            catalog.expand(statement.action)
+            if "*" in statement.action or "?" in statement.action
+            else ()
+        )
+        if not expanded:
+            yield statement
+            continue
+
+        for action in expanded:
+            yield PolicyStatement(
+                statement.statement_id,
+                statement.principle_authority,
+                statement.principle_ref,
+                action,
+                statement.effect,
+                statement.resource,
+                statement.conditions,
+                statement.account,
+            )
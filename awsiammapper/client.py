@@ -1,90 +1,411 @@
 """Manage integrations to list resources and retreive their policies"""
 
-import ast
+import dataclasses
+import functools
+import importlib
+import itertools
 import logging
-from typing import Literal
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Literal
 
-import boto3
+from awsiammapper.metrics import default_metrics
+from awsiammapper.parser import parse_policy
+from awsiammapper.policy import FactoredStatement, factor
+from awsiammapper.scheduler import MAX_ATTEMPTS, default_scheduler
+from awsiammapper.template import factor_bucket_policy
 
-from awsiammapper.policy import flattern
+if TYPE_CHECKING:
+    from awsiammapper.snapshot import SnapshotStore
 
-Service = Literal["s3", "iam"]
+Service = Literal["s3", "iam", "terraform", "cloudformation", "config"]
+
+DEFAULT_MAX_POOL_CONNECTIONS = 10
+OFFLINE_CLIENTS = {  # module and class of clients reading files, imported on use
+    "terraform": ("awsiammapper.iac", "TerraformClient"),
+    "cloudformation": ("awsiammapper.iac", "CloudFormationClient"),
+    "config": ("awsiammapper.configservice", "ConfigClient"),
+}
+CLIENT_CACHE_SIZE = 128  # boto3 clients kept for reuse across warm invocations
+MISSING_POLICY_CODES = {"NoSuchBucket", "NoSuchBucketPolicy"}
+
+
+@functools.lru_cache(maxsize=CLIENT_CACHE_SIZE)
+def _build_boto3_client(
+    service: str, max_workers: int = 1, session=None, region: str | None = None
+):
+    """create an instrumented boto3 client with a pool sized to the worker count
+
+    Clients are thread safe and cached per process, boto3 is imported on first use
+    to keep the import of this module and the Lambda cold start light. Calls are
+    paced by the shared scheduler and retried in the standard mode of botocore,
+    backing off exponentially with jitter.
+    """
+    # pylint: disable=import-outside-toplevel
+    import boto3
+    from botocore.config import Config
+
+    return default_scheduler.attach(
+        default_metrics.instrument(
+            (session if session else boto3).client(
+                service,
+                region_name=region,
+                config=Config(
+                    max_pool_connections=max(max_workers, DEFAULT_MAX_POOL_CONNECTIONS),
+                    retries={"mode": "standard", "max_attempts": MAX_ATTEMPTS},
+                ),
+            )
+        )
+    )
 
 
 class BaseClient:
     """interface to AWS Services to list specific resources and their policies"""
 
+    service = ""
+
     def list(self) -> list[str]:
         """list - list resources (does not use pagination)"""
         raise NotImplementedError()
 
     def get_policies(self, resources, exit_on_error=True):
         """get_policies - get a list of policies for each resources"""
+        return list(self.iter_policies(resources, exit_on_error))
+
+    def iter_policies(self, resources, exit_on_error=True):
+        """iter_policies - stream the policies of each resource
+
+        The time spent fetching and factoring each statement is recorded as the
+        fetch stage and its expansion into rows as the flattern stage.
+        """
+        factored = iter(self.iter_factored(resources, exit_on_error))
+        while True:
+            start = time.perf_counter()
+            statement = next(factored, None)
+            fetched = time.perf_counter()
+            if statement is None:
+                return
+            default_metrics.observe("stage_seconds", fetched - start, stage="fetch")
+            yield from self._expand(statement)
+
+    def _expand(self, statement):
+        """stream the rows of a statement, timing only the expansion of each row"""
+        rows = iter(statement)
+        count = 0
+        elapsed = 0.0
+        while True:
+            start = time.perf_counter()
+            row = next(rows, None)
+            elapsed += time.perf_counter() - start
+            if row is None:
+                break
+            count += 1
+            yield row
+
+        default_metrics.observe("stage_seconds", elapsed, stage="flattern")
+        default_metrics.inc("rows_total", count, service=self.service)
+
+    def iter_factored(self, resources, exit_on_error=True):
+        """iter_factored - stream the unexpanded policy statements of each resource"""
         raise NotImplementedError()
 
+    def iter_by_resource(self, resources, exit_on_error=True):
+        """iter_by_resource - stream each resource with its unexpanded statements
+
+        Resources without a policy are yielded with no statements when errors are
+        ignored. Clients override this to fetch resources concurrently, by default
+        each resource is requested on its own.
+        """
+        for resource in resources:
+            yield resource, list(self.iter_factored([resource], exit_on_error))
+
 
 class S3Client(BaseClient):
     """AWS S3 client - list buckets and get associated bucket policies"""
 
-    def __init__(self, client=None):
-        self.client = client if client else boto3.client("s3")
+    service = "s3"
+
+    def __init__(self, client=None, max_workers=1, snapshot=None):
+        self.client = client if client else _build_boto3_client("s3", max_workers)
+        self.max_workers = max_workers
+        self.snapshot = snapshot
 
     def list(self) -> list[str]:
         """list - list S3 buckets contained within the associated AWS account"""
         return [bucket["Name"] for bucket in self.client.list_buckets()["Buckets"]]
 
-    def get_policies(self, resources, exit_on_error=True):
-        """get policies for each specified bucket
+    def iter_factored(self, resources, exit_on_error=True):
+        """stream unexpanded policy statements for each specified bucket
 
         Keyword arguments:
         resources -- list of buckets to retreive bucket policies
         exit_on_error --- default True, on True ignore errors such as no bucket policy
         """
 
-        policies = []
-        for policy_document in self._get_bucket_policy_document(
-            resources, exit_on_error
-        ):
-            for statement in policy_document:
-                policies += flattern(statement)
+        for _, statements in self.iter_by_resource(resources, exit_on_error):
+            yield from statements
 
-        return policies
+    def iter_by_resource(self, resources, exit_on_error=True):
+        """stream each bucket with its unexpanded policy statements
+
+        When errors are ignored, buckets without a policy are yielded with no
+        statements, buckets which fail to be fetched, such as when access is
+        denied, are logged and skipped.
+
+        Keyword arguments:
+        resources -- list of buckets to retreive bucket policies
+        exit_on_error --- default True, on True ignore errors such as no bucket policy
+        """
+        yield from self._get_bucket_policy_statements(resources, exit_on_error)
+
+    def _get_bucket_policy_statements(self, resources, exit_on_error=True):
+        """yield each bucket with its factored policy statements in the order given
+
+        Buckets are fetched concurrently when max_workers is greater than one,
+        a failed bucket does not prevent the remaining buckets being fetched.
+        """
+        resources = list(resources)
+        if self.max_workers > 1:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                yield from self._handle_fetched(
+                    resources,
+                    executor.map(self._fetch_bucket_policy, resources),
+                    exit_on_error,
+                )
+        else:
+            yield from self._handle_fetched(
+                resources, map(self._fetch_bucket_policy, resources), exit_on_error
+            )
+
+    @staticmethod
+    def _handle_fetched(resources, fetched, exit_on_error):
+        for resource, (statements, error) in zip(resources, fetched):
+            if error is None:
+                yield resource, statements
+                continue
+
+            if not _is_missing(error):
+                logging.warning(
+                    "bucket [%s] policy could not be fetched: %s", resource, error
+                )
+                if exit_on_error:
+                    raise error
+                continue
 
-    def _get_bucket_policy_document(self, resources, exit_on_error=True):
-        try:
-            for resource in resources:
-                yield ast.literal_eval(
-                    self.client.get_bucket_policy(Bucket=resource)["Policy"]
-                )["Statement"]
-        except self.client.exceptions.from_code("noSuchBucketPolicy") as e:
             logging.debug(
                 "bucket [%s] does not exist or does not contain a bucket policy",
                 resource,
             )
 
             if exit_on_error:
-                raise KeyError("Resource not found") from e
+                raise KeyError("Resource not found") from error
+
+            yield resource, []
+
+    def _fetch_bucket_policy(self, resource):
+        try:
+            policy, error = self._get_bucket_policy_text(resource)
+        except self.client.exceptions.ClientError as e:
+            return None, e
+
+        if policy is None:
+            return None, error
+
+        if not self.snapshot:
+            return factor_bucket_policy(policy, resource), None
+
+        statements = self.snapshot.get_statements("s3", resource, policy)
+        if statements is None:
+            statements = factor_bucket_policy(policy, resource)
+            self.snapshot.put_statements("s3", resource, policy, statements)
+
+        return statements, None
+
+    def _get_bucket_policy_text(self, resource):
+        snapshot = self.snapshot.get_fresh("s3", resource) if self.snapshot else None
+        if snapshot is not None:
+            return snapshot.policy, (
+                None
+                if snapshot.policy
+                else LookupError(f"bucket [{resource}] has no snapshot policy")
+            )
+
+        try:
+            policy, error = (
+                self.client.get_bucket_policy(Bucket=resource)["Policy"],
+                None,
+            )
+        except self.client.exceptions.ClientError as e:
+            if not _is_missing(e):
+                raise
+            policy, error = None, e
+
+        if self.snapshot:
+            self.snapshot.put("s3", resource, policy)
+
+        return policy, error
+
+
+def _is_missing(error: Exception) -> bool:
+    """True when an error is a bucket or bucket policy which does not exist"""
+    return isinstance(error, LookupError) or (
+        getattr(error, "response", {}).get("Error", {}).get("Code")
+        in MISSING_POLICY_CODES
+    )
 
 
 class IAMRoleClient(BaseClient):
-    """boto3 client wrapper for the AWS IAM Role interaction"""
+    """boto3 client wrapper for the AWS IAM Role interaction
 
-    def __init__(self, client=None):
-        self.client = client if client else boto3.client("iam")
+    Roles and their policies are read in bulk with GetAccountAuthorizationDetails,
+    each managed policy is flattened once and bound to every role it is attached
+    to. Identity policy statements have the role as their principal.
+    """
+
+    service = "iam"
+
+    def __init__(self, client=None, max_workers=1, snapshot=None):
+        if snapshot is not None:
+            raise ValueError("the iam client does not support a snapshot")
+        self.client = client if client else _build_boto3_client("iam", max_workers)
+        self.max_workers = max_workers
 
     def list(self) -> list[str]:
-        """list - list resources (does not use pagination)"""
+        """list - list IAM role names contained within the associated AWS account"""
+        return [
+            role["RoleName"]
+            for page in self._get_authorization_details(["Role"])
+            for role in page["RoleDetailList"]
+        ]
 
-    def get_policies(self, resources, exit_on_error=True):
-        """get_policies - get a list of policies for each resources"""
+    def iter_factored(self, resources, exit_on_error=True):
+        """stream unexpanded policy statements for each specified role
+
+        Keyword arguments:
+        resources -- list of role names to retreive policies
+        exit_on_error --- default True, raise when a role does not exist
+        """
+        for _, statements in self.iter_by_resource(resources, exit_on_error):
+            yield from statements
+
+    def iter_by_resource(self, resources, exit_on_error=True):
+        """stream each specified role with its unexpanded policy statements
+
+        Keyword arguments:
+        resources -- list of role names to retreive policies
+        exit_on_error --- default True, raise when a role does not exist
+        """
+        roles = {}
+        managed_policies = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for page_roles, page_policies in executor.map(
+                self._process_page,
+                self._get_authorization_details(
+                    ["Role", "LocalManagedPolicy", "AWSManagedPolicy"]
+                ),
+            ):
+                roles.update(page_roles)
+                managed_policies.update(page_policies)
+
+        for resource in resources:
+            if resource not in roles:
+                logging.debug("role [%s] does not exist", resource)
+                if exit_on_error:
+                    raise KeyError("Resource not found")
+                yield resource, []
+                continue
+
+            role_arn, inline_statements, policy_arns = roles[resource]
+            yield resource, [
+                dataclasses.replace(statement, principals=(("AWS", role_arn),))
+                for statement in itertools.chain(
+                    inline_statements,
+                    *(managed_policies.get(arn, ()) for arn in policy_arns),
+                )
+            ]
+
+    def _get_authorization_details(self, filters):
+        return self.client.get_paginator("get_account_authorization_details").paginate(
+            Filter=filters
+        )
+
+    @staticmethod
+    def _process_page(page):
+        roles = {
+            role["RoleName"]: (
+                role["Arn"],
+                [
+                    statement
+                    for policy in role["RolePolicyList"]
+                    for statement in factor_identity_policy(policy["PolicyDocument"])
+                ],
+                [policy["PolicyArn"] for policy in role["AttachedManagedPolicies"]],
+            )
+            for role in page.get("RoleDetailList", [])
+        }
+        managed_policies = {
+            policy["Arn"]: factor_identity_policy(version["Document"])
+            for policy in page.get("Policies", [])
+            for version in policy["PolicyVersionList"]
+            if version["IsDefaultVersion"]
+        }
+
+        return roles, managed_policies
 
 
-def get_client(service: Service) -> BaseClient:
+def factor_identity_policy(document) -> list[FactoredStatement]:
+    """factor the statements of an identity policy without a principal
+
+    Statements using NotAction or NotResource are not mapped.
+    """
+    if isinstance(document, str):
+        document = parse_policy(urllib.parse.unquote(document))
+
+    statements = document["Statement"]
+    if isinstance(statements, dict):
+        statements = [statements]
+
+    return [
+        factor({**statement, "Principal": {}})
+        for statement in statements
+        if "Action" in statement and "Resource" in statement
+    ]
+
+
+def get_client(
+    service: Service,
+    max_workers: int = 1,
+    snapshot: "SnapshotStore | None" = None,
+    session=None,
+    region: str | None = None,
+    source: str | None = None,
+) -> BaseClient:
     """Factory function for AWS resource clients
 
     Keyword Arguments:
-    service - an aws service - [s3, iam]
+    service - an aws service - [s3, iam] or a file source - [terraform,
+    cloudformation, config]
+    max_workers - number of concurrent requests used when retrieving policies
+    snapshot - optional store used to skip resources fetched within its ttl
+    session - optional boto3 session, defaults to the default session
+    region - optional region, defaults to the session region
+    source - file path read by offline clients instead of calling AWS
     """
     clients = {"s3": S3Client, "iam": IAMRoleClient}
 
-    return clients[service]()
+    if service in OFFLINE_CLIENTS:
+        if source is None:
+            raise ValueError(f"the {service} client requires a source file")
+
+        module, name = OFFLINE_CLIENTS[service]
+        return getattr(importlib.import_module(module), name)(source)
+
+    client = (
+        _build_boto3_client(service, max_workers, session, region)
+        if session or region
+        else None
+    )
+
+    return clients[service](client=client, max_workers=max_workers, snapshot=snapshot)
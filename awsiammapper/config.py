@@ -3,7 +3,7 @@
 import argparse
 import os
 import sys
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 
 
 @dataclass(frozen=True)
@@ -12,6 +12,24 @@ class AppConfig:
 
     file_path: str
     services: list[str]
+    workers: int = 1
+    timeout: float | None = None
+    snapshot: str | None = None
+    snapshot_ttl: float = 0
+    roles: list[str] = field(default_factory=list)
+    regions: list[str] = field(default_factory=list)
+    processes: int = 1
+    output_format: str = "csv"
+    expand_actions: bool = False
+    metrics: str | None = None
+    profile: str | None = None
+    shard_index: int = 0
+    shard_count: int = 1
+    merge: bool = False
+    journal: str | None = None
+    resume: bool = False
+    source: str | None = None
+    rate_limit: float = 0.0
 
 
 def from_cli():
@@ -30,10 +48,145 @@ def from_cli():
         help="comma delimeted list of servics to map access",
     )
     parser.add_argument("-o", "--output", dest="output", help="output location")
+    parser.add_argument(
+        "--source",
+        dest="source",
+        help="terraform state or plan json, cloudformation json template or AWS"
+        " Config snapshot file or directory, read by the terraform, cloudformation"
+        " and config services instead of calling AWS",
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        dest="output_format",
+        choices=["csv", "parquet", "index", "sqlite"],
+        default="csv",
+        help="output format, parquet requires the parquet extra",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        dest="workers",
+        type=int,
+        default=1,
+        help="number of concurrent requests used to retrieve policies",
+    )
+    parser.add_argument(
+        "-t",
+        "--timeout",
+        dest="timeout",
+        type=float,
+        help="overall deadline in seconds to retrieve policies",
+    )
+    parser.add_argument(
+        "--snapshot",
+        dest="snapshot",
+        help="SQLite file recording fetched s3 policies between runs",
+    )
+    parser.add_argument(
+        "--snapshot-ttl",
+        dest="snapshot_ttl",
+        type=float,
+        default=0,
+        help="seconds a policy in the snapshot is reused without fetching",
+    )
+    parser.add_argument(
+        "--journal",
+        dest="journal",
+        help="SQLite file journaling each completed resource of the run",
+    )
+    parser.add_argument(
+        "--resume",
+        dest="resume",
+        action="store_true",
+        help="resume an interrupted run, replaying the resources in the journal",
+    )
+    parser.add_argument(
+        "--expand-actions",
+        dest="expand_actions",
+        action="store_true",
+        help="replace wildcard actions with each matching action of the catalog",
+    )
+    parser.add_argument(
+        "--metrics",
+        dest="metrics",
+        help="file path, without extension, to write METRICS.json and METRICS.prom",
+    )
+    parser.add_argument(
+        "--profile",
+        dest="profile",
+        help="file path to write cProfile stats of the run to",
+    )
+    parser.add_argument(
+        "--shard-index",
+        dest="shard_index",
+        type=int,
+        default=0,
+        help="zero based index of the slice of resources to map",
+    )
+    parser.add_argument(
+        "--shard-count",
+        dest="shard_count",
+        type=int,
+        default=1,
+        help="number of slices the resources are split into, each a partial output",
+    )
+    parser.add_argument(
+        "--merge",
+        dest="merge",
+        action="store_true",
+        help="combine the partial outputs of every shard into the output",
+    )
+    parser.add_argument(
+        "--rate-limit",
+        dest="rate_limit",
+        type=float,
+        default=0.0,
+        help="requests per second budget of each API operation, 0 for no budget",
+    )
+    parser.add_argument(
+        "--roles",
+        dest="roles",
+        help="comma delimeted list of role arns to assume, one per account to map",
+    )
+    parser.add_argument(
+        "--regions",
+        dest="regions",
+        help="comma delimeted list of regions to map within each account",
+    )
+    parser.add_argument(
+        "-p",
+        "--processes",
+        dest="processes",
+        type=int,
+        default=1,
+        help="number of accounts mapped at the same time",
+    )
 
     args = parser.parse_args(sys.argv[1:])
 
-    return AppConfig(file_path=args.output, services=str.split(args.services, ","))
+    return AppConfig(
+        file_path=args.output,
+        services=_split(args.services),
+        workers=args.workers,
+        timeout=args.timeout,
+        snapshot=args.snapshot,
+        snapshot_ttl=args.snapshot_ttl,
+        roles=_split(args.roles),
+        regions=_split(args.regions),
+        processes=args.processes,
+        output_format=args.output_format,
+        expand_actions=args.expand_actions,
+        metrics=args.metrics,
+        profile=args.profile,
+        shard_index=args.shard_index,
+        shard_count=args.shard_count,
+        merge=args.merge,
+        journal=args.journal,
+        resume=args.resume,
+        source=args.source,
+        rate_limit=args.rate_limit,
+    )
 
 
 def from_env():
@@ -41,5 +194,30 @@ def from_env():
 
     return AppConfig(
         file_path=os.getenv("awsiammapper_OUTPUT"),
-        services=str.split(os.getenv("awsiammapper_SERVICES"), ","),
+        services=_split(os.getenv("awsiammapper_SERVICES")),
+        workers=int(os.getenv("awsiammapper_WORKERS", "1")),
+        timeout=(
+            float(os.getenv("awsiammapper_TIMEOUT"))
+            if os.getenv("awsiammapper_TIMEOUT")
+            else None
+        ),
+        snapshot=os.getenv("awsiammapper_SNAPSHOT"),
+        snapshot_ttl=float(os.getenv("awsiammapper_SNAPSHOT_TTL", "0")),
+        roles=_split(os.getenv("awsiammapper_ROLES")),
+        regions=_split(os.getenv("awsiammapper_REGIONS")),
+        processes=int(os.getenv("awsiammapper_PROCESSES", "1")),
+        output_format=os.getenv("awsiammapper_FORMAT", "csv"),
+        expand_actions=os.getenv("awsiammapper_EXPAND_ACTIONS", "").lower() == "true",
+        metrics=os.getenv("awsiammapper_METRICS"),
+        profile=os.getenv("awsiammapper_PROFILE"),
+        shard_index=int(os.getenv("awsiammapper_SHARD_INDEX", "0")),
+        shard_count=int(os.getenv("awsiammapper_SHARD_COUNT", "1")),
+        journal=os.getenv("awsiammapper_JOURNAL"),
+        resume=os.getenv("awsiammapper_RESUME", "").lower() == "true",
+        source=os.getenv("awsiammapper_SOURCE"),
+        rate_limit=float(os.getenv("awsiammapper_RATE_LIMIT", "0")),
     )
+
+
+def _split(value: str | None) -> list[str]:
+    return str.split(value, ",") if value else []
@@ -0,0 +1,79 @@
+"""configservice - offline client reading AWS Config snapshot and history files"""
+
+import json
+
+from awsiammapper.iac import Inventory, OfflineClient
+from awsiammapper.parser import parse_policy
+from awsiammapper.stream import JsonScanner
+
+ITEM_KEYS = {"resourceType", "resourceName", "ARN", "configurationItemStatus"}
+DELETED_STATUSES = {"ResourceDeleted", "ResourceDeletedNotRecorded"}
+
+
+class ConfigClient(OfflineClient):
+    """read policies from AWS Config snapshot or history files
+
+    Bucket policies are read from the supplementary configuration of S3 buckets,
+    identity policies from the configuration of IAM roles and customer managed
+    policies. Later configuration items of a resource replace earlier ones,
+    deleted resources are removed. Configuration is only decoded for these
+    resource types, everything else is skipped.
+    """
+
+    service = "config"
+
+    def _scan(self, scanner: JsonScanner, inventory: Inventory):
+        for _ in scanner.iter_path(("configurationItems", "*"), decode=False):
+            item = {}
+            for key in scanner.iter_object():
+                if key in ITEM_KEYS:
+                    item[key] = scanner.decode()
+                elif key in ("configuration", "supplementaryConfiguration"):
+                    item[key] = scanner.raw()
+                else:
+                    scanner.skip()
+
+            _add_item(inventory, item)
+
+
+def _add_item(inventory: Inventory, item: dict):
+    resource_type = item.get("resourceType")
+    name = item.get("resourceName")
+    deleted = item.get("configurationItemStatus") in DELETED_STATUSES
+
+    if resource_type == "AWS::S3::Bucket":
+        inventory.resource_policies.pop(name, None)
+        supplementary = _load(item.get("supplementaryConfiguration"))
+        policy = _load(supplementary.get("BucketPolicy")).get("policyText")
+        if policy and not deleted:
+            inventory.resource_policies[name] = [parse_policy(policy)]
+    elif resource_type == "AWS::IAM::Role":
+        inventory.roles.pop(name, None)
+        if deleted:
+            return
+        configuration = _load(item.get("configuration"))
+        inventory.add_role(name, item.get("ARN"))
+        inventory.role_policies[name] = [
+            policy["policyDocument"]
+            for policy in configuration.get("rolePolicyList") or []
+        ]
+        inventory.attachments[name] = [
+            policy["policyArn"]
+            for policy in configuration.get("attachedManagedPolicies") or []
+        ]
+    elif resource_type == "AWS::IAM::Policy":
+        inventory.managed_policies.pop(item.get("ARN"), None)
+        if deleted:
+            return
+        configuration = _load(item.get("configuration"))
+        for version in configuration.get("policyVersionList") or []:
+            if version.get("isDefaultVersion"):
+                inventory.managed_policies[item["ARN"]] = version["document"]
+
+
+def _load(value) -> dict:
+    """decode a json value, configuration is itself json encoded in some files"""
+    while isinstance(value, str):
+        value = json.loads(value)
+
+    return value or {}
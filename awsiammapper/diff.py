@@ -0,0 +1,248 @@
+"""diff - stream the grants added and removed between two mapping outputs
+
+Each output is reduced to canonical row keys which are sorted externally, in
+runs of bounded size spilled to temporary files, then merged. The sorted runs
+of both outputs are memory mapped and compared as bytes in a single pass, so
+memory is bounded by the run size however many rows the outputs hold.
+"""
+
+import argparse
+import heapq
+import itertools
+import json
+import logging
+import mmap
+import tempfile
+from collections.abc import Iterable, Iterator
+from dataclasses import dataclass
+
+from awsiammapper.policy import Condition, PolicyStatement
+from awsiammapper.writer import format_condition_value, get_reader, write_diff
+
+RUN_SIZE = 250_000  # row keys sorted in memory before spilling a run to disk
+
+_UNIT = "\x1f"  # separates the fields of a row key
+_RECORD = "\x1e"  # marks a json encoded row key
+_encode = json.JSONEncoder(separators=(",", ":")).encode
+
+
+@dataclass
+class SortedRows:
+    """sorted runs of the canonical row keys of an output and its column shape"""
+
+    runs: list[str]
+    max_conditions: int = 0
+    accounts: bool = False
+
+    def __iter__(self) -> Iterator[bytes]:
+        """merge the runs, yielding each distinct row key in order"""
+        keys = heapq.merge(*(_iter_run(run) for run in self.runs))
+        return (key for key, _ in itertools.groupby(keys))
+
+
+def sort_rows(
+    statements: Iterable[PolicyStatement], directory: str, run_size=RUN_SIZE
+) -> SortedRows:
+    """sort the canonical row keys of statements into runs written to directory
+
+    Keyword arguments:
+    statements -- iterable of Policy Statements
+    directory -- directory the sorted runs are written to
+    run_size -- number of row keys sorted in memory per run
+    """
+    rows = SortedRows([])
+    keys = _iter_keys(statements, rows)
+
+    while batch := sorted(itertools.islice(keys, run_size)):
+        with tempfile.NamedTemporaryFile(
+            "wb", dir=directory, suffix=".run", delete=False
+        ) as run:
+            run.writelines(batch)
+        rows.runs.append(run.name)
+
+    return rows
+
+
+def iter_changes(before: Iterable[bytes], after: Iterable[bytes]):
+    """merge two sorted streams of row keys, yielding the keys of each change
+
+    Yields ("removed", key) for keys only before and ("added", key) for keys
+    only after, in key order.
+
+    Keyword arguments:
+    before -- sorted distinct row keys of the earlier output
+    after -- sorted distinct row keys of the later output
+    """
+    before, after = iter(before), iter(after)
+    removed, added = next(before, None), next(after, None)
+
+    while removed is not None or added is not None:
+        if added is None or (removed is not None and removed < added):
+            yield "removed", removed
+            removed = next(before, None)
+        elif removed is None or added < removed:
+            yield "added", added
+            added = next(after, None)
+        else:
+            removed, added = next(before, None), next(after, None)
+
+
+def diff(
+    before: str,
+    after: str,
+    fp: str,
+    input_format: str = "csv",
+    run_size=RUN_SIZE,
+) -> dict[str, int]:
+    """write the grants added and removed between two outputs as a csv
+
+    Rows are the columns of write_csv preceded by a change column of added or
+    removed, sorted by resource, principal and action. Statements are compared
+    on every field with conditions in any order, duplicate rows count once.
+    Returns the number of rows of each change.
+
+    Keyword arguments:
+    before -- file path of the earlier output
+    after -- file path of the later output
+    fp -- file path you write the changes to, compressed when ending .gz or .zst
+    input_format -- output format of both inputs - [csv, parquet, index, sqlite]
+    run_size -- number of row keys sorted in memory per run
+    """
+    read = get_reader(input_format)
+    counts = {"added": 0, "removed": 0}
+
+    with tempfile.TemporaryDirectory() as directory:
+        before_rows = sort_rows(read(before), directory, run_size)
+        after_rows = sort_rows(read(after), directory, run_size)
+
+        write_diff(
+            _count(iter_changes(before_rows, after_rows), counts),
+            fp,
+            max(before_rows.max_conditions, after_rows.max_conditions),
+            before_rows.accounts or after_rows.accounts,
+        )
+
+    logging.debug(
+        "diff of [%s] and [%s] added %d and removed %d rows",
+        before,
+        after,
+        counts["added"],
+        counts["removed"],
+    )
+
+    return counts
+
+
+def _iter_keys(statements: Iterable[PolicyStatement], rows: SortedRows):
+    """yield the row key of each statement, recording the column shape in rows"""
+    for statement in statements:
+        rows.max_conditions = max(rows.max_conditions, len(statement.conditions))
+        if statement.account is not None:
+            rows.accounts = True
+
+        yield _row_key(statement)
+
+
+def _row_key(statement: PolicyStatement) -> bytes:
+    """canonical key of a row, ordered by resource, principal and action
+
+    Fields are joined with the unit separator, or json encoded behind a record
+    separator when a field holds either separator or a newline, so every row
+    has a single key that decodes back into it.
+    """
+    fields = [
+        statement.resource,
+        statement.principle_ref,
+        statement.action,
+        statement.principle_authority,
+        statement.effect,
+        statement.statement_id,
+        statement.account or "",
+    ]
+    for condition in sorted(
+        (condition.key, condition.operater, format_condition_value(condition.value))
+        for condition in statement.conditions
+    ):
+        fields += condition
+
+    line = _UNIT.join(fields)
+    if line.count(_UNIT) != len(fields) - 1 or _RECORD in line or "\n" in line:
+        line = _RECORD + _encode(fields)
+
+    return line.encode("utf-8") + b"\n"
+
+
+def _key_statement(key: bytes) -> PolicyStatement:
+    """decode a row key back into its policy statement"""
+    line = key.decode("utf-8").removesuffix("\n")
+    (
+        resource,
+        principle_ref,
+        action,
+        principle_authority,
+        effect,
+        statement_id,
+        account,
+        *conditions,
+    ) = (
+        json.loads(line[1:]) if line.startswith(_RECORD) else line.split(_UNIT)
+    )
+
+    return PolicyStatement(
+        statement_id,
+        principle_authority,
+        principle_ref,
+        action,
+        effect,
+        resource,
+        [Condition(*conditions[i : i + 3]) for i in range(0, len(conditions), 3)],
+        account or None,
+    )
+
+
+def _count(changes, counts: dict[str, int]):
+    """decode the statement of each change, counting the changes of each kind"""
+    for change, key in changes:
+        counts[change] += 1
+        yield change, _key_statement(key)
+
+
+def _iter_run(path: str) -> Iterator[bytes]:
+    """stream the keys of a sorted run from a memory map"""
+    with open(path, "rb") as run, mmap.mmap(
+        run.fileno(), 0, access=mmap.ACCESS_READ
+    ) as keys:
+        yield from iter(keys.readline, b"")
+
+
+def main(argv: list[str]):
+    """commandline entrypoint of the diff command"""
+
+    parser = argparse.ArgumentParser(
+        prog="AWS IAM Mapper diff",
+        description="streams the grants added and removed between two outputs",
+        usage="awsiammapper diff BEFORE AFTER -o OUTPUT",
+    )
+    parser.add_argument("before", help="earlier output")
+    parser.add_argument("after", help="later output")
+    parser.add_argument(
+        "-o", "--output", dest="output", required=True, help="csv of the changes"
+    )
+    parser.add_argument(
+        "-f",
+        "--format",
+        dest="input_format",
+        choices=["csv", "parquet", "index", "sqlite"],
+        default="csv",
+        help="output format of both inputs",
+    )
+    parser.add_argument(
+        "--run-size",
+        dest="run_size",
+        type=int,
+        default=RUN_SIZE,
+        help="rows sorted in memory before spilling to a temporary file",
+    )
+    args = parser.parse_args(argv)
+
+    diff(args.before, args.after, args.output, args.input_format, args.run_size)
@@ -0,0 +1,142 @@
+"""engine - concurrent orchestration of the service clients using asyncio"""
+
+import asyncio
+import functools
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from awsiammapper.metrics import default_metrics
+
+BATCH_SIZE = 500  # statements handed from a service to the output per batch
+QUEUE_SIZE = 8  # batches buffered per service before the service is paused
+POLL_INTERVAL = 0.1  # seconds between checks for a stopped run
+
+_DONE = object()
+
+
+class _Stopped(Exception):
+    """raised within worker threads once the run has been stopped"""
+
+
+def _put(channel, item, stop):
+    while True:
+        if stop.is_set():
+            raise _Stopped()
+        try:
+            channel.put(item, timeout=POLL_INTERVAL)
+            return
+        except queue.Full:
+            continue
+
+
+def _get(channel, stop, deadline):
+    while True:
+        if deadline.is_set():
+            try:
+                return channel.get_nowait()
+            except queue.Empty:
+                return _DONE
+        if stop.is_set():
+            raise _Stopped()
+        try:
+            return channel.get(timeout=POLL_INTERVAL)
+        except queue.Empty:
+            continue
+
+
+def _produce(get_service_client, service, workers, channel, stop):
+    """stream the statements of a service into its channel in batches"""
+    try:
+        client = get_service_client(service, workers)
+        with default_metrics.stage("list"):
+            resources = client.list()
+        default_metrics.inc("resources_total", len(resources), service=service)
+        batch = []
+        for statement in client.iter_policies(resources, exit_on_error=False):
+            batch.append(statement)
+            if len(batch) >= BATCH_SIZE:
+                _put(channel, batch, stop)
+                batch = []
+        if batch:
+            _put(channel, batch, stop)
+        _put(channel, _DONE, stop)
+    except _Stopped:
+        pass
+    except Exception as e:  # pylint: disable=broad-exception-caught
+        try:
+            _put(channel, e, stop)
+        except _Stopped:
+            pass
+
+
+def _drain(channels, stop, deadline):
+    """yield statements from each channel in service order
+
+    Once the deadline has passed only the batches already gathered are yielded,
+    ending the stream so the output is written up to the deadline. The time the
+    output spends consuming each batch is recorded as the write stage.
+    """
+    for channel in channels:
+        while (batch := _get(channel, stop, deadline)) is not _DONE:
+            if isinstance(batch, Exception):
+                raise batch
+            start = time.perf_counter()
+            yield from batch
+            default_metrics.observe(
+                "stage_seconds", time.perf_counter() - start, stage="write"
+            )
+
+
+async def map_services(get_service_client, services, output, workers=1, timeout=None):
+    """stream the policies of every service concurrently into a single output
+
+    Each service is listed and read within its own thread, handing statements
+    to the output through a bounded channel so memory is independent of the
+    number of statements. Statements are output in service order. On a deadline
+    the worker threads are stopped without waiting on requests which are still in
+    flight, the output is ended with the statements gathered so far and then
+    TimeoutError is raised. On cancellation the output is abandoned.
+
+    Keyword arguments:
+    get_service_client -- factory function returning a client for a service
+    services -- list of services to map
+    output -- function consuming an iterable of policy statements
+    workers -- number of concurrent requests used by each client
+    timeout -- overall deadline in seconds, None for no deadline
+    """
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=len(services) + 1)
+    stop = threading.Event()
+    deadline = threading.Event()
+    channels = [queue.Queue(maxsize=QUEUE_SIZE) for _ in services]
+
+    def call(func, *args):
+        return loop.run_in_executor(executor, functools.partial(func, *args))
+
+    for service, channel in zip(services, channels):
+        call(_produce, get_service_client, service, workers, channel, stop)
+    written = call(output, _drain(channels, stop, deadline))
+
+    try:
+        try:
+            await asyncio.wait_for(asyncio.shield(written), timeout)
+        except TimeoutError:
+            deadline.set()
+            stop.set()
+            await written
+            raise
+    finally:
+        stop.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def run(get_service_client, services, output, workers=1, timeout=None):
+    """blocking entry point to map_services, see map_services for arguments"""
+
+    asyncio.run(
+        map_services(
+            get_service_client, services, output, workers=workers, timeout=timeout
+        )
+    )
@@ -0,0 +1,172 @@
+"""evaluate - effective access of principals over mapped policy statements"""
+
+import functools
+from collections.abc import Iterable
+from typing import Literal, NamedTuple
+
+from awsiammapper.actions import compile_pattern
+from awsiammapper.actions import matches as action_matches
+from awsiammapper.policy import PolicyStatement
+
+Effect = Literal["Allow", "Deny", "ImplicitDeny"]
+
+MATCH_CACHE_SIZE = 1_000_000
+
+
+class Decision(NamedTuple):
+    """outcome of evaluating a principal, action and resource
+
+    conditional is True when a statement with conditions decided the outcome,
+    conditions are assumed to hold as they are not evaluated.
+    """
+
+    effect: Effect
+    conditional: bool = False
+
+
+class _Candidates(NamedTuple):
+    """statements of an effect applying to a principal and action
+
+    exact maps resource arns without wildcards to whether every matching
+    statement is conditional, patterns holds wildcard arns and their flag.
+    """
+
+    exact: dict[str, bool]
+    patterns: list[tuple[str, bool]]
+
+    def match(self, resource: str) -> bool | None:
+        """None when no statement matches, else whether the match is conditional"""
+        conditional = self.exact.get(resource)
+        if conditional is False:
+            return False
+
+        for pattern, pattern_conditional in self.patterns:
+            if resource_matches(pattern, resource):
+                if not pattern_conditional:
+                    return False
+                conditional = True
+
+        return conditional
+
+
+IMPLICIT_DENY = Decision("ImplicitDeny")
+
+
+class Evaluator:
+    """apply explicit deny precedence over a collection of policy statements
+
+    A query is denied by any matching Deny statement, otherwise allowed by any
+    matching Allow statement, otherwise implicitly denied. Statements are indexed
+    by principal and the statements matching a principal and action are memoized,
+    so batches repeating principals and actions only match resources.
+
+    Keyword arguments:
+    statements -- iterable of Policy Statements
+    """
+
+    def __init__(self, statements: Iterable[PolicyStatement]):
+        self._principals = {}
+        for statement in statements:
+            self._principals.setdefault(statement.principle_ref, set()).add(
+                (
+                    statement.effect,
+                    statement.action,
+                    statement.resource,
+                    bool(statement.conditions),
+                )
+            )
+        self._candidates = functools.lru_cache(maxsize=MATCH_CACHE_SIZE)(
+            self._match_candidates
+        )
+
+    def evaluate(self, principal: str, action: str, resource: str) -> Decision:
+        """effective access of a principal performing an action on a resource
+
+        Keyword arguments:
+        principal -- principal arn, such as a role arn
+        action -- action, such as s3:GetObject
+        resource -- resource arn
+        """
+        denies, allows = self._candidates(principal, action)
+
+        denied = denies.match(resource)
+        if denied is not None:
+            return Decision("Deny", denied)
+
+        allowed = allows.match(resource)
+        if allowed is not None:
+            return Decision("Allow", allowed)
+
+        return IMPLICIT_DENY
+
+    def evaluate_batch(self, queries: Iterable[tuple[str, str, str]]) -> list[Decision]:
+        """evaluate a batch of (principal, action, resource) queries, see evaluate"""
+        return [
+            self.evaluate(principal, action, resource)
+            for principal, action, resource in queries
+        ]
+
+    def evaluate_matrix(
+        self, principals: Iterable[str], resources: Iterable[str], action: str
+    ) -> dict[tuple[str, str], Decision]:
+        """evaluate an action for every principal and resource pair
+
+        Keyword arguments:
+        principals -- principal arns
+        resources -- resource arns
+        action -- action, such as s3:GetObject
+        """
+        resources = list(resources)
+
+        return {
+            (principal, resource): self.evaluate(principal, action, resource)
+            for principal in principals
+            for resource in resources
+        }
+
+    def _match_candidates(
+        self, principal: str, action: str
+    ) -> tuple[_Candidates, _Candidates]:
+        """deny and allow statements applying to a principal and action"""
+        denies, allows = _Candidates({}, []), _Candidates({}, [])
+
+        for ref in principal_refs(principal):
+            for effect, pattern, resource, conditional in self._principals.get(ref, ()):
+                if not action_matches(pattern, action):
+                    continue
+
+                candidates = denies if effect == "Deny" else allows
+                if "*" in resource or "?" in resource:
+                    candidates.patterns.append((resource, conditional))
+                else:
+                    candidates.exact[resource] = (
+                        candidates.exact.get(resource, True) and conditional
+                    )
+
+        denies.patterns.sort(key=lambda pattern: pattern[1])
+        allows.patterns.sort(key=lambda pattern: pattern[1])
+
+        return denies, allows
+
+
+def principal_refs(principal: str) -> list[str]:
+    """principal references of a statement which apply to a principal arn
+
+    Keyword arguments:
+    principal -- principal arn, such as a role arn
+    """
+    refs = [principal, "*"]
+    parts = principal.split(":")
+    if len(parts) > 4 and parts[4]:
+        refs += [parts[4], f"arn:aws:iam::{parts[4]}:root"]
+
+    return list(dict.fromkeys(refs))
+
+
+@functools.lru_cache(maxsize=MATCH_CACHE_SIZE)
+def resource_matches(pattern: str, resource: str) -> bool:
+    """whether an ARN pattern matches a resource, case sensitive and memoized"""
+    if "*" not in pattern and "?" not in pattern:
+        return pattern == resource
+
+    return compile_pattern(pattern, case_sensitive=True).fullmatch(resource) is not None
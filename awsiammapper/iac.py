@@ -0,0 +1,361 @@
+"""iac - offline clients reading policies from infrastructure as code
+
+Terraform state, Terraform plan json and CloudFormation json templates are
+scanned incrementally, decoding only the resources holding policy documents, so
+access is mapped without calling AWS.
+"""
+
+import dataclasses
+import json
+import logging
+import os
+import time
+from collections import defaultdict
+
+from awsiammapper.client import BaseClient, factor_identity_policy
+from awsiammapper.metrics import default_metrics
+from awsiammapper.parser import parse_policy
+from awsiammapper.policy import FactoredStatement, factor
+from awsiammapper.stream import JsonScanner
+from awsiammapper.writer import open_text
+
+# resource policy types and the attribute naming the resource they apply to
+TERRAFORM_RESOURCE_POLICIES = {
+    "aws_s3_bucket_policy": "bucket",
+    "aws_sqs_queue_policy": "queue_url",
+    "aws_sns_topic_policy": "arn",
+    "aws_kms_key": "arn",
+    "aws_ecr_repository_policy": "repository",
+    "aws_secretsmanager_secret_policy": "secret_arn",
+}
+TERRAFORM_IDENTITY_TYPES = {
+    "aws_iam_role",
+    "aws_iam_role_policy",
+    "aws_iam_role_policy_attachment",
+    "aws_iam_policy",
+}
+# types whose policy attribute is computed from a resource policy type in recent
+# provider versions, read only when no resource policy targets the resource
+TERRAFORM_INLINE_POLICIES = {"aws_s3_bucket": "bucket"}
+TERRAFORM_TYPES = {
+    *TERRAFORM_RESOURCE_POLICIES,
+    *TERRAFORM_INLINE_POLICIES,
+    *TERRAFORM_IDENTITY_TYPES,
+}
+
+# resource policy types, the property naming the resources and the policy property
+CLOUDFORMATION_RESOURCE_POLICIES = {
+    "AWS::S3::BucketPolicy": ("Bucket", "PolicyDocument"),
+    "AWS::SQS::QueuePolicy": ("Queues", "PolicyDocument"),
+    "AWS::SNS::TopicPolicy": ("Topics", "PolicyDocument"),
+    "AWS::KMS::Key": (None, "KeyPolicy"),
+}
+
+
+class Inventory:
+    """policy documents collected from a source, in any order
+
+    Identity policies are bound to their roles once every document is collected
+    as roles, their policies and attachments are separate resources. Resources
+    are named by their name or arn and roles by their arn, so a resource and a
+    role sharing a name are kept apart.
+    """
+
+    def __init__(self):
+        self.resource_policies = defaultdict(list)
+        self.inline_policies = {}
+        self.roles = {}
+        self.role_policies = defaultdict(list)
+        self.attachments = defaultdict(list)
+        self.managed_policies = {}
+
+    def add_role(self, name: str, arn: str | None):
+        """record a role, its arn is derived from the name when unknown"""
+        self.roles[name] = arn or f"arn:aws:iam:::role/{name}"
+
+    def statements(self) -> dict[str, list[FactoredStatement]]:
+        """return the factored statements of each resource and role arn
+
+        An inline policy is only read for a resource without a resource policy.
+        """
+        resource_policies = {
+            **{resource: [policy] for resource, policy in self.inline_policies.items()},
+            **self.resource_policies,
+        }
+        statements = {
+            resource: [
+                statement
+                for document in documents
+                for statement in factor_resource_policy(document)
+            ]
+            for resource, documents in resource_policies.items()
+        }
+
+        for role, role_arn in self.roles.items():
+            documents = self.role_policies[role] + [
+                self.managed_policies[policy]
+                for policy in self.attachments[role]
+                if policy in self.managed_policies
+            ]
+            statements[role_arn] = [
+                dataclasses.replace(statement, principals=(("AWS", role_arn),))
+                for document in documents
+                for statement in factor_identity_policy(document)
+            ]
+
+        return statements
+
+
+def factor_resource_policy(document) -> list[FactoredStatement]:
+    """factor the statements of a resource policy
+
+    Statements using NotPrincipal, NotAction or NotResource are not mapped.
+    """
+    statements = document["Statement"]
+    if isinstance(statements, dict):
+        statements = [statements]
+
+    return [
+        factor(statement)
+        for statement in statements
+        if "Principal" in statement
+        and "Action" in statement
+        and "Resource" in statement
+    ]
+
+
+class OfflineClient(BaseClient):
+    """client serving the policies of a source file rather than calling AWS
+
+    The source is scanned once, on the first call, and its factored statements
+    are kept for the run. Every file of a directory source is scanned in name
+    order, the bytes scanned and the scan time are recorded in the metrics.
+
+    Keyword arguments:
+    source -- file path or directory, files compressed when ending .gz or .zst
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self._statements = None
+
+    def list(self) -> list[str]:
+        """list - list the resources and roles holding policies within the source"""
+        return list(self._load())
+
+    def iter_factored(self, resources, exit_on_error=True):
+        """stream unexpanded policy statements for each specified resource"""
+        for _, statements in self.iter_by_resource(resources, exit_on_error):
+            yield from statements
+
+    def iter_by_resource(self, resources, exit_on_error=True):
+        """stream each specified resource with its unexpanded policy statements
+
+        Keyword arguments:
+        resources -- list of resources to retreive policies
+        exit_on_error --- default True, raise when a resource is not in the source
+        """
+        statements = self._load()
+        for resource in resources:
+            if resource not in statements:
+                logging.debug("resource [%s] is not within the source", resource)
+                if exit_on_error:
+                    raise KeyError("Resource not found")
+                yield resource, []
+                continue
+
+            yield resource, statements[resource]
+
+    def _load(self) -> dict:
+        if self._statements is None:
+            inventory = Inventory()
+            size = 0
+            start = time.perf_counter()
+            for path in _source_files(self.source):
+                size += os.path.getsize(path)
+                with open_text(path) as fp:
+                    self._scan(JsonScanner(fp), inventory)
+            self._statements = inventory.statements()
+            seconds = time.perf_counter() - start
+
+            default_metrics.inc("source_bytes_total", size, service=self.service)
+            default_metrics.observe("stage_seconds", seconds, stage="scan")
+            logging.debug(
+                "scanned %.1f MB of [%s] in %.2fs, %.1f MB/s",
+                size / 1e6,
+                self.source,
+                seconds,
+                size / 1e6 / seconds if seconds else 0,
+            )
+
+        return self._statements
+
+    def _scan(self, scanner: JsonScanner, inventory: Inventory):
+        raise NotImplementedError()
+
+
+def _source_files(source: str) -> list[str]:
+    if not os.path.isdir(source):
+        return [source]
+
+    return sorted(
+        os.path.join(directory, name)
+        for directory, _, names in os.walk(source)
+        for name in names
+        if not name.startswith(".")
+    )
+
+
+class TerraformClient(OfflineClient):
+    """read policies from Terraform state or `terraform show -json` plan output
+
+    Managed resources of state files and the planned values of resource changes
+    are mapped, data sources and destroyed resources are not.
+    """
+
+    service = "terraform"
+
+    def _scan(self, scanner: JsonScanner, inventory: Inventory):
+        for key in scanner.iter_object():
+            if key == "resources":
+                for _ in scanner.iter_array():
+                    resource = _read_terraform_resource(scanner, "instances")
+                    for instance in resource.get("instances") or []:
+                        _add_terraform_values(
+                            inventory, resource, instance.get("attributes")
+                        )
+            elif key == "resource_changes":
+                for _ in scanner.iter_array():
+                    resource = _read_terraform_resource(scanner, "change")
+                    change = resource.get("change") or {}
+                    if change.get("actions") != ["delete"]:
+                        _add_terraform_values(inventory, resource, change.get("after"))
+            else:
+                scanner.skip()
+
+
+def _read_terraform_resource(scanner: JsonScanner, values_key: str) -> dict:
+    """decode the type and name of a resource, its values only when of interest"""
+    resource = {}
+    for key in scanner.iter_object():
+        if key in ("type", "name", "mode"):
+            resource[key] = scanner.decode()
+        elif key == values_key and (
+            resource.get("type") in TERRAFORM_TYPES
+            and resource.get("mode", "managed") == "managed"
+        ):
+            resource[key] = scanner.decode()
+        else:
+            scanner.skip()
+
+    return resource
+
+
+def _add_terraform_values(inventory: Inventory, resource: dict, values: dict | None):
+    if not values:
+        return
+
+    resource_type = resource.get("type")
+    if resource_type in TERRAFORM_RESOURCE_POLICIES.keys() | TERRAFORM_INLINE_POLICIES:
+        _add_terraform_resource_policy(inventory, resource, values)
+    elif resource_type == "aws_iam_role":
+        inventory.add_role(values["name"], values.get("arn"))
+        for inline_policy in values.get("inline_policy") or []:
+            if policy := _terraform_policy(inline_policy.get("policy")):
+                inventory.role_policies[values["name"]].append(policy)
+        inventory.attachments[values["name"]] += values.get("managed_policy_arns") or []
+    elif resource_type == "aws_iam_role_policy":
+        if policy := _terraform_policy(values.get("policy")):
+            inventory.role_policies[values["role"]].append(policy)
+    elif resource_type == "aws_iam_role_policy_attachment":
+        inventory.attachments[values["role"]].append(values["policy_arn"])
+    elif resource_type == "aws_iam_policy" and values.get("arn"):
+        if policy := _terraform_policy(values.get("policy")):
+            inventory.managed_policies[values["arn"]] = policy
+
+
+def _add_terraform_resource_policy(inventory: Inventory, resource: dict, values):
+    resource_type = resource["type"]
+    policy = _terraform_policy(values.get("policy"))
+    if not policy:
+        return
+
+    if resource_type in TERRAFORM_INLINE_POLICIES:
+        name = values.get(TERRAFORM_INLINE_POLICIES[resource_type])
+        inventory.inline_policies[name or resource["name"]] = policy
+    else:
+        name = values.get(TERRAFORM_RESOURCE_POLICIES[resource_type])
+        inventory.resource_policies[name or resource["name"]].append(policy)
+
+
+def _terraform_policy(policy: str | None) -> dict | None:
+    """parse a policy attribute, absent or unknown until applied when None"""
+    return parse_policy(policy) if policy else None
+
+
+class CloudFormationClient(OfflineClient):
+    """read policies from a CloudFormation json template
+
+    Intrinsic functions are not evaluated, they are kept as readable references
+    such as the logical id of a Ref.
+    """
+
+    service = "cloudformation"
+
+    def _scan(self, scanner: JsonScanner, inventory: Inventory):
+        for logical_id, resource in scanner.iter_path(("Resources", "*")):
+            properties = _resolve(resource.get("Properties") or {})
+            resource_type = resource.get("Type")
+
+            if resource_type in CLOUDFORMATION_RESOURCE_POLICIES:
+                names_property, policy_property = CLOUDFORMATION_RESOURCE_POLICIES[
+                    resource_type
+                ]
+                document = properties.get(policy_property)
+                if document is None:
+                    continue
+                names = properties.get(names_property) or logical_id
+                for name in names if isinstance(names, list) else [names]:
+                    inventory.resource_policies[name].append(document)
+            elif resource_type == "AWS::IAM::Role":
+                name = properties.get("RoleName") or logical_id
+                inventory.add_role(name, None)
+                inventory.role_policies[name] += [
+                    policy["PolicyDocument"]
+                    for policy in properties.get("Policies") or []
+                ]
+                inventory.attachments[name] += properties.get("ManagedPolicyArns") or []
+            elif resource_type in ("AWS::IAM::Policy", "AWS::IAM::ManagedPolicy"):
+                inventory.managed_policies[logical_id] = properties["PolicyDocument"]
+                for role in properties.get("Roles") or []:
+                    inventory.attachments[role].append(logical_id)
+
+
+_INTRINSICS = {
+    "Ref": lambda argument: argument,
+    "Fn::GetAtt": lambda argument: (
+        ".".join(argument) if isinstance(argument, list) else argument
+    ),
+    "Fn::Sub": lambda argument: argument if isinstance(argument, str) else argument[0],
+    "Fn::Join": lambda argument: argument[0].join(
+        str(_resolve(item)) for item in argument[1]
+    ),
+}
+
+
+def _resolve(value):
+    """replace intrinsic functions with a readable reference"""
+    if isinstance(value, list):
+        return [_resolve(item) for item in value]
+
+    if not isinstance(value, dict):
+        return value
+
+    if len(value) == 1:
+        ((function, argument),) = value.items()
+        if function in _INTRINSICS:
+            return _INTRINSICS[function](argument)
+        if function.startswith("Fn::"):
+            return f"{function}({json.dumps(_resolve(argument), sort_keys=True)})"
+
+    return {key: _resolve(item) for key, item in value.items()}
@@ -0,0 +1,153 @@
+"""journal - write ahead journal of completed resources to resume interrupted runs"""
+
+import logging
+import sqlite3
+import threading
+import time
+
+from awsiammapper.client import BaseClient
+from awsiammapper.policy import FactoredStatement, dump_statements, load_statements
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS journal (
+    service TEXT NOT NULL,
+    resource TEXT NOT NULL,
+    statements BLOB NOT NULL,
+    completed_at REAL NOT NULL,
+    PRIMARY KEY (service, resource)
+)
+"""
+
+
+class Journal:
+    """SQLite journal of the statements of each resource completed within a run
+
+    Each resource is committed as soon as its statements are fetched, so a run
+    interrupted by a crash, throttling or a timeout is resumed without fetching
+    the completed resources again. Statements are journaled unexpanded, they
+    flatten into the same rows on replay. The journal may be shared between
+    threads.
+
+    Keyword arguments:
+    path -- SQLite database file, created when it does not exist
+    resume -- keep the resources of a previous run, otherwise the journal is reset
+    """
+
+    def __init__(self, path: str, resume: bool = False):
+        self.replayed = 0
+        self.recorded = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(_SCHEMA)
+        if not resume:
+            self._connection.execute("DELETE FROM journal")
+        self._connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def completed(self, service: str) -> dict[str, list[FactoredStatement]]:
+        """return the statements of each completed resource of a service"""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT resource, statements FROM journal WHERE service = ?",
+                (service,),
+            ).fetchall()
+
+        return {resource: load_statements(statements) for resource, statements in rows}
+
+    def count_replayed(self, count: int) -> None:
+        """count resources served from the journal rather than fetched"""
+        with self._lock:
+            self.replayed += count
+
+    def record(
+        self, service: str, resource: str, statements: list[FactoredStatement]
+    ) -> None:
+        """commit the statements of a completed resource"""
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO journal VALUES (?, ?, ?, ?)",
+                (service, resource, dump_statements(statements), time.time()),
+            )
+            self._connection.commit()
+            self.recorded += 1
+
+    def close(self):
+        """close the journal"""
+        with self._lock:
+            self._connection.close()
+
+        logging.debug(
+            "journal replayed %d resources, recorded %d resources",
+            self.replayed,
+            self.recorded,
+        )
+
+
+class JournalClient(BaseClient):
+    """journal the resources of a client, replaying those already completed
+
+    Keyword arguments:
+    client -- client fetching the policies of resources
+    journal -- journal of completed resources
+    """
+
+    def __init__(self, client, journal: Journal):
+        self.client = client
+        self.journal = journal
+        self.service = getattr(client, "service", "")
+
+    def list(self) -> list[str]:
+        """list - list the resources of the client"""
+        return self.client.list()
+
+    def iter_factored(self, resources, exit_on_error=True):
+        """iter_factored - stream the unexpanded policy statements of each resource
+
+        Completed resources are replayed from the journal first, the remaining
+        resources are fetched and journaled as each completes.
+        """
+        for _, statements in self.iter_by_resource(resources, exit_on_error):
+            yield from statements
+
+    def iter_by_resource(self, resources, exit_on_error=True):
+        """iter_by_resource - stream each resource with its unexpanded statements
+
+        Resources yielded without statements, such as buckets without a policy,
+        are journaled empty. Resources the client skips on error are not
+        journaled, so they are fetched again on resume.
+        """
+        resources = list(resources)
+        completed = self.journal.completed(self.service)
+        pending = [resource for resource in resources if resource not in completed]
+        self.journal.count_replayed(len(resources) - len(pending))
+
+        for resource in resources:
+            if resource in completed:
+                yield resource, completed[resource]
+
+        for resource, statements in self.client.iter_by_resource(
+            pending, exit_on_error
+        ):
+            self.journal.record(self.service, resource, statements)
+            yield resource, statements
+
+
+def journaled(get_service_client, journal: Journal):
+    """wrap a client factory so each client journals its completed resources
+
+    Keyword arguments:
+    get_service_client -- factory function returning a client for a service
+    journal -- journal of completed resources
+    """
+
+    def get_journal_client(*args, **kwargs):
+        return JournalClient(get_service_client(*args, **kwargs), journal)
+
+    return get_journal_client
@@ -1,34 +1,190 @@
 """Service module defining the application logic dependant on the interfaces and clients"""
 
+import contextlib
+import dataclasses
 import functools
+import sys
 
-from awsiammapper import config
+from awsiammapper import accounts, actions, config, engine, metrics, shard
 from awsiammapper.client import get_client
-from awsiammapper.writer import write_csv
+from awsiammapper.metrics import default_metrics
+from awsiammapper.parser import default_parser
+from awsiammapper.scheduler import default_scheduler
+from awsiammapper.template import default_templates
 
+LAMBDA_OUTPUT_MARGIN = 30  # seconds reserved to end the output at the deadline
 
-def _map(get_service_client, output, app_config):
 
-    policies = []
+def _map(get_service_client, get_output, app_config):
 
-    for service in app_config.services:
-        client = get_service_client(service)
-        policies += client.get_policies(client.list())
+    default_metrics.clear()
+    try:
+        with contextlib.ExitStack() as stack:
+            if app_config.profile:
+                stack.enter_context(metrics.profile(app_config.profile))
+            with default_metrics.stage("run"):
+                _run(get_service_client, get_output, app_config)
+    finally:
+        default_parser.log_stats()
+        default_templates.log_stats()
+        default_metrics.log_summary()
+        if app_config.metrics:
+            default_metrics.export(app_config.metrics)
 
-    output(policies, app_config.file_path)
 
+def _run(get_service_client, get_output, app_config):
 
-map_iam = functools.partial(_map, get_client, write_csv)
+    output = get_output(app_config.output_format)
+    if app_config.expand_actions:
+        output = _expand_actions(output)
+
+    default_scheduler.configure(rate=app_config.rate_limit)
+
+    if app_config.resume and not app_config.journal:
+        raise ValueError("resume requires the journal of the interrupted run")
+
+    if app_config.snapshot and "iam" in app_config.services:
+        raise ValueError("snapshot is not supported by the iam service")
+
+    if app_config.roles and (
+        app_config.snapshot or app_config.journal or app_config.source
+    ):
+        raise ValueError("roles cannot be combined with snapshot, journal or source")
+
+    if app_config.source:
+        get_service_client = functools.partial(
+            get_service_client, source=app_config.source
+        )
+
+    shard_index, shard_count = app_config.shard_index, app_config.shard_count
+    shard.check_shard(shard_index, shard_count)
+    file_path = app_config.file_path
+    if shard_count > 1:
+        file_path = shard.partial_path(file_path, shard_index, shard_count)
+        get_service_client = shard.sharded(get_service_client, shard_index, shard_count)
+
+    if app_config.roles:
+        fan_out = accounts.AccountsClient(
+            [
+                role
+                for role in app_config.roles
+                if shard.in_shard(role, shard_index, shard_count)
+            ],
+            app_config.regions or [None],
+            app_config.services,
+            workers=app_config.workers,
+            processes=app_config.processes,
+            rate_limit=app_config.rate_limit,
+        )
+        engine.run(
+            lambda service, workers: fan_out,
+            [fan_out.service],
+            functools.partial(output, fp=file_path),
+            timeout=app_config.timeout,
+        )
+        return
+
+    with contextlib.ExitStack() as stack:
+        if app_config.snapshot:
+            # pylint: disable-next=import-outside-toplevel
+            from awsiammapper.snapshot import SnapshotStore
+
+            store = stack.enter_context(
+                SnapshotStore(app_config.snapshot, app_config.snapshot_ttl)
+            )
+            get_service_client = functools.partial(get_service_client, snapshot=store)
+
+        if app_config.journal:
+            # pylint: disable-next=import-outside-toplevel
+            from awsiammapper.journal import Journal, journaled
+
+            journal = stack.enter_context(
+                Journal(app_config.journal, app_config.resume)
+            )
+            get_service_client = journaled(get_service_client, journal)
+
+        engine.run(
+            get_service_client,
+            app_config.services,
+            functools.partial(output, fp=file_path),
+            workers=app_config.workers,
+            timeout=app_config.timeout,
+        )
+
+
+def _expand_actions(output):
+    def expanded_output(statements, fp):
+        return output(actions.expand_statements(statements), fp)
+
+    return expanded_output
+
+
+def _get_writer(output_format):
+    """import the writers on first use, see writer.get_writer"""
+    # pylint: disable-next=import-outside-toplevel
+    from awsiammapper.writer import get_writer
+
+    return get_writer(output_format)
+
+
+map_iam = functools.partial(_map, get_client, _get_writer)
+
+
+def _lambda_timeout(app_config, context):
+    if context is None:
+        return app_config
+
+    remaining = context.get_remaining_time_in_millis() / 1000 - LAMBDA_OUTPUT_MARGIN
+    timeout = (
+        remaining if app_config.timeout is None else min(app_config.timeout, remaining)
+    )
+
+    return dataclasses.replace(app_config, timeout=max(timeout, 0))
+
+
+def _lambda_shard(app_config, event):
+    if not isinstance(event, dict) or "shard_index" not in event:
+        return app_config
+
+    return dataclasses.replace(
+        app_config,
+        shard_index=int(event["shard_index"]),
+        shard_count=int(event.get("shard_count", app_config.shard_count)),
+    )
 
 
 def lambda_handler(event, context):
+    """AWS Lambda entrypoint
+
+    The shard is read from the environment, or from the shard_index and
+    shard_count of the event when invoked once per shard by a fan out.
+    """
+
+    map_iam(_lambda_timeout(_lambda_shard(config.from_env(), event), context))
+
+
+def merge_handler(event, context):
     # pylint: disable=unused-argument
-    """AWS Lambda entrypoint"""
+    """AWS Lambda entrypoint combining the partial outputs of a sharded run"""
 
-    map_iam(config.from_env())
+    app_config = _lambda_shard(config.from_env(), event)
+    shard.merge(app_config.file_path, app_config.shard_count, app_config.output_format)
 
 
 def main():
-    """commandline entrypoint"""
+    """commandline entrypoint, `diff` compares two outputs rather than mapping"""
+
+    if sys.argv[1:2] == ["diff"]:
+        # pylint: disable-next=import-outside-toplevel
+        from awsiammapper import diff
+
+        diff.main(sys.argv[2:])
+        return
 
-    map_iam(config.from_cli())
+    app_config = config.from_cli()
+    if app_config.merge:
+        shard.merge(
+            app_config.file_path, app_config.shard_count, app_config.output_format
+        )
+    else:
+        map_iam(app_config)
@@ -0,0 +1,305 @@
+"""metrics - per stage instrumentation of a run with JSON and Prometheus export"""
+
+import contextlib
+import cProfile
+import json
+import logging
+import sys
+import threading
+import time
+from bisect import bisect_left
+from dataclasses import dataclass, field
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - unavailable on windows
+    resource = None
+
+LATENCY_BUCKETS = (
+    0.0001,
+    0.0005,
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+THROTTLE_CODES = {
+    "Throttling",
+    "ThrottlingException",
+    "ThrottledException",
+    "RequestThrottled",
+    "RequestThrottledException",
+    "RequestLimitExceeded",
+    "TooManyRequestsException",
+    "SlowDown",
+    "ProvisionedThroughputExceededException",
+}
+PREFIX = "awsiammapper"
+
+
+@dataclass
+class Histogram:
+    """cumulative latency histogram in seconds"""
+
+    buckets: tuple[float, ...] = LATENCY_BUCKETS
+    counts: list[int] = field(default_factory=lambda: [0] * (len(LATENCY_BUCKETS) + 1))
+    count: int = 0
+    sum: float = 0.0
+
+    def observe(self, seconds: float):
+        """record an observation"""
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def cumulative(self) -> list[tuple[str, int]]:
+        """return the count of observations at or below each bucket bound"""
+        total = 0
+        result = []
+        for bound, count in zip((*map(str, self.buckets), "+Inf"), self.counts):
+            total += count
+            result.append((bound, total))
+
+        return result
+
+
+class Metrics:
+    """thread safe counters and histograms describing a run
+
+    Metrics are named without the awsiammapper prefix and labelled by keyword,
+    for example the latency of each stage is the stage_seconds histogram
+    labelled by stage.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: dict[tuple[str, tuple], float] = {}
+        self.histograms: dict[tuple[str, tuple], Histogram] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        """increment a counter
+
+        Keyword arguments:
+        name -- counter name
+        value -- amount to increment by
+        labels -- labels identifying the series
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name: str, seconds: float, **labels):
+        """record a latency observation
+
+        Keyword arguments:
+        name -- histogram name
+        seconds -- observed latency
+        labels -- labels identifying the series
+        """
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(seconds)
+
+    @contextlib.contextmanager
+    def stage(self, stage: str):
+        """time the enclosed block as an observation of a stage"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe("stage_seconds", time.perf_counter() - start, stage=stage)
+
+    def instrument(self, client):
+        """count and time the API calls, retries and throttles of a boto3 client
+
+        Keyword arguments:
+        client -- boto3 client
+        """
+        events = client.meta.events
+        events.register("before-call.*.*", self._before_call)
+        events.register("after-call.*.*", self._after_call)
+        events.register("needs-retry.*.*", self._needs_retry)
+
+        return client
+
+    @staticmethod
+    def _before_call(context=None, **kwargs):
+        # pylint: disable=unused-argument
+        if context is not None:
+            context["awsiammapper_start"] = time.perf_counter()
+
+    def _after_call(self, event_name, parsed=None, context=None, **kwargs):
+        # pylint: disable=unused-argument
+        labels = _operation_labels(event_name)
+        parsed = parsed or {}
+
+        self.inc("api_calls_total", **labels)
+        if "Error" in parsed:
+            self.inc("api_errors_total", **labels)
+        if retries := parsed.get("ResponseMetadata", {}).get("RetryAttempts"):
+            self.inc("api_retries_total", retries, **labels)
+        if context and "awsiammapper_start" in context:
+            self.observe(
+                "api_call_seconds",
+                time.perf_counter() - context["awsiammapper_start"],
+                **labels,
+            )
+
+    def _needs_retry(self, event_name, response=None, **kwargs):
+        # pylint: disable=unused-argument
+        if response is None:
+            return
+
+        code = response[1].get("Error", {}).get("Code")
+        if code in THROTTLE_CODES:
+            self.inc("api_throttles_total", **_operation_labels(event_name))
+
+    def clear(self):
+        """reset every counter and histogram"""
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def summary(self) -> dict:
+        """return the metrics as a json serialisable dict"""
+        with self._lock:
+            counters = list(self.counters.items())
+            histograms = list(self.histograms.items())
+
+        summary = {"counters": {}, "histograms": {}, "peak_rss_bytes": peak_rss()}
+        for (name, labels), value in sorted(counters):
+            summary["counters"].setdefault(name, {})[_label_key(labels)] = value
+        for (name, labels), histogram in sorted(histograms, key=lambda h: h[0]):
+            summary["histograms"].setdefault(name, {})[_label_key(labels)] = {
+                "count": histogram.count,
+                "sum": histogram.sum,
+                "buckets": dict(histogram.cumulative()),
+            }
+
+        return summary
+
+    def to_prometheus(self) -> str:
+        """return the metrics in the Prometheus text exposition format"""
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items(), key=lambda h: h[0])
+
+        lines = []
+        for name in dict.fromkeys(name for (name, _), _ in counters):
+            lines.append(f"# TYPE {PREFIX}_{name} counter")
+            lines += [
+                f"{PREFIX}_{name}{_label_text(labels)} {value}"
+                for (series, labels), value in counters
+                if series == name
+            ]
+        for name in dict.fromkeys(name for (name, _), _ in histograms):
+            lines.append(f"# TYPE {PREFIX}_{name} histogram")
+            for (series, labels), histogram in histograms:
+                if series != name:
+                    continue
+                lines += [
+                    f"{PREFIX}_{name}_bucket"
+                    f"{_label_text((*labels, ('le', bound)))} {count}"
+                    for bound, count in histogram.cumulative()
+                ]
+                lines.append(
+                    f"{PREFIX}_{name}_sum{_label_text(labels)} {histogram.sum}"
+                )
+                lines.append(
+                    f"{PREFIX}_{name}_count{_label_text(labels)} {histogram.count}"
+                )
+        lines += [
+            f"# TYPE {PREFIX}_peak_rss_bytes gauge",
+            f"{PREFIX}_peak_rss_bytes {peak_rss()}",
+        ]
+
+        return "\n".join(lines) + "\n"
+
+    def export(self, fp: str):
+        """write the json summary to fp.json and the prometheus text to fp.prom
+
+        Keyword arguments:
+        fp -- file path without extension
+        """
+        with open(f"{fp}.json", "w", encoding="utf-8") as summary_file:
+            json.dump(self.summary(), summary_file, indent=2)
+        with open(f"{fp}.prom", "w", encoding="utf-8") as prometheus_file:
+            prometheus_file.write(self.to_prometheus())
+
+    def log_summary(self):
+        """log the time spent in each stage at debug level"""
+        with self._lock:
+            stages = [
+                (dict(labels)["stage"], histogram)
+                for (name, labels), histogram in self.histograms.items()
+                if name == "stage_seconds"
+            ]
+
+        for stage, histogram in sorted(stages, key=lambda s: s[0]):
+            logging.debug(
+                "stage [%s] %d observations in %.3fs",
+                stage,
+                histogram.count,
+                histogram.sum,
+            )
+
+
+def _operation_labels(event_name: str) -> dict[str, str]:
+    _, service, operation = event_name.split(".", 2)
+    return {"service": service, "operation": operation}
+
+
+def _label_key(labels: tuple) -> str:
+    return ",".join(f"{key}={value}" for key, value in labels)
+
+
+def _label_text(labels: tuple) -> str:
+    if not labels:
+        return ""
+
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+def peak_rss() -> int | None:
+    """return the peak resident set size of the process and its children in bytes"""
+    if resource is None:
+        return None
+
+    # ru_maxrss is reported in kilobytes on linux and bytes on macos
+    scale = 1 if sys.platform == "darwin" else 1024
+
+    return scale * max(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+    )
+
+
+@contextlib.contextmanager
+def profile(fp: str):
+    """profile the enclosed block with cProfile, dumping the stats to fp
+
+    Keyword arguments:
+    fp -- file path the pstats are written to, read with python -m pstats
+    """
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(fp)
+
+
+default_metrics = Metrics()
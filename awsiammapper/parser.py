@@ -0,0 +1,103 @@
+"""parser - decodes policy documents with a content addressed parse cache"""
+
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from awsiammapper.metrics import default_metrics
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+DEFAULT_CACHE_SIZE = 4096
+
+
+@dataclass
+class ParseStats:
+    """counters describing the policy documents parsed within a run"""
+
+    documents: int = 0
+    cache_hits: int = 0
+    seconds: float = 0.0
+
+
+def _loads(text):
+    """decode json using orjson when installed, falling back to the stdlib"""
+    if orjson is not None:
+        return orjson.loads(text)  # pylint: disable=no-member
+
+    return json.loads(text)
+
+
+class PolicyParser:
+    """parse policy documents once per distinct content
+
+    Policy text is keyed on its sha256 digest, identical documents share a single
+    parsed result which must be treated as read only.
+    """
+
+    def __init__(self, loads=_loads, cache_size=DEFAULT_CACHE_SIZE):
+        self.loads = loads
+        self.cache_size = cache_size
+        self.stats = ParseStats()
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def parse(self, text: str | bytes) -> dict:
+        """parse a policy document, returning the cached result when seen before
+
+        Keyword arguments:
+        text -- json policy document
+        """
+        raw = text.encode("utf-8") if isinstance(text, str) else text
+        digest = hashlib.sha256(raw).digest()
+
+        with self._lock:
+            self.stats.documents += 1
+            if digest in self._cache:
+                self.stats.cache_hits += 1
+                default_metrics.inc("parse_cache_hits_total")
+                self._cache.move_to_end(digest)
+                return self._cache[digest]
+
+        start = time.perf_counter()
+        document = self.loads(raw)
+        elapsed = time.perf_counter() - start
+
+        default_metrics.observe("stage_seconds", elapsed, stage="parse")
+        with self._lock:
+            self.stats.seconds += elapsed
+            self._cache[digest] = document
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+        return document
+
+    def clear(self):
+        """empty the cache and reset the parse statistics"""
+        with self._lock:
+            self._cache.clear()
+            self.stats = ParseStats()
+
+    def log_stats(self):
+        """log the parse statistics at debug level"""
+        logging.debug(
+            "parsed %d policy documents (%d cached) in %.3fs",
+            self.stats.documents,
+            self.stats.cache_hits,
+            self.stats.seconds,
+        )
+
+
+default_parser = PolicyParser()
+
+
+def parse_policy(text: str | bytes) -> dict:
+    """parse a policy document with the shared default parser"""
+    return default_parser.parse(text)
@@ -1,9 +1,21 @@
 """manages the definition and creation of a standardised policy statement"""
 
+import marshal
+import sys
+from collections.abc import Iterator
 from dataclasses import dataclass
 
+STATEMENT_COLUMNS = (
+    "statement_id",
+    "principle_authority",
+    "principle_ref",
+    "action",
+    "effect",
+    "resource",
+)
 
-@dataclass(frozen=True)
+
+@dataclass(frozen=True, slots=True)
 class Condition:
     """AWS Policy statement Condition"""
 
@@ -12,9 +24,13 @@ class Condition:
     value: str
 
 
-@dataclass(frozen=True)
+@dataclass(frozen=True, slots=True)
 class PolicyStatement:
-    """Standardised resource policy statement"""
+    """Standardised resource policy statement
+
+    Slotted as flattening a policy creates a statement for every resource, action
+    and principal combination, see flattern for the interning of the fields.
+    """
 
     statement_id: str
     principle_authority: str
@@ -23,6 +39,66 @@ class PolicyStatement:
     effect: str
     resource: str
     conditions: list[Condition]
+    account: str | None = None
+
+
+@dataclass(frozen=True, slots=True)
+class FactoredStatement:
+    """AWS Policy statement with its resources, actions and principals unexpanded
+
+    Holds the factors of the cartesian product flattern would produce, the
+    number of rows is known without expanding and rows are created on iteration.
+    """
+
+    statement_id: str
+    effect: str
+    resources: tuple[str, ...]
+    actions: tuple[str, ...]
+    principals: tuple[tuple[str, str], ...]
+    conditions: list[Condition]
+
+    def __len__(self) -> int:
+        return len(self.resources) * len(self.actions) * len(self.principals)
+
+    def __iter__(self) -> Iterator[PolicyStatement]:
+        for resource in self.resources:
+            for action in self.actions:
+                for principle_authority, principle_ref in self.principals:
+                    yield PolicyStatement(
+                        self.statement_id,
+                        principle_authority,
+                        principle_ref,
+                        action,
+                        self.effect,
+                        resource,
+                        self.conditions,
+                    )
+
+
+def factor(aws_statement) -> FactoredStatement:
+    """parse an AWS Policy Statement into its unexpanded factors
+
+    Field values are interned so repeated values across statements and policy
+    documents share a single string.
+
+    Keyword arguments:
+    aws_statement -- AWS Policy statement
+    """
+
+    return FactoredStatement(
+        statement_id=_intern(aws_statement.get("Sid", "")),
+        effect=_intern(aws_statement["Effect"]),
+        resources=tuple(map(_intern, get_resources(aws_statement))),
+        actions=tuple(map(_intern, get_actions(aws_statement))),
+        principals=tuple(
+            (_intern(principle_authority), _intern(principle_ref))
+            for principle_authority, principle_refs in get_principals(
+                aws_statement
+            ).items()
+            for principle_ref in principle_refs
+        ),
+        conditions=get_conditions(aws_statement),
+    )
 
 
 def flattern(aws_statement) -> list[PolicyStatement]:
@@ -32,23 +108,11 @@ def flattern(aws_statement) -> list[PolicyStatement]:
     aws_statement -- AWS Policy statement
     """
 
-    conditions = get_conditions(aws_statement)
+    return list(factor(aws_statement))
 
-    return [
-        PolicyStatement(
-            statement_id=aws_statement["Sid"],
-            principle_authority=principle_authority,
-            principle_ref=principle_ref,
-            action=action,
-            effect=aws_statement["Effect"],
-            resource=resource,
-            conditions=conditions,
-        )
-        for resource in get_resources(aws_statement)
-        for action in get_actions(aws_statement)
-        for principle_authority, principle_refs in get_principals(aws_statement).items()
-        for principle_ref in principle_refs
-    ]
+
+def _intern(value):
+    return sys.intern(value) if isinstance(value, str) else value
 
 
 def get_resources(statement) -> list[str]:
@@ -102,8 +166,45 @@ def get_conditions(statement) -> list[Condition]:
         return []
 
     return [
-        Condition(key=key, operater=operater, value=val)
+        Condition(key=_intern(key), operater=_intern(operater), value=_intern(val))
         for operater, operater_val in statement["Condition"].items()
         for key, vals in operater_val.items()
-        for val in (vals if not isinstance(vals, str) else [vals])
+        for val in (vals if isinstance(vals, list) else [vals])
+    ]
+
+
+def dump_statements(statements: list[FactoredStatement]) -> bytes:
+    """encode factored statements with marshal, read back with load_statements"""
+    return marshal.dumps(
+        [
+            (
+                statement.statement_id,
+                statement.effect,
+                statement.resources,
+                statement.actions,
+                statement.principals,
+                [
+                    (condition.key, condition.operater, condition.value)
+                    for condition in statement.conditions
+                ],
+            )
+            for statement in statements
+        ]
+    )
+
+
+def load_statements(data: bytes) -> list[FactoredStatement]:
+    """decode factored statements encoded with dump_statements"""
+    return [
+        FactoredStatement(
+            statement_id,
+            effect,
+            resources,
+            actions,
+            principals,
+            [Condition(*condition) for condition in conditions],
+        )
+        for statement_id, effect, resources, actions, principals, conditions in (
+            marshal.loads(data)
+        )
     ]
@@ -0,0 +1,277 @@
+"""query - inverted indexes over mapped policy statements"""
+
+import base64
+import gzip
+import json
+import sys
+from array import array
+from collections.abc import Iterable
+
+from awsiammapper.actions import matches as action_matches
+from awsiammapper.evaluate import principal_refs, resource_matches
+from awsiammapper.policy import STATEMENT_COLUMNS, Condition, PolicyStatement
+
+INDEX_VERSION = 1
+POSTING_TYPE = "I"  # unsigned int row ids
+
+_FIELDS = (*STATEMENT_COLUMNS, "account")
+
+
+class StatementIndex:
+    """inverted indexes from principal, resource and action to statement rows
+
+    Postings are sorted arrays of integer row ids, queries intersect the postings
+    of each given field starting from the shortest. Wildcard resources are also
+    kept by the literal prefix before their first wildcard, so the resources
+    matching an arn are found from the prefixes of the arn.
+
+    Keyword arguments:
+    statements -- iterable of Policy Statements to index
+    """
+
+    def __init__(self, statements: Iterable[PolicyStatement] = ()):
+        self.statements = []
+        self.principals = {}
+        self.resources = {}
+        self.actions = {}
+        self.patterns = {}
+
+        for statement in statements:
+            self.add(statement)
+
+    def __len__(self) -> int:
+        return len(self.statements)
+
+    def add(self, statement: PolicyStatement) -> None:
+        """index a statement, appending it as the next row"""
+        row = len(self.statements)
+        self.statements.append(statement)
+        if statement.resource not in self.resources:
+            self._add_pattern(statement.resource)
+
+        for postings, key in (
+            (self.principals, statement.principle_ref),
+            (self.resources, statement.resource),
+            (self.actions, statement.action),
+        ):
+            if key not in postings:
+                postings[key] = array(POSTING_TYPE)
+            postings[key].append(row)
+
+    def lookup(self, principal=None, resource=None, action=None) -> list[int]:
+        """row ids of statements matching every given field exactly
+
+        Keyword arguments:
+        principal -- principal reference, such as a role arn
+        resource -- resource arn
+        action -- action, such as s3:GetObject
+        """
+        postings = [
+            index.get(key, array(POSTING_TYPE))
+            for index, key in (
+                (self.principals, principal),
+                (self.resources, resource),
+                (self.actions, action),
+            )
+            if key is not None
+        ]
+
+        if not postings:
+            return list(range(len(self.statements)))
+
+        postings.sort(key=len)
+        rows = set(postings[0])
+        for posting in postings[1:]:
+            if not rows:
+                break
+            rows.intersection_update(posting)
+
+        return sorted(rows)
+
+    def query(
+        self, principal=None, resource=None, action=None
+    ) -> list[PolicyStatement]:
+        """statements matching every given field exactly, see lookup"""
+        return [
+            self.statements[row]
+            for row in self.lookup(
+                principal=principal, resource=resource, action=action
+            )
+        ]
+
+    def who_can_access(self, resource: str, action: str | None = None) -> set[str]:
+        """principals allowed an action on a resource, any action when not given
+
+        Statements apply through wildcard resources and actions, found from the
+        resource postings. An Allow is only overridden by an unconditional Deny
+        applying to the principal and action, with the precedence of
+        evaluate.Evaluator. Conditions are assumed to hold, so principals behind
+        a conditional Deny are returned.
+
+        Keyword arguments:
+        resource -- resource arn
+        action -- action, such as s3:GetObject
+        """
+        allowed = {}
+        denies = {}
+        for row in self._resource_rows(resource):
+            statement = self.statements[row]
+            if action is not None and not action_matches(statement.action, action):
+                continue
+            if statement.effect == "Allow":
+                allowed.setdefault(statement.principle_ref, set()).add(
+                    action or statement.action
+                )
+            elif not statement.conditions:
+                denies.setdefault(statement.principle_ref, []).append(statement.action)
+
+        return {
+            principal
+            for principal, actions in allowed.items()
+            if any(
+                not any(
+                    action_matches(denied, allowed_action)
+                    for ref in principal_refs(principal)
+                    for denied in denies.get(ref, ())
+                )
+                for allowed_action in actions
+            )
+        }
+
+    def _resource_rows(self, resource: str) -> set[int]:
+        """row ids of statements whose resource is or matches a resource arn"""
+        rows = set(self.resources.get(resource, ()))
+        for end in range(len(resource) + 1):
+            for pattern in self.patterns.get(resource[:end], ()):
+                if pattern != resource and resource_matches(pattern, resource):
+                    rows.update(self.resources[pattern])
+
+        return rows
+
+    def _add_pattern(self, resource: str) -> None:
+        """keep a wildcard resource by the literal prefix before its wildcard"""
+        wildcard = min(
+            (i for i in (resource.find("*"), resource.find("?")) if i >= 0),
+            default=None,
+        )
+        if wildcard is not None:
+            self.patterns.setdefault(resource[:wildcard], []).append(resource)
+
+    def save(self, fp: str) -> None:
+        """serialize the statements and postings to a gzip compressed file
+
+        Keyword arguments:
+        fp -- file path to write the index to
+        """
+        document = {
+            "version": INDEX_VERSION,
+            "byteorder": sys.byteorder,
+            "statements": [
+                [getattr(statement, field) for field in _FIELDS]
+                + [
+                    [
+                        [condition.key, condition.operater, condition.value]
+                        for condition in statement.conditions
+                    ]
+                ]
+                for statement in self.statements
+            ],
+            "principals": _encode_postings(self.principals),
+            "resources": _encode_postings(self.resources),
+            "actions": _encode_postings(self.actions),
+        }
+
+        with gzip.open(fp, "wt", encoding="utf-8") as f:
+            json.dump(document, f, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, fp: str) -> "StatementIndex":
+        """read an index written by save
+
+        Keyword arguments:
+        fp -- file path to read the index from
+        """
+        with gzip.open(fp, "rt", encoding="utf-8") as f:
+            document = json.load(f)
+
+        if document["version"] != INDEX_VERSION:
+            raise ValueError(f"unsupported index version [{document['version']}]")
+
+        swap = document["byteorder"] != sys.byteorder
+        index = cls()
+        conditions = {}
+        index.statements = [
+            _decode_statement(row, conditions) for row in document["statements"]
+        ]
+        index.principals = _decode_postings(document["principals"], swap)
+        index.resources = _decode_postings(document["resources"], swap)
+        index.actions = _decode_postings(document["actions"], swap)
+        for resource in index.resources:
+            index._add_pattern(resource)  # pylint: disable=protected-access
+
+        return index
+
+
+def write_index(statements: Iterable[PolicyStatement], fp: str) -> None:
+    """output resource policy statements as a saved StatementIndex
+
+    Keyword arguments:
+    statements -- iterable of Policy Statements
+    fp -- file path you write the index to
+    """
+    StatementIndex(statements).save(fp)
+
+
+def read_index(fp: str) -> list[PolicyStatement]:
+    """return the statements of a saved StatementIndex, loaded whole
+
+    Keyword arguments:
+    fp -- file path of the index
+    """
+    return StatementIndex.load(fp).statements
+
+
+def merge_index(partials: list[str], fp: str) -> None:
+    """combine saved indexes into one, renumbering the rows of each in order
+
+    Keyword arguments:
+    partials -- file paths of the indexes to combine
+    fp -- file path you write the combined index to
+    """
+    index = StatementIndex()
+    for partial in partials:
+        for statement in StatementIndex.load(partial).statements:
+            index.add(statement)
+
+    index.save(fp)
+
+
+def _decode_statement(row: list, conditions: dict) -> PolicyStatement:
+    """decode a saved statement, sharing identical condition lists"""
+    *fields, account, condition_values = row
+    key = json.dumps(condition_values)
+    if key not in conditions:
+        conditions[key] = [Condition(*condition) for condition in condition_values]
+
+    return PolicyStatement(
+        *(sys.intern(field) for field in fields), conditions[key], account
+    )
+
+
+def _encode_postings(postings: dict[str, array]) -> dict[str, str]:
+    return {
+        key: base64.b64encode(posting.tobytes()).decode("ascii")
+        for key, posting in postings.items()
+    }
+
+
+def _decode_postings(encoded: dict[str, str], swap: bool) -> dict[str, array]:
+    postings = {}
+    for key, data in encoded.items():
+        posting = array(POSTING_TYPE)
+        posting.frombytes(base64.b64decode(data))
+        if swap:
+            posting.byteswap()
+        postings[key] = posting
+
+    return postings
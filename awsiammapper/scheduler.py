@@ -0,0 +1,223 @@
+"""scheduler - paces the AWS API calls of every client within a process
+
+Calls are admitted through a token bucket per service and operation and an
+adaptive limit on the calls in flight per service. The limit grows additively
+while calls succeed and halves when AWS throttles, so concurrency settles just
+under the account's API limits rather than oscillating between idle and
+throttled. Throttled attempts are retried by botocore with jittered backoff.
+"""
+
+import threading
+import time
+
+from awsiammapper.metrics import THROTTLE_CODES, default_metrics
+
+DEFAULT_MAX_CONCURRENCY = 64  # upper bound of the adaptive limit per service
+DECREASE_FACTOR = 0.5  # multiplier applied to the limit when throttled
+MAX_ATTEMPTS = 10  # attempts per call, retried with jittered exponential backoff
+
+_ADMITTED = "awsiammapper_admitted"  # request context keys set by the scheduler
+_THROTTLED = "awsiammapper_throttled"
+
+
+class TokenBucket:
+    # pylint: disable=too-few-public-methods
+    """requests per second budget, refilled continuously up to a burst
+
+    Tokens are reserved under the lock and waited for outside of it, so callers
+    are admitted in arrival order at the configured rate.
+
+    Keyword arguments:
+    rate -- tokens added per second
+    burst -- tokens held at most, defaults to one second of tokens
+    """
+
+    def __init__(self, rate: float, burst: float | None = None):
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1.0)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """take a token, returning the seconds waited for it"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+        if wait:
+            time.sleep(wait)
+
+        return wait
+
+
+class AdaptiveLimit:
+    """additive increase, multiplicative decrease limit of calls in flight
+
+    Each successful call raises the limit by one over the limit, so it grows by
+    one per round of calls. A throttle multiplies it by DECREASE_FACTOR, once
+    for the calls started before the decrease as they were throttled together.
+
+    Keyword arguments:
+    max_limit -- upper bound of the limit, also its initial value
+    """
+
+    def __init__(self, max_limit: int = DEFAULT_MAX_CONCURRENCY):
+        self.max_limit = max_limit
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self._decreased_at = 0.0
+        self._condition = threading.Condition()
+
+    def acquire(self) -> float:
+        """wait for a call to be admitted, returning the time it started"""
+        with self._condition:
+            while self.in_flight >= max(1, int(self.limit)):
+                self._condition.wait()
+            self.in_flight += 1
+
+            return time.monotonic()
+
+    def release(self, succeeded: bool) -> None:
+        """complete a call, raising the limit when it succeeded"""
+        with self._condition:
+            self.in_flight -= 1
+            if succeeded:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+    def decrease(self, started: float) -> bool:
+        """lower the limit for a throttled call, False when already lowered"""
+        with self._condition:
+            if started < self._decreased_at:
+                return False
+
+            self.limit = max(1.0, self.limit * DECREASE_FACTOR)
+            self._decreased_at = time.monotonic()
+
+            return True
+
+
+class Scheduler:
+    """shared pacing of the API calls of boto3 clients
+
+    Keyword arguments:
+    rate -- requests per second per service and operation, 0 for no budget
+    max_concurrency -- upper bound of the calls in flight per service
+    """
+
+    def __init__(
+        self, rate: float = 0.0, max_concurrency: int = DEFAULT_MAX_CONCURRENCY
+    ):
+        self.rate = rate
+        self.max_concurrency = max_concurrency
+        self._buckets: dict[tuple[str, str], TokenBucket] = {}
+        self._limits: dict[str, AdaptiveLimit] = {}
+        self._lock = threading.Lock()
+
+    def configure(self, rate: float = 0.0, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        """set the budget and concurrency bound, resetting the adapted limits
+
+        Limits adapted by earlier runs, such as warm Lambda invocations, are kept
+        while the configuration is unchanged.
+        """
+        with self._lock:
+            if (rate, max_concurrency) == (self.rate, self.max_concurrency):
+                return
+            self.rate = rate
+            self.max_concurrency = max_concurrency
+            self._buckets.clear()
+            self._limits.clear()
+
+    def attach(self, client):
+        """pace the API calls of a boto3 client
+
+        Keyword arguments:
+        client -- boto3 client
+        """
+        events = client.meta.events
+        events.register("before-call.*.*", self._before_call)
+        events.register("before-send.*.*", self._before_send)
+        events.register("needs-retry.*.*", self._needs_retry)
+        events.register("after-call.*.*", self._after_call)
+        events.register("after-call-error.*.*", self._after_call_error)
+
+        return client
+
+    def limit(self, service: str) -> AdaptiveLimit:
+        """return the adaptive limit of a service"""
+        with self._lock:
+            if service not in self._limits:
+                self._limits[service] = AdaptiveLimit(self.max_concurrency)
+            return self._limits[service]
+
+    def bucket(self, service: str, operation: str) -> TokenBucket | None:
+        """return the token bucket of an operation, None without a budget"""
+        if not self.rate:
+            return None
+
+        with self._lock:
+            if (service, operation) not in self._buckets:
+                self._buckets[service, operation] = TokenBucket(self.rate)
+            return self._buckets[service, operation]
+
+    def _before_call(self, event_name, context=None, **kwargs):
+        # pylint: disable=unused-argument
+        if context is None:
+            return
+
+        service, _ = _operation(event_name)
+        limit = self.limit(service)
+        requested = time.monotonic()
+        context[_ADMITTED] = (limit, limit.acquire())
+        default_metrics.observe(
+            "scheduler_wait_seconds", context[_ADMITTED][1] - requested, service=service
+        )
+
+    def _before_send(self, event_name, **kwargs):
+        # pylint: disable=unused-argument
+        service, operation = _operation(event_name)
+        if bucket := self.bucket(service, operation):
+            default_metrics.observe(
+                "scheduler_wait_seconds", bucket.acquire(), service=service
+            )
+
+    def _needs_retry(self, event_name, response=None, request_dict=None, **kwargs):
+        # pylint: disable=unused-argument
+        if response is None or (
+            response[1].get("Error", {}).get("Code") not in THROTTLE_CODES
+        ):
+            return
+
+        context = (request_dict or {}).get("context", {})
+        context[_THROTTLED] = True
+        if _ADMITTED in context:
+            limit, started = context[_ADMITTED]
+            if limit.decrease(started):
+                service, _ = _operation(event_name)
+                default_metrics.inc("scheduler_decreases_total", service=service)
+
+    def _after_call(self, context=None, **kwargs):
+        # pylint: disable=unused-argument
+        if context and _ADMITTED in context:
+            limit, _ = context.pop(_ADMITTED)
+            limit.release(not context.pop(_THROTTLED, False))
+
+    def _after_call_error(self, context=None, **kwargs):
+        # pylint: disable=unused-argument
+        if context and _ADMITTED in context:
+            limit, _ = context.pop(_ADMITTED)
+            limit.release(False)
+
+
+def _operation(event_name: str) -> tuple[str, str]:
+    _, service, operation = event_name.split(".", 2)
+    return service, operation
+
+
+default_scheduler = Scheduler()
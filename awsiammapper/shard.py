@@ -0,0 +1,119 @@
+"""shard - split a run into deterministic slices of resources and merge the outputs"""
+
+import os
+import zlib
+
+from awsiammapper.client import BaseClient
+
+
+def in_shard(resource: str, shard_index: int, shard_count: int) -> bool:
+    """return True when a resource belongs to the shard
+
+    Resources are assigned on the crc32 of their name, so every invocation
+    agrees on the slice without coordination.
+
+    Keyword arguments:
+    resource -- resource name or arn, such as a bucket name
+    shard_index -- zero based index of the shard
+    shard_count -- number of shards
+    """
+    return zlib.crc32(resource.encode("utf-8")) % shard_count == shard_index
+
+
+def check_shard(shard_index: int, shard_count: int) -> None:
+    """raise ValueError when the shard index is outside of the shard count"""
+    if shard_count < 1 or not 0 <= shard_index < shard_count:
+        raise ValueError(
+            f"shard index [{shard_index}] must be within shard count [{shard_count}]"
+        )
+
+
+def partial_path(fp: str, shard_index: int, shard_count: int) -> str:
+    """return the path of a shard's partial output, keeping the file extensions
+
+    For example mapping.csv.gz becomes mapping.part-0001-of-0004.csv.gz
+
+    Keyword arguments:
+    fp -- file path of the merged output
+    shard_index -- zero based index of the shard
+    shard_count -- number of shards
+    """
+    directory, name = os.path.split(fp)
+    stem, dot, extensions = name.partition(".")
+
+    return os.path.join(
+        directory,
+        f"{stem}.part-{shard_index:04d}-of-{shard_count:04d}{dot}{extensions}",
+    )
+
+
+class ShardClient(BaseClient):
+    """restrict a client to the resources within a shard
+
+    Keyword arguments:
+    client -- client listing every resource
+    shard_index -- zero based index of the shard
+    shard_count -- number of shards
+    """
+
+    def __init__(self, client, shard_index: int, shard_count: int):
+        self.client = client
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+        self.service = getattr(client, "service", "")
+
+    def list(self) -> list[str]:
+        """list - list the resources of the client within the shard"""
+        return [
+            resource
+            for resource in self.client.list()
+            if in_shard(resource, self.shard_index, self.shard_count)
+        ]
+
+    def iter_policies(self, resources, exit_on_error=True):
+        """iter_policies - stream the policies of each resource"""
+        return self.client.iter_policies(resources, exit_on_error)
+
+    def iter_factored(self, resources, exit_on_error=True):
+        """iter_factored - stream the unexpanded policy statements of each resource"""
+        return self.client.iter_factored(resources, exit_on_error)
+
+    def iter_by_resource(self, resources, exit_on_error=True):
+        """iter_by_resource - stream each resource with its unexpanded statements"""
+        return self.client.iter_by_resource(resources, exit_on_error)
+
+
+def sharded(get_service_client, shard_index: int, shard_count: int):
+    """wrap a client factory so each client only lists resources within the shard
+
+    Keyword arguments:
+    get_service_client -- factory function returning a client for a service
+    shard_index -- zero based index of the shard
+    shard_count -- number of shards
+    """
+
+    def get_shard_client(*args, **kwargs):
+        return ShardClient(
+            get_service_client(*args, **kwargs), shard_index, shard_count
+        )
+
+    return get_shard_client
+
+
+def merge(fp: str, shard_count: int, output_format: str = "csv") -> None:
+    """combine the partial output of every shard into fp
+
+    Every partial must exist, csv partials are aligned to the widest condition
+    and account columns.
+
+    Keyword arguments:
+    fp -- file path of the merged output
+    shard_count -- number of shards
+    output_format -- output format of the partials - [csv, parquet, index, sqlite]
+    """
+    # pylint: disable-next=import-outside-toplevel
+    from awsiammapper.writer import get_merger
+
+    get_merger(output_format)(
+        [partial_path(fp, i, shard_count) for i in range(shard_count)], fp
+    )
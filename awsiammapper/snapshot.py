@@ -0,0 +1,191 @@
+"""snapshot - persistent store of fetched policy documents for incremental runs"""
+
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+
+from awsiammapper.policy import FactoredStatement, dump_statements, load_statements
+
+COMMIT_INTERVAL = 100  # documents recorded between commits
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshot (
+    service TEXT NOT NULL,
+    resource TEXT NOT NULL,
+    policy TEXT,
+    policy_hash TEXT,
+    fetched_at REAL NOT NULL,
+    statements BLOB,
+    PRIMARY KEY (service, resource)
+)
+"""
+
+
+@dataclass
+class SnapshotStats:
+    """counters describing the use of the snapshot within a run"""
+
+    fresh: int = 0
+    unchanged: int = 0
+    changed: int = 0
+    reused: int = 0
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """last fetched policy document of a resource, policy is None when absent"""
+
+    policy: str | None
+    policy_hash: str | None
+    fetched_at: float
+
+
+def policy_hash(policy: str | None) -> str | None:
+    """sha256 hex digest of a policy document"""
+    return hashlib.sha256(policy.encode("utf-8")).hexdigest() if policy else None
+
+
+class SnapshotStore:
+    """SQLite store of the policy document last fetched for each resource
+
+    Resources fetched within the freshness ttl are served from the store rather
+    than re-requested. The factored statements of each document are stored
+    alongside it and reused while its hash is unchanged, so unchanged documents
+    are not parsed again by later runs. The store may be shared between threads.
+
+    Keyword arguments:
+    path -- SQLite database file, created when it does not exist
+    ttl -- seconds a fetched document is considered fresh
+    """
+
+    def __init__(self, path: str, ttl: float = 0):
+        self.ttl = ttl
+        self.stats = SnapshotStats()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(_SCHEMA)
+        columns = {
+            column[1]
+            for column in self._connection.execute("PRAGMA table_info(snapshot)")
+        }
+        if "statements" not in columns:
+            self._connection.execute("ALTER TABLE snapshot ADD COLUMN statements BLOB")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def get(self, service: str, resource: str) -> Snapshot | None:
+        """return the snapshot of a resource"""
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT policy, policy_hash, fetched_at FROM snapshot"
+                " WHERE service = ? AND resource = ?",
+                (service, resource),
+            ).fetchone()
+
+        return Snapshot(*row) if row else None
+
+    def get_fresh(self, service: str, resource: str) -> Snapshot | None:
+        """return the snapshot of a resource when fetched within the ttl"""
+        snapshot = self.get(service, resource)
+        if snapshot is None or snapshot.fetched_at < time.time() - self.ttl:
+            return None
+
+        with self._lock:
+            self.stats.fresh += 1
+
+        return snapshot
+
+    def put(self, service: str, resource: str, policy: str | None) -> bool:
+        """record a fetched policy document, returning True when it has changed"""
+        digest = policy_hash(policy)
+        previous = self.get(service, resource)
+        changed = previous is None or previous.policy_hash != digest
+
+        with self._lock:
+            if changed:
+                self.stats.changed += 1
+            else:
+                self.stats.unchanged += 1
+
+            self._connection.execute(
+                "INSERT INTO snapshot VALUES (?, ?, ?, ?, ?, NULL)"
+                " ON CONFLICT (service, resource) DO UPDATE SET"
+                " policy = excluded.policy, fetched_at = excluded.fetched_at,"
+                " statements = CASE WHEN policy_hash IS excluded.policy_hash"
+                " THEN statements END, policy_hash = excluded.policy_hash",
+                (service, resource, policy, digest, time.time()),
+            )
+            self._count_pending()
+
+        return changed
+
+    def get_statements(
+        self, service: str, resource: str, policy: str
+    ) -> list[FactoredStatement] | None:
+        """return the stored statements of a resource factored from a document
+
+        Keyword arguments:
+        service -- service of the resource
+        resource -- name of the resource
+        policy -- policy document the statements were factored from
+        """
+        digest = policy_hash(policy)
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT statements FROM snapshot"
+                " WHERE service = ? AND resource = ? AND policy_hash = ?",
+                (service, resource, digest),
+            ).fetchone()
+            if row is None or row[0] is None:
+                return None
+            self.stats.reused += 1
+
+        return load_statements(row[0])
+
+    def put_statements(
+        self,
+        service: str,
+        resource: str,
+        policy: str,
+        statements: list[FactoredStatement],
+    ) -> None:
+        """store the statements factored from the current document of a resource"""
+        digest = policy_hash(policy)
+        with self._lock:
+            self._connection.execute(
+                "UPDATE snapshot SET statements = ?"
+                " WHERE service = ? AND resource = ? AND policy_hash = ?",
+                (dump_statements(statements), service, resource, digest),
+            )
+            self._count_pending()
+
+    def _count_pending(self):
+        """commit once COMMIT_INTERVAL changes are pending, called under the lock"""
+        self._pending += 1
+        if self._pending >= COMMIT_INTERVAL:
+            self._connection.commit()
+            self._pending = 0
+
+    def close(self):
+        """commit outstanding documents and close the store"""
+        with self._lock:
+            self._connection.commit()
+            self._connection.close()
+
+        logging.debug(
+            "snapshot served %d fresh documents, fetched %d unchanged, %d changed,"
+            " reused the statements of %d",
+            self.stats.fresh,
+            self.stats.unchanged,
+            self.stats.changed,
+            self.stats.reused,
+        )
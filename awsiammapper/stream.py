@@ -0,0 +1,198 @@
+"""stream - incremental scanning of large json documents
+
+Documents are read in chunks and walked member by member, values of interest are
+decoded on their own while everything else is skipped without being decoded, so
+memory is bounded by the largest decoded value rather than the document.
+"""
+
+import json
+import re
+
+CHUNK_SIZE = 1024 * 1024  # characters read from the file at a time
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_STRING = re.compile(r'"[^"\\]*(?:\\.[^"\\]*)*"', re.DOTALL)
+_SKIP = re.compile(r'(?:[^"\[\]{}]+|"[^"\\]*(?:\\.[^"\\]*)*")*', re.DOTALL)
+_SCALAR_END = re.compile(r"[,\]}\s]")
+
+
+class JsonScanner:
+    """pull based scanner over a json text file
+
+    Containers are iterated with iter_object and iter_array, which pause with the
+    scanner positioned at each member value. The caller must consume every value
+    with decode, skip or by iterating it before advancing to the next member.
+
+    Keyword arguments:
+    fp -- text file object
+    chunk_size -- characters read from the file at a time
+    """
+
+    def __init__(self, fp, chunk_size=CHUNK_SIZE):
+        self._file = fp
+        self._chunk_size = chunk_size
+        self._buffer = ""
+        self._pos = 0
+        self._keep = None  # start of a value being captured, kept across reads
+        self._eof = False
+
+    def _fill(self) -> bool:
+        """read the next chunk, dropping text before the position or capture"""
+        if self._eof:
+            return False
+
+        chunk = self._file.read(self._chunk_size)
+        start = self._pos if self._keep is None else self._keep
+        self._buffer = self._buffer[start:] + chunk
+        self._pos -= start
+        if self._keep is not None:
+            self._keep = 0
+        self._eof = not chunk
+
+        return bool(chunk)
+
+    def _peek(self) -> str:
+        while True:
+            self._pos = _WHITESPACE.match(self._buffer, self._pos).end()
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ""
+
+    def _expect(self, char: str):
+        found = self._peek()
+        if found != char:
+            raise ValueError(f"expected [{char}] but found [{found}]")
+        self._pos += 1
+
+    def _match(self, pattern):
+        while True:
+            match = pattern.match(self._buffer, self._pos)
+            if match and match.end() < len(self._buffer):
+                return match
+            if not self._fill():
+                if match is None:
+                    raise ValueError("unexpected end of json document")
+                return match
+
+    def _read_string(self) -> str:
+        self._peek()
+        match = self._match(_STRING)
+        self._pos = match.end()
+        text = match.group()
+
+        return json.loads(text) if "\\" in text else text[1:-1]
+
+    def iter_object(self):
+        """iterate the keys of the object at the position, pausing at each value"""
+        self._expect("{")
+        if self._peek() == "}":
+            self._pos += 1
+            return
+
+        while True:
+            key = self._read_string()
+            self._expect(":")
+            yield key
+            if self._peek() == ",":
+                self._pos += 1
+                continue
+            self._expect("}")
+            return
+
+    def iter_array(self):
+        """iterate the indexes of the array at the position, pausing at each value"""
+        self._expect("[")
+        if self._peek() == "]":
+            self._pos += 1
+            return
+
+        index = 0
+        while True:
+            yield index
+            index += 1
+            if self._peek() == ",":
+                self._pos += 1
+                continue
+            self._expect("]")
+            return
+
+    def skip(self):
+        """advance past the value at the position without decoding it"""
+        char = self._peek()
+        if char == '"':
+            self._pos = self._match(_STRING).end()
+        elif char in "[{":
+            self._skip_container()
+        else:
+            while not (match := _SCALAR_END.search(self._buffer, self._pos)):
+                if not self._fill():
+                    self._pos = len(self._buffer)
+                    return
+            self._pos = match.start()
+
+    def _skip_container(self):
+        depth = 0
+        while True:
+            self._pos = _SKIP.match(self._buffer, self._pos).end()
+            if self._pos >= len(self._buffer):
+                if not self._fill():
+                    raise ValueError("unexpected end of json document")
+                continue
+
+            char = self._buffer[self._pos]
+            if char == '"':
+                # a string split across chunks, read on and match it again
+                if not self._fill():
+                    raise ValueError("unexpected end of json document")
+                continue
+
+            self._pos += 1
+            depth += 1 if char in "[{" else -1
+            if depth == 0:
+                return
+
+    def decode(self):
+        """decode and return the value at the position"""
+        return json.loads(self.raw())
+
+    def raw(self) -> str:
+        """return the json text of the value at the position without decoding it"""
+        self._peek()
+        self._keep = self._pos
+        try:
+            self.skip()
+            return self._buffer[self._keep : self._pos]
+        finally:
+            self._keep = None
+
+    def iter_path(self, path, decode=True):
+        """iterate the members at a path of keys, * matching every key or index
+
+        For example ("resources", "*") iterates each element of the top level
+        resources array. Yields the key or index of each member with its decoded
+        value, or positioned at the value when decode is False.
+
+        Keyword arguments:
+        path -- tuple of object keys, array indexes or *
+        decode -- decode each member, otherwise the caller consumes the value
+        """
+        char = self._peek()
+        if char == "{":
+            members = self.iter_object()
+        elif char == "[":
+            members = self.iter_array()
+        else:
+            self.skip()
+            return
+
+        head, rest = path[0], path[1:]
+        for key in members:
+            if head not in ("*", key):
+                self.skip()
+            elif rest:
+                yield from self.iter_path(rest, decode)
+            elif decode:
+                yield key, self.decode()
+            else:
+                yield key, None
@@ -0,0 +1,174 @@
+"""template - factors bucket policies once per distinct policy template
+
+Bucket policies generated from a shared template differ only in the bucket arn.
+The arn is substituted with a placeholder and the normalised document is keyed
+on its sha256 digest, so each template is parsed and factored once and its
+statements are rebound to the resources of every bucket sharing it.
+"""
+
+import hashlib
+import logging
+import sys
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+from awsiammapper.metrics import default_metrics
+from awsiammapper.parser import parse_policy
+from awsiammapper.policy import FactoredStatement, factor
+
+DEFAULT_CACHE_SIZE = 4096
+PLACEHOLDER = "arn:aws:s3:::awsiammapper-template-bucket"
+
+
+@dataclass
+class TemplateStats:
+    """counters describing the bucket policies factored within a run"""
+
+    documents: int = 0
+    cache_hits: int = 0
+    unsafe: int = 0
+
+
+@dataclass(frozen=True)
+class _Template:
+    """factored statements of a normalised document, flagging those to rebind"""
+
+    statements: tuple[FactoredStatement, ...] | None
+    rebind: tuple[bool, ...]
+
+
+_SEEN = _Template(None, ())  # marks a document seen once, without a template
+
+
+class PolicyTemplates:
+    """factor bucket policies once per distinct document after normalisation
+
+    A template is built on the second bucket sharing a document, so policies
+    seen once are factored as written without the cost of binding them. The
+    bucket arn is only substituted when it is safe to bind it back: the document
+    holds no json escapes or placeholder of its own, and the arn only appears
+    within the resources of its statements. Any other document is factored as
+    written.
+    """
+
+    def __init__(self, cache_size=DEFAULT_CACHE_SIZE):
+        self.cache_size = cache_size
+        self.stats = TemplateStats()
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def factor_bucket_policy(self, text: str, bucket: str) -> list[FactoredStatement]:
+        """factor the statements of a bucket policy, reusing a shared template
+
+        Keyword arguments:
+        text -- json bucket policy document
+        bucket -- name of the bucket the policy is attached to
+        """
+        arn = f"arn:aws:s3:::{bucket}"
+        if "\\" in text or PLACEHOLDER in text:
+            with self._lock:
+                self.stats.documents += 1
+                self.stats.unsafe += 1
+            return _factor(text)
+
+        normalised = text.replace(arn, PLACEHOLDER)
+        digest = hashlib.sha256(normalised.encode("utf-8")).digest()
+
+        with self._lock:
+            self.stats.documents += 1
+            template = self._cache.get(digest)
+            if template is None:
+                self._cache[digest] = _SEEN
+                if len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+            else:
+                self._cache.move_to_end(digest)
+
+        if template is None:
+            return _factor(text)
+
+        if template is _SEEN:
+            template = _build_template(normalised)
+            with self._lock:
+                self._cache[digest] = template
+
+        if template.statements is None:
+            with self._lock:
+                self.stats.unsafe += 1
+            return _factor(text)
+
+        with self._lock:
+            self.stats.cache_hits += 1
+        default_metrics.inc("template_cache_hits_total")
+
+        return [
+            _bind(statement, arn) if rebind else statement
+            for statement, rebind in zip(template.statements, template.rebind)
+        ]
+
+    def clear(self):
+        """empty the cache and reset the template statistics"""
+        with self._lock:
+            self._cache.clear()
+            self.stats = TemplateStats()
+
+    def log_stats(self):
+        """log the template statistics at debug level"""
+        logging.debug(
+            "factored %d bucket policies (%d from a shared template, %d unsafe)",
+            self.stats.documents,
+            self.stats.cache_hits,
+            self.stats.unsafe,
+        )
+
+
+def _factor(text: str) -> list[FactoredStatement]:
+    return [factor(statement) for statement in parse_policy(text)["Statement"]]
+
+
+def _build_template(normalised: str) -> _Template:
+    """factor a normalised document, without statements when it cannot be rebound
+
+    Without json escapes every placeholder of the text is within a single string
+    value, so the document is safe to rebind when the resources of its statements
+    hold every placeholder of the text.
+    """
+    statements = tuple(
+        factor(statement) for statement in parse_policy(normalised)["Statement"]
+    )
+    rebind = tuple(
+        sum(
+            resource.count(PLACEHOLDER)
+            for resource in statement.resources
+            if isinstance(resource, str)
+        )
+        for statement in statements
+    )
+
+    if sum(rebind) != normalised.count(PLACEHOLDER):
+        return _Template(None, ())
+
+    return _Template(statements, tuple(map(bool, rebind)))
+
+
+def _bind(statement: FactoredStatement, arn: str) -> FactoredStatement:
+    return FactoredStatement(
+        statement.statement_id,
+        statement.effect,
+        tuple(
+            sys.intern(resource.replace(PLACEHOLDER, arn))
+            for resource in statement.resources
+        ),
+        statement.actions,
+        statement.principals,
+        statement.conditions,
+    )
+
+
+default_templates = PolicyTemplates()
+
+
+def factor_bucket_policy(text: str, bucket: str) -> list[FactoredStatement]:
+    """factor a bucket policy with the shared default templates"""
+    return default_templates.factor_bucket_policy(text, bucket)
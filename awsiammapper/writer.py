@@ -1,60 +1,636 @@
 """Manages the output of policy statements into formats such as csv"""
 
+import contextlib
 import csv
+import gzip
+import itertools
+import json
+import marshal
+import os
+import sqlite3
+import tempfile
+from collections.abc import Iterable, Iterator
+from typing import Literal
 
-from awsiammapper.policy import PolicyStatement
+from awsiammapper.policy import STATEMENT_COLUMNS, Condition, PolicyStatement
 
+Format = Literal["csv", "parquet", "index", "sqlite"]
 
-def write_csv(statements: list[PolicyStatement], fp: str) -> None:
+ACCOUNT_COLUMN = 6  # position of the account column within a row
+BATCH_SIZE = 10_000  # rows handed to the csv writer per call
+BUFFER_SIZE = 1024 * 1024  # bytes buffered between writes to disk
+GZIP_LEVEL = 6  # gzip compression level, favouring throughput over the default 9
+ROW_GROUP_SIZE = 100_000  # statements written per parquet row group
+DICTIONARY_COLUMNS = [*STATEMENT_COLUMNS, "account"]
+TRANSACTION_SIZE = 100_000  # statements inserted per sqlite transaction
+
+_SQLITE_SCHEMA = f"""
+CREATE TABLE statements (
+    id INTEGER PRIMARY KEY,
+    {", ".join(f"{column} TEXT" for column in DICTIONARY_COLUMNS)}
+);
+CREATE TABLE conditions (
+    statement INTEGER NOT NULL REFERENCES statements (id),
+    key TEXT,
+    operator TEXT,
+    value TEXT
+);
+"""
+_SQLITE_INDEXES = """
+CREATE INDEX statements_principle_ref ON statements (principle_ref);
+CREATE INDEX statements_resource ON statements (resource);
+CREATE INDEX statements_action ON statements (action);
+CREATE INDEX conditions_statement ON conditions (statement);
+"""
+
+
+def write_csv(
+    statements: Iterable[PolicyStatement],
+    fp: str,
+    max_conditions: int | None = None,
+    accounts: bool = False,
+) -> None:
     """output resource policy statements as a structued csv with headers
 
+    Statements are consumed in a single pass. As the number of condition columns
+    is only known once every statement has been seen, rows are spooled to a
+    temporary file and copied behind the header afterwards, unless the number
+    of condition columns is declared up front with max_conditions. Rows are
+    written in batches, compressed when fp ends with .gz or .zst.
+
+    Keyword arguments:
+    statements -- iterable of Policy Statements
+    fp -- file path you write csv to
+    max_conditions -- optional cap on condition columns, writes without spooling
+    accounts -- include the account column, added when spooling if any
+    statement has an account
+    """
+    with open_text(fp, "w") as csvfile:
+        writer = csv.writer(csvfile)
+
+        if max_conditions is not None:
+            writer.writerow(_get_field_names(max_conditions, accounts))
+            _write_batches(
+                writer,
+                (
+                    _build_row(statement, max_conditions, accounts)
+                    for statement in statements
+                ),
+            )
+            return
+
+        with tempfile.TemporaryFile(buffering=BUFFER_SIZE) as spool_file:
+            max_conditions, has_accounts = _spool(statements, spool_file)
+            spool_file.seek(0)
+
+            accounts = accounts or has_accounts
+            fields = _get_field_names(max_conditions, accounts)
+            writer.writerow(fields)
+            for batch in _read_spool(spool_file):
+                writer.writerows(_pad_rows(batch, len(fields), accounts))
+
+
+def write_diff(
+    changes: Iterable[tuple[str, PolicyStatement]],
+    fp: str,
+    max_conditions: int,
+    accounts: bool = False,
+) -> None:
+    """output changed policy statements as a csv, preceded by a change column
+
+    The columns follow write_csv, written in a single pass as the number of
+    condition columns is declared up front.
+
     Keyword arguments:
-    statements -- Policy Statement
+    changes -- iterable of the change, such as added, and its Policy Statement
     fp -- file path you write csv to
+    max_conditions -- number of condition columns
+    accounts -- include the account column
     """
-    with open(fp, "w", newline="", encoding="utf-8") as csvfile:
-        writer = csv.DictWriter(
-            csvfile, fieldnames=_get_field_names(_get_max_conditions(statements))
+    with open_text(fp, "w") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(["change", *_get_field_names(max_conditions, accounts)])
+        _write_batches(
+            writer,
+            (
+                (change, *_build_row(statement, max_conditions, accounts))
+                for change, statement in changes
+            ),
         )
 
-        writer.writeheader()
-        for statement in statements:
-            writer.writerow(_build_record(statement))
 
+def open_text(fp: str, mode: str = "r"):
+    """open a text file, compressed with gzip or zstd based on its extension
+
+    Keyword arguments:
+    fp -- file path, ending .gz for gzip or .zst for zstd compression
+    mode -- r to read or w to write
+    """
+    if fp.endswith(".gz"):
+        return gzip.open(
+            fp, f"{mode}t", compresslevel=GZIP_LEVEL, newline="", encoding="utf-8"
+        )
+
+    if fp.endswith(".zst"):
+        try:
+            # pylint: disable=import-outside-toplevel
+            import zstandard
+        except ImportError as e:
+            raise ImportError(
+                "zstd compression requires zstandard, install awsiammapper[zstd]"
+            ) from e
 
-def _get_max_conditions(statements: list[PolicyStatement]):
-    return max((len(statement.conditions) for statement in statements))
+        return zstandard.open(fp, f"{mode}t", newline="", encoding="utf-8")
 
+    return open(fp, mode, newline="", encoding="utf-8", buffering=BUFFER_SIZE)
 
-def _build_record(statement: PolicyStatement) -> dict:
-    record = {
-        "statement_id": statement.statement_id,
-        "principle_authority": statement.principle_authority,
-        "principle_ref": statement.principle_ref,
-        "action": statement.action,
-        "effect": statement.effect,
-        "resource": statement.resource,
-    }
 
-    for i, condition in enumerate(statement.conditions):
-        record[f"key {i+1}"] = condition.key
-        record[f"operator {i+1}"] = condition.operater
-        record[f"value {i+1}"] = condition.value
+def _write_batches(writer, rows: Iterator[tuple]) -> None:
+    while batch := list(itertools.islice(rows, BATCH_SIZE)):
+        writer.writerows(batch)
+
+
+def _pad_rows(rows: list[tuple], width: int, accounts: bool) -> Iterator[tuple]:
+    for row in rows:
+        if not accounts:
+            row = row[:ACCOUNT_COLUMN] + row[ACCOUNT_COLUMN + 1 :]
+        if len(row) < width:
+            row += ("",) * (width - len(row))
+        yield row
+
+
+def _spool(statements: Iterable[PolicyStatement], spool_file) -> tuple[int, bool]:
+    """marshal batches of rows to the spool file, returning the column shape"""
+    max_conditions = 0
+    has_accounts = False
+    statements = iter(statements)
+    while batch := list(itertools.islice(statements, BATCH_SIZE)):
+        max_conditions = max(
+            max_conditions, *(len(statement.conditions) for statement in batch)
+        )
+        has_accounts = has_accounts or any(
+            statement.account is not None for statement in batch
+        )
+        data = marshal.dumps(
+            [_build_row(statement, account=True) for statement in batch]
+        )
+        spool_file.write(len(data).to_bytes(8, "little"))
+        spool_file.write(data)
+
+    return max_conditions, has_accounts
+
 
-    return record
+def _read_spool(spool_file) -> Iterator[list[tuple]]:
+    while size := spool_file.read(8):
+        yield marshal.loads(spool_file.read(int.from_bytes(size, "little")))
 
 
-def _get_field_names(max_conditions: int):
-    fields = [
-        "statement_id",
-        "principle_authority",
-        "principle_ref",
-        "action",
-        "effect",
-        "resource",
-    ]
+def _build_row(
+    statement: PolicyStatement, max_conditions: int | None = None, account=False
+) -> tuple:
+    conditions = statement.conditions
+    if max_conditions is not None and len(conditions) > max_conditions:
+        raise ValueError(
+            f"statement [{statement.statement_id}] has {len(conditions)}"
+            f" conditions exceeding the declared maximum of {max_conditions}"
+        )
+
+    row = (
+        statement.statement_id,
+        statement.principle_authority,
+        statement.principle_ref,
+        statement.action,
+        statement.effect,
+        statement.resource,
+    )
+
+    if account:
+        row += (statement.account or "",)
+
+    for condition in conditions:
+        row += (
+            condition.key,
+            condition.operater,
+            format_condition_value(condition.value),
+        )
+
+    if max_conditions is not None and len(conditions) < max_conditions:
+        row += ("",) * (3 * (max_conditions - len(conditions)))
+
+    return row
+
+
+def _get_field_names(max_conditions: int, account=False):
+    fields = list(STATEMENT_COLUMNS)
+
+    if account:
+        fields.append("account")
 
     for i in range(1, max_conditions + 1):
         fields += [f"key {i}", f"operator {i}", f"value {i}"]
 
     return fields
+
+
+def write_parquet(
+    statements: Iterable[PolicyStatement], fp: str, row_group_size=ROW_GROUP_SIZE
+) -> None:
+    """output resource policy statements as a parquet file
+
+    Statements are written incrementally one row group at a time with the
+    repetitive string columns dictionary encoded. Conditions are a nested list
+    column of key, operator and value structs. Requires the optional pyarrow
+    dependency, installed with the parquet extra.
+
+    Keyword arguments:
+    statements -- iterable of Policy Statements
+    fp -- file path you write parquet to
+    row_group_size -- number of statements per row group
+    """
+    pa, pq = _import_pyarrow()
+    schema = _parquet_schema(pa)
+
+    with pq.ParquetWriter(
+        fp, schema, use_dictionary=DICTIONARY_COLUMNS, compression="zstd"
+    ) as writer:
+        columns = _empty_columns(schema)
+        for statement in statements:
+            columns["statement_id"].append(statement.statement_id)
+            columns["principle_authority"].append(statement.principle_authority)
+            columns["principle_ref"].append(statement.principle_ref)
+            columns["action"].append(statement.action)
+            columns["effect"].append(statement.effect)
+            columns["resource"].append(statement.resource)
+            columns["account"].append(statement.account)
+            columns["conditions"].append(
+                [
+                    {
+                        "key": condition.key,
+                        "operator": condition.operater,
+                        "value": format_condition_value(condition.value),
+                    }
+                    for condition in statement.conditions
+                ]
+            )
+
+            if len(columns["statement_id"]) >= row_group_size:
+                writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+                columns = _empty_columns(schema)
+
+        if columns["statement_id"]:
+            writer.write_table(pa.Table.from_pydict(columns, schema=schema))
+
+
+def write_sqlite(
+    statements: Iterable[PolicyStatement],
+    fp: str,
+    transaction_size=TRANSACTION_SIZE,
+) -> None:
+    """output resource policy statements as a SQLite database
+
+    Statements and their conditions are written to related statements and
+    conditions tables in a single pass, inserted in batches within large
+    transactions. Indexes on principal, resource and action are built once
+    every statement is loaded. An existing file at fp is replaced.
+
+    Keyword arguments:
+    statements -- iterable of Policy Statements
+    fp -- file path you write the database to
+    transaction_size -- number of statements inserted per transaction
+    """
+    with _create_sqlite(fp) as connection:
+        statement_sql = (
+            f"INSERT INTO statements VALUES (?{', ?' * len(DICTIONARY_COLUMNS)})"
+        )
+        condition_sql = "INSERT INTO conditions VALUES (?, ?, ?, ?)"
+        rows = enumerate(statements, 1)
+
+        while batch := list(itertools.islice(rows, transaction_size)):
+            connection.executemany(
+                statement_sql,
+                (
+                    (
+                        row,
+                        statement.statement_id,
+                        statement.principle_authority,
+                        statement.principle_ref,
+                        statement.action,
+                        statement.effect,
+                        statement.resource,
+                        statement.account,
+                    )
+                    for row, statement in batch
+                ),
+            )
+            connection.executemany(
+                condition_sql,
+                (
+                    (
+                        row,
+                        condition.key,
+                        condition.operater,
+                        format_condition_value(condition.value),
+                    )
+                    for row, statement in batch
+                    for condition in statement.conditions
+                ),
+            )
+            connection.commit()
+
+        connection.executescript(_SQLITE_INDEXES)
+
+
+def _create_sqlite(fp: str):
+    """create an empty output database, without a rollback journal as it is new"""
+    if os.path.exists(fp):
+        os.remove(fp)
+
+    connection = sqlite3.connect(fp)
+    connection.execute("PRAGMA journal_mode=OFF")
+    connection.execute("PRAGMA synchronous=OFF")
+    connection.executescript(_SQLITE_SCHEMA)
+
+    return contextlib.closing(connection)
+
+
+def merge_csv(partials: list[str], fp: str) -> None:
+    """combine csv outputs into one, aligning their condition and account columns
+
+    Headers are read first to find the widest layout, rows are then streamed
+    from each partial in order and padded to it.
+
+    Keyword arguments:
+    partials -- file paths of the csv outputs to combine
+    fp -- file path you write the combined csv to
+    """
+    headers = []
+    for partial in partials:
+        with open_text(partial) as partial_file:
+            headers.append(next(csv.reader(partial_file), list(STATEMENT_COLUMNS)))
+
+    accounts = any("account" in header for header in headers)
+    fields = _get_field_names(
+        max(
+            (len(header) - ACCOUNT_COLUMN - ("account" in header)) // 3
+            for header in headers
+        ),
+        accounts,
+    )
+
+    with open_text(fp, "w") as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(fields)
+        for partial, header in zip(partials, headers):
+            with open_text(partial) as partial_file:
+                reader = csv.reader(partial_file)
+                next(reader, None)
+                _write_batches(
+                    writer,
+                    _align_rows(
+                        reader, len(fields), accounts and "account" not in header
+                    ),
+                )
+
+
+def _align_rows(rows, width: int, add_account: bool) -> Iterator[list]:
+    for row in rows:
+        if add_account:
+            row.insert(ACCOUNT_COLUMN, "")
+        if len(row) < width:
+            row += [""] * (width - len(row))
+        yield row
+
+
+def merge_parquet(partials: list[str], fp: str) -> None:
+    """combine parquet outputs into one, a row group at a time
+
+    Keyword arguments:
+    partials -- file paths of the parquet outputs to combine
+    fp -- file path you write the combined parquet to
+    """
+    pa, pq = _import_pyarrow()
+    schema = _parquet_schema(pa)
+
+    with pq.ParquetWriter(
+        fp, schema, use_dictionary=DICTIONARY_COLUMNS, compression="zstd"
+    ) as writer:
+        for partial in partials:
+            parquet_file = pq.ParquetFile(partial)
+            for i in range(parquet_file.num_row_groups):
+                writer.write_table(parquet_file.read_row_group(i).cast(schema))
+
+
+def merge_sqlite(partials: list[str], fp: str) -> None:
+    """combine SQLite outputs into one, renumbering the statements of each in order
+
+    Keyword arguments:
+    partials -- file paths of the SQLite outputs to combine
+    fp -- file path you write the combined database to
+    """
+    columns = ", ".join(DICTIONARY_COLUMNS)
+
+    with _create_sqlite(fp) as connection:
+        for partial in partials:
+            connection.execute("ATTACH DATABASE ? AS partial", (partial,))
+            (offset,) = connection.execute(
+                "SELECT coalesce(max(id), 0) FROM statements"
+            ).fetchone()
+            connection.execute(
+                f"INSERT INTO statements SELECT id + ?, {columns}"
+                " FROM partial.statements ORDER BY id",
+                (offset,),
+            )
+            connection.execute(
+                "INSERT INTO conditions SELECT statement + ?, key, operator, value"
+                " FROM partial.conditions ORDER BY rowid",
+                (offset,),
+            )
+            connection.commit()
+            connection.execute("DETACH DATABASE partial")
+
+        connection.executescript(_SQLITE_INDEXES)
+
+
+def read_csv(fp: str) -> Iterator[PolicyStatement]:
+    """stream the policy statements of a csv output
+
+    Keyword arguments:
+    fp -- file path of a csv written by write_csv, optionally compressed
+    """
+    with open_text(fp) as csvfile:
+        reader = csv.reader(csvfile)
+        header = next(reader, None)
+        if header is None:
+            return
+
+        accounts = "account" in header
+        conditions_at = ACCOUNT_COLUMN + accounts
+        for row in reader:
+            yield PolicyStatement(
+                *row[:ACCOUNT_COLUMN],
+                conditions=[
+                    Condition(*row[i : i + 3])
+                    for i in range(conditions_at, len(row) - 2, 3)
+                    if row[i]
+                ],
+                account=(row[ACCOUNT_COLUMN] or None) if accounts else None,
+            )
+
+
+def read_parquet(fp: str) -> Iterator[PolicyStatement]:
+    """stream the policy statements of a parquet output, a row group at a time
+
+    Keyword arguments:
+    fp -- file path of a parquet written by write_parquet
+    """
+    _, pq = _import_pyarrow()
+
+    parquet_file = pq.ParquetFile(fp)
+    for i in range(parquet_file.num_row_groups):
+        for row in parquet_file.read_row_group(i).to_pylist():
+            yield PolicyStatement(
+                *(row[column] for column in STATEMENT_COLUMNS),
+                conditions=[
+                    Condition(
+                        condition["key"], condition["operator"], condition["value"]
+                    )
+                    for condition in row["conditions"]
+                ],
+                account=row["account"],
+            )
+
+
+def read_sqlite(fp: str) -> Iterator[PolicyStatement]:
+    """stream the policy statements of a SQLite output in the order written
+
+    Statements and conditions are read with a cursor each, both ordered by
+    statement, and joined as they are streamed.
+
+    Keyword arguments:
+    fp -- file path of a database written by write_sqlite
+    """
+    with contextlib.closing(sqlite3.connect(fp)) as connection:
+        statements = connection.execute(
+            f"SELECT id, {', '.join(DICTIONARY_COLUMNS)} FROM statements ORDER BY id"
+        )
+        conditions = connection.execute(
+            "SELECT statement, key, operator, value FROM conditions"
+            " ORDER BY statement, rowid"
+        )
+        condition = next(conditions, None)
+
+        for row_id, *fields, account in statements:
+            statement_conditions = []
+            while condition is not None and condition[0] <= row_id:
+                if condition[0] == row_id:
+                    statement_conditions.append(Condition(*condition[1:]))
+                condition = next(conditions, None)
+
+            yield PolicyStatement(
+                *fields, conditions=statement_conditions, account=account
+            )
+
+
+def _import_pyarrow():
+    try:
+        # pylint: disable=import-outside-toplevel
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        raise ImportError(
+            "parquet output requires pyarrow, install awsiammapper[parquet]"
+        ) from e
+
+    return pyarrow, pyarrow.parquet
+
+
+def _parquet_schema(pa):
+    dictionary = pa.dictionary(pa.int32(), pa.string())
+
+    return pa.schema(
+        [(column, dictionary) for column in DICTIONARY_COLUMNS]
+        + [
+            (
+                "conditions",
+                pa.list_(
+                    pa.struct(
+                        [
+                            ("key", pa.string()),
+                            ("operator", pa.string()),
+                            ("value", pa.string()),
+                        ]
+                    )
+                ),
+            )
+        ]
+    )
+
+
+def _empty_columns(schema) -> dict[str, list]:
+    return {name: [] for name in schema.names}
+
+
+def format_condition_value(value) -> str:
+    """write a condition value as in the policy, json encoding non string values
+
+    Keyword arguments:
+    value -- condition value such as a string, boolean, number or null
+    """
+    return value if isinstance(value, str) else json.dumps(value)
+
+
+def get_writer(output_format: Format):
+    """Factory function for statement writers
+
+    Keyword Arguments:
+    output_format - an output format - [csv, parquet, index, sqlite]
+    """
+    # pylint: disable=import-outside-toplevel
+    from awsiammapper.query import write_index
+
+    writers = {
+        "csv": write_csv,
+        "parquet": write_parquet,
+        "index": write_index,
+        "sqlite": write_sqlite,
+    }
+
+    return writers[output_format]
+
+
+def get_reader(output_format: Format):
+    """Factory function for reading the statements of a writer's output
+
+    Keyword Arguments:
+    output_format - an output format - [csv, parquet, index, sqlite]
+    """
+    # pylint: disable=import-outside-toplevel
+    from awsiammapper.query import read_index
+
+    readers = {
+        "csv": read_csv,
+        "parquet": read_parquet,
+        "index": read_index,
+        "sqlite": read_sqlite,
+    }
+
+    return readers[output_format]
+
+
+def get_merger(output_format: Format):
+    """Factory function for combining the outputs of a writer
+
+    Keyword Arguments:
+    output_format - an output format - [csv, parquet, index, sqlite]
+    """
+    # pylint: disable=import-outside-toplevel
+    from awsiammapper.query import merge_index
+
+    mergers = {
+        "csv": merge_csv,
+        "parquet": merge_parquet,
+        "index": merge_index,
+        "sqlite": merge_sqlite,
+    }
+
+    return mergers[output_format]
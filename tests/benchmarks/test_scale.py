@@ -0,0 +1,163 @@
+"""scale benchmarks of each mapping stage against synthetic accounts
+
+Deselected by default, run with
+
+    pytest -m benchmark tests/benchmarks -s
+
+The number of buckets per run is set with AWSIAMMAPPER_BENCHMARK_BUCKETS as a
+comma separated list, defaulting to 10,1000. Throughput below the stored
+baseline by more than AWSIAMMAPPER_BENCHMARK_TOLERANCE (default 0.5) fails,
+set AWSIAMMAPPER_BENCHMARK_UPDATE=1 to record the current run as the baseline.
+"""
+
+import json
+import os
+import pathlib
+import time
+import tracemalloc
+
+import pytest
+
+from awsiammapper.client import S3Client
+from awsiammapper.template import default_templates
+from awsiammapper.writer import write_csv, write_sqlite
+from tests.synthetic import StubS3, generate_account
+
+BASELINE = pathlib.Path(__file__).parent / "baseline.json"
+BUCKETS = [
+    int(buckets)
+    for buckets in os.environ.get("AWSIAMMAPPER_BENCHMARK_BUCKETS", "10,1000").split(
+        ","
+    )
+]
+TOLERANCE = float(os.environ.get("AWSIAMMAPPER_BENCHMARK_TOLERANCE", "0.5"))
+UPDATE = os.environ.get("AWSIAMMAPPER_BENCHMARK_UPDATE") == "1"
+WORKERS = 8
+
+pytestmark = pytest.mark.benchmark
+
+
+def _measure(stage, items, func):
+    """run a stage, returning its result and throughput, latency and peak memory"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    size = items(result)
+    metrics = {
+        "items": size,
+        "seconds": round(seconds, 4),
+        "items_per_second": round(size / seconds, 1) if seconds else 0.0,
+        "peak_mib": round(peak / 2**20, 2),
+    }
+    print(f"\n{stage}: {metrics}")
+
+    return result, metrics
+
+
+def _check_baseline(key, results):
+    baselines = json.loads(BASELINE.read_text()) if BASELINE.exists() else {}
+
+    if UPDATE:
+        baselines[key] = {
+            stage: metrics["items_per_second"] for stage, metrics in results.items()
+        }
+        BASELINE.write_text(json.dumps(baselines, indent=2, sort_keys=True) + "\n")
+        return
+
+    regressions = [
+        f"{stage} {metrics['items_per_second']}/s is below baseline {baseline}/s"
+        for stage, metrics in results.items()
+        if (baseline := baselines.get(key, {}).get(stage))
+        and metrics["items_per_second"] < baseline * (1 - TOLERANCE)
+    ]
+
+    assert not regressions, "\n".join(regressions)
+
+
+@pytest.mark.parametrize("buckets", BUCKETS)
+def test_map_account(buckets, tmp_path):
+    """fetch, parse, flattern and write a synthetic account"""
+
+    stub = StubS3(generate_account(seed=buckets, buckets=buckets))
+    client = S3Client(client=stub, max_workers=WORKERS)
+    resources = client.list()
+    results = {}
+
+    factored, results["fetch"] = _measure(
+        "fetch", len, lambda: list(client.iter_factored(resources))
+    )
+    statements, results["flattern"] = _measure(
+        "flattern",
+        len,
+        lambda: [statement for factors in factored for statement in factors],
+    )
+    _, results["write_csv"] = _measure(
+        "write_csv",
+        lambda _: len(statements),
+        lambda: write_csv(statements, str(tmp_path / "output.csv")),
+    )
+    _, results["write_sqlite"] = _measure(
+        "write_sqlite",
+        lambda _: len(statements),
+        lambda: write_sqlite(statements, str(tmp_path / "output.db")),
+    )
+
+    assert stub.calls == buckets
+    _check_baseline(f"s3-{buckets}", results)
+
+
+@pytest.mark.parametrize("buckets", BUCKETS)
+def test_wide_fan_out(buckets, tmp_path):
+    """a few statements each expanding into many rows"""
+
+    stub = StubS3(
+        generate_account(
+            seed=buckets,
+            buckets=buckets,
+            statements=1,
+            resources=5,
+            actions=10,
+            principals=5,
+            conditions=3,
+        )
+    )
+    client = S3Client(client=stub, max_workers=WORKERS)
+    resources = client.list()
+    results = {}
+
+    _, results["map"] = _measure(
+        "map",
+        lambda _: 250 * buckets,
+        lambda: write_csv(
+            (
+                statement
+                for factors in client.iter_factored(resources)
+                for statement in factors
+            ),
+            str(tmp_path / "output.csv"),
+        ),
+    )
+
+    _check_baseline(f"s3-fan-out-{buckets}", results)
+
+
+@pytest.mark.parametrize("buckets", BUCKETS)
+def test_shared_template(buckets):
+    """buckets sharing a templated policy are factored once per distinct policy"""
+
+    stub = StubS3(generate_account(seed=buckets, buckets=buckets, shared=0.9))
+    client = S3Client(client=stub, max_workers=WORKERS)
+    resources = client.list()
+    results = {}
+
+    default_templates.clear()
+    _, results["fetch"] = _measure(
+        "fetch", len, lambda: list(client.iter_factored(resources))
+    )
+
+    assert default_templates.stats.documents == buckets
+    _check_baseline(f"s3-shared-{buckets}", results)
@@ -18,3 +18,10 @@ def s3():
 def s3_client():
     """fixture that provides and S3 client to for testing"""
     yield S3Client()
+
+
+@pytest.fixture(scope="function")
+def iam():
+    """function fixture to mock the AWS IAM Boto3 client"""
+    with mock_aws():
+        yield boto3.client("iam")
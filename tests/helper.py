@@ -1,5 +1,7 @@
 """Test helper builder fuctions"""
 
+import json
+
 from awsiammapper.policy import PolicyStatement
 
 
@@ -45,6 +47,7 @@ def build_policy_statement(
     effect="Deny",
     resource="*",
     conditions=None,
+    account=None,
 ):
     """PolicyStatement class builder"""
     return PolicyStatement(
@@ -55,4 +58,19 @@ def build_policy_statement(
         effect=effect,
         resource=resource,
         conditions=conditions if conditions else [],
+        account=account,
     )
+
+
+def create_bucket_with_policy(s3, bucket_name, statements=None):
+    """create an S3 bucket with a bucket policy granting access to the bucket"""
+    s3.create_bucket(Bucket=bucket_name)
+    bucket_policy = {
+        "Version": "2012-10-17",
+        "Statement": (
+            statements
+            if statements
+            else [build_statement(resource=f"arn:aws:s3:::{bucket_name}")]
+        ),
+    }
+    s3.put_bucket_policy(Bucket=bucket_name, Policy=json.dumps(bucket_policy))
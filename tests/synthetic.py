@@ -0,0 +1,142 @@
+"""Seeded synthetic policy generator for scale tests and benchmarks"""
+
+import json
+import random
+
+from tests.helper import build_statement, build_statement_with_condition
+
+SERVICES = ["s3", "kms", "sqs", "dynamodb"]
+VERBS = ["Get", "Put", "List", "Delete", "Describe", "Create", "Update", "Tag"]
+NOUNS = ["Object", "Bucket", "Key", "Policy", "Table", "Queue", "Acl", "Tagging"]
+OPERATORS = ["StringEquals", "StringLike", "IpAddress", "Bool", "ArnLike"]
+CONDITION_KEYS = ["aws:SourceIp", "aws:PrincipalOrgID", "s3:prefix", "aws:SourceVpce"]
+
+
+def generate_statement(
+    rng, bucket_name, resources=1, actions=1, principals=1, conditions=0
+):
+    """generate an AWS Policy statement with the given fan out
+
+    Keyword arguments:
+    rng -- random.Random instance
+    bucket_name -- bucket the statement resources belong to
+    resources -- number of resource arns
+    actions -- number of actions
+    principals -- number of AWS principals
+    conditions -- number of condition values
+    """
+    kwargs = {
+        "sid": f"Sid{rng.randrange(1000)}",
+        "effect": rng.choice(["Allow", "Deny"]),
+        "resource": [
+            f"arn:aws:s3:::{bucket_name}/prefix{i}/*" for i in range(resources)
+        ],
+        "action": [
+            f"{rng.choice(SERVICES)}:{rng.choice(VERBS)}{rng.choice(NOUNS)}{i}"
+            for i in range(actions)
+        ],
+        "principal": {
+            "AWS": [
+                f"arn:aws:iam::{rng.randrange(10**12):012d}:role/role{i}"
+                for i in range(principals)
+            ]
+        },
+    }
+
+    if not conditions:
+        return build_statement(**kwargs)
+
+    return build_statement_with_condition(
+        condition={
+            rng.choice(OPERATORS): {
+                f"{rng.choice(CONDITION_KEYS)}{i}": f"value-{rng.randrange(10**6)}"
+            }
+            for i in range(conditions)
+        },
+        **kwargs,
+    )
+
+
+def generate_account(
+    seed=0,
+    buckets=100,
+    statements=2,
+    resources=2,
+    actions=4,
+    principals=2,
+    conditions=1,
+    shared=0.5,
+):
+    """generate bucket policy documents for an account, keyed by bucket name
+
+    A share of the buckets reuse a single templated policy to mimic policies
+    generated from a common template.
+
+    Keyword arguments:
+    seed -- random seed, the same seed always generates the same account
+    buckets -- number of buckets
+    statements -- statements per bucket policy
+    resources, actions, principals, conditions -- fan out of each statement
+    shared -- fraction of buckets sharing the templated policy
+    """
+    rng = random.Random(seed)
+    template = [
+        generate_statement(rng, "template", resources, actions, principals, conditions)
+        for _ in range(statements)
+    ]
+    policies = {}
+
+    for i in range(buckets):
+        bucket_name = f"bucket-{seed}-{i:06d}"
+        document = (
+            json.loads(json.dumps(template).replace("template", bucket_name))
+            if rng.random() < shared
+            else [
+                generate_statement(
+                    rng, bucket_name, resources, actions, principals, conditions
+                )
+                for _ in range(statements)
+            ]
+        )
+        policies[bucket_name] = json.dumps(
+            {"Version": "2012-10-17", "Statement": document}
+        )
+
+    return policies
+
+
+class NoSuchBucketPolicy(Exception):
+    """stub of the botocore NoSuchBucketPolicy error"""
+
+    def __init__(self, bucket):
+        super().__init__(bucket)
+        self.response = {"Error": {"Code": "NoSuchBucketPolicy"}}
+
+
+class StubExceptions:
+    # pylint: disable=too-few-public-methods
+    """stub of the botocore client exceptions factory"""
+
+    ClientError = NoSuchBucketPolicy
+
+
+class StubS3:
+    """in memory stand in for a boto3 S3 client serving generated policies"""
+
+    exceptions = StubExceptions()
+
+    def __init__(self, policies):
+        self.policies = policies
+        self.calls = 0
+
+    def list_buckets(self):
+        """list the generated buckets"""
+        return {"Buckets": [{"Name": name} for name in self.policies]}
+
+    def get_bucket_policy(self, Bucket):
+        # pylint: disable=invalid-name
+        """return the generated bucket policy"""
+        self.calls += 1
+        if Bucket not in self.policies:
+            raise NoSuchBucketPolicy(Bucket)
+        return {"Policy": self.policies[Bucket]}
@@ -0,0 +1,173 @@
+"""test multi account fan out"""
+
+import concurrent.futures
+import multiprocessing
+import pickle
+import tempfile
+
+import pytest
+
+from awsiammapper import accounts, mapper
+from awsiammapper.config import AppConfig
+from awsiammapper.metrics import default_metrics
+from tests.helper import build_policy_statement, create_bucket_with_policy
+
+ROLE_A = "arn:aws:iam::111111111111:role/awsiammapper"
+ROLE_B = "arn:aws:iam::222222222222:role/awsiammapper"
+
+
+def create_bucket_policy(role_arn, bucket_name):
+    """create a bucket with a policy within the account of the role"""
+
+    create_bucket_with_policy(accounts.get_session(role_arn).client("s3"), bucket_name)
+
+
+def test_account_id():
+    """account id is read from the role arn"""
+
+    assert accounts.account_id(ROLE_A) == "111111111111"
+
+
+def test_get_session_cached(s3):
+    # pylint: disable=unused-argument
+    """a single session is reused per role"""
+
+    assert accounts.get_session(ROLE_A) is accounts.get_session(ROLE_A)
+
+
+def test_get_session_instrumented(s3, monkeypatch):
+    # pylint: disable=unused-argument
+    """roles are assumed through the instrumented and scheduled sts client"""
+
+    monkeypatch.setattr(accounts, "_sessions", {})
+    default_metrics.clear()
+
+    accounts.get_session(ROLE_A)
+
+    assert default_metrics.summary()["counters"]["api_calls_total"] == {
+        "operation=AssumeRole,service=sts": 1
+    }
+    default_metrics.clear()
+
+
+def test_iter_accounts(s3, monkeypatch):
+    # pylint: disable=unused-argument
+    """statements of each account are tagged with the account id in role order"""
+
+    monkeypatch.setattr(accounts, "_sessions", {})
+    create_bucket_policy(ROLE_A, "bucket-a")
+    create_bucket_policy(ROLE_B, "bucket-b")
+
+    statements = list(
+        accounts.iter_accounts(
+            [ROLE_B, ROLE_A], ["us-east-1", "eu-west-1"], ["s3"], processes=1
+        )
+    )
+
+    assert statements == [
+        build_policy_statement(
+            resource="arn:aws:s3:::bucket-b", account="222222222222"
+        ),
+        build_policy_statement(
+            resource="arn:aws:s3:::bucket-a", account="111111111111"
+        ),
+    ]
+
+
+def test_iter_accounts_process_pool(s3, monkeypatch):
+    # pylint: disable=unused-argument
+    """accounts are mapped within a process pool
+
+    Forked so the processes share the mocked accounts, the default pool spawns.
+    """
+
+    monkeypatch.setattr(accounts, "_sessions", {})
+    create_bucket_policy(ROLE_A, "bucket-a")
+    create_bucket_policy(ROLE_B, "bucket-b")
+
+    statements = list(
+        accounts.iter_accounts(
+            [ROLE_A, ROLE_B],
+            ["us-east-1"],
+            ["s3"],
+            processes=2,
+            mp_context=multiprocessing.get_context("fork"),
+        )
+    )
+
+    assert [statement.account for statement in statements] == [
+        "111111111111",
+        "222222222222",
+    ]
+
+
+def test_iter_accounts_process_pool_spawns(monkeypatch):
+    """the pool spawns its processes, started while engine threads hold locks"""
+
+    pools = []
+
+    class RecordingPool(concurrent.futures.ProcessPoolExecutor):
+        """records the context of the pool, mapping nothing"""
+
+        def __init__(self, *args, mp_context=None, initializer=None, **kwargs):
+            pools.append((mp_context.get_start_method(), pickle.dumps(initializer)))
+            super().__init__(*args, mp_context=mp_context, **kwargs)
+
+    monkeypatch.setattr(concurrent.futures, "ProcessPoolExecutor", RecordingPool)
+
+    assert not list(accounts.iter_accounts([], ["us-east-1"], ["s3"], processes=2))
+    assert pools[0][0] == "spawn"
+
+
+def test_iter_accounts_streams(s3, monkeypatch):
+    # pylint: disable=unused-argument
+    """without a pool an account is streamed before the next account is mapped"""
+
+    monkeypatch.setattr(accounts, "_sessions", {})
+    create_bucket_policy(ROLE_A, "bucket-a")
+    create_bucket_policy(ROLE_B, "bucket-b")
+    get_session = accounts.get_session
+    assumed = []
+
+    def record_session(role_arn):
+        assumed.append(role_arn)
+        return get_session(role_arn)
+
+    monkeypatch.setattr(accounts, "get_session", record_session)
+    statements = accounts.iter_accounts([ROLE_A, ROLE_B], ["us-east-1"], ["s3"])
+
+    assert next(statements).account == "111111111111"
+    assert assumed == [ROLE_A]
+
+
+def test_mapper_accounts(s3, monkeypatch):
+    # pylint: disable=unused-argument
+    """fan out writes a single output with an account column"""
+
+    monkeypatch.setattr(accounts, "_sessions", {})
+    create_bucket_policy(ROLE_A, "bucket-a")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = f"{temp_dir}/mapping.csv"
+        mapper.map_iam(AppConfig(file_path=file_path, services=["s3"], roles=[ROLE_A]))
+
+        # pylint: disable=line-too-long
+        expected_output = """statement_id,principle_authority,principle_ref,action,effect,resource,account
+DefaultPolicy,*,*,s3:*,Deny,arn:aws:s3:::bucket-a,111111111111
+"""
+        with open(file_path, "r", encoding="utf-8") as fp:
+            assert fp.read() == expected_output
+
+
+def test_mapper_accounts_unsupported_options():
+    """options which are not supported across accounts are rejected"""
+
+    with pytest.raises(ValueError):
+        mapper.map_iam(
+            AppConfig(
+                file_path="mapping.csv",
+                services=["s3"],
+                roles=[ROLE_A],
+                journal="journal.db",
+            )
+        )
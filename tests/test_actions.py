@@ -0,0 +1,87 @@
+"""test wildcard action matching against the action catalog"""
+
+from awsiammapper import actions
+from awsiammapper.actions import ActionCatalog, expand_statements, load_catalog
+from tests.helper import build_policy_statement
+
+CATALOG = ActionCatalog(
+    {
+        "s3": ["GetObject", "GetObjectAcl", "GetBucketPolicy", "PutObject"],
+        "sqs": ["SendMessage"],
+    }
+)
+
+
+def test_expand_prefix():
+    """a trailing wildcard expands to actions sharing the prefix"""
+
+    assert CATALOG.expand("s3:GetObject*") == ("s3:GetObject", "s3:GetObjectAcl")
+
+
+def test_expand_case_insensitive():
+    """action patterns match case insensitively"""
+
+    assert CATALOG.expand("S3:getobject") == ("s3:GetObject",)
+
+
+def test_expand_inner_wildcards():
+    """wildcards within the pattern are matched against the candidates"""
+
+    assert CATALOG.expand("s3:*Object") == ("s3:GetObject", "s3:PutObject")
+    assert CATALOG.expand("s3:?etObject") == ("s3:GetObject",)
+
+
+def test_expand_any():
+    """a bare wildcard expands to every catalog action"""
+
+    assert len(CATALOG.expand("*")) == 5
+    assert CATALOG.expand("s*:Send*") == ("sqs:SendMessage",)
+
+
+def test_expand_unknown_service():
+    """actions of services outside the catalog expand to nothing"""
+
+    assert not CATALOG.expand("ec2:*")
+
+
+def test_matches():
+    """pattern matching is memoized"""
+
+    actions.matches.cache_clear()
+
+    assert actions.matches("s3:Get*", "s3:GetObject")
+    assert actions.matches("s3:Get*", "s3:GetObject")
+    assert not actions.matches("s3:Get*", "s3:PutObject")
+    # pylint: disable-next=no-value-for-parameter
+    assert actions.matches.cache_info().hits == 1
+
+
+def test_bundled_catalog():
+    """the bundled catalog includes the supported services"""
+
+    catalog = load_catalog()
+
+    assert {"s3", "iam"} <= set(catalog.services())
+    assert "s3:GetBucketPolicy" in catalog.expand("s3:GetBucket*")
+    assert "iam:GetAccountAuthorizationDetails" in catalog.expand("iam:Get*")
+
+
+def test_expand_statements():
+    """wildcard statements are replaced by one statement per matching action"""
+
+    statements = list(
+        expand_statements(
+            [
+                build_policy_statement(action="s3:Put*"),
+                build_policy_statement(action="s3:GetObject"),
+                build_policy_statement(action="ec2:*"),
+            ],
+            CATALOG,
+        )
+    )
+
+    assert statements == [
+        build_policy_statement(action="s3:PutObject"),
+        build_policy_statement(action="s3:GetObject"),
+        build_policy_statement(action="ec2:*"),
+    ]
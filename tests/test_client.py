@@ -1,11 +1,22 @@
 """test awsiammapper clients"""
 
 import json
+import tempfile
 
+import boto3
 import moto
 import pytest
+from botocore.stub import Stubber
 
-from tests.helper import build_policy_statement, build_statement
+from awsiammapper.client import BaseClient, IAMRoleClient, S3Client, get_client
+from awsiammapper.metrics import default_metrics
+from awsiammapper.policy import Condition
+from awsiammapper.snapshot import SnapshotStore
+from tests.helper import (
+    build_policy_statement,
+    build_statement,
+    create_bucket_with_policy,
+)
 
 
 def test_s3_list(s3, s3_client):
@@ -76,3 +87,346 @@ def test_s3_bucket_policy_read(s3, s3_client):
     expected_policies = [build_policy_statement()]
 
     assert policy == expected_policies
+
+
+def test_s3_bucket_policy_read_concurrent(s3):
+    """concurrent policy reads keep the order of the requested buckets"""
+
+    buckets = [f"my-bucket-{i}" for i in range(20)]
+    for bucket_name in buckets:
+        create_bucket_with_policy(s3, bucket_name)
+
+    policies = S3Client(max_workers=8).get_policies(buckets)
+
+    expected_policies = [
+        build_policy_statement(resource=f"arn:aws:s3:::{bucket_name}")
+        for bucket_name in buckets
+    ]
+
+    assert policies == expected_policies
+
+
+def test_s3_no_policy_continue_on_error_isolated(s3):
+    """a bucket without a policy does not stop the remaining buckets being read"""
+
+    s3.create_bucket(Bucket="my-bucket-1")
+    s3.create_bucket(Bucket="my-bucket-2")
+    bucket_policy = {"Version": "2012-10-17", "Statement": [build_statement()]}
+    s3.put_bucket_policy(Bucket="my-bucket-2", Policy=json.dumps(bucket_policy))
+
+    policies = S3Client(max_workers=2).get_policies(
+        ["my-bucket-1", "my-bucket-2"], exit_on_error=False
+    )
+
+    assert policies == [build_policy_statement()]
+
+
+def test_s3_access_denied_isolated():
+    """a bucket failing to be fetched is skipped without stopping the others"""
+
+    client = boto3.client("s3", region_name="us-east-1")
+    bucket_policy = {"Version": "2012-10-17", "Statement": [build_statement()]}
+
+    with Stubber(client) as stubber:
+        stubber.add_client_error("get_bucket_policy", "AccessDenied")
+        stubber.add_client_error("get_bucket_policy", "NoSuchBucketPolicy")
+        stubber.add_response("get_bucket_policy", {"Policy": json.dumps(bucket_policy)})
+        buckets = list(
+            S3Client(client=client).iter_by_resource(
+                ["my-bucket-1", "my-bucket-2", "my-bucket-3"], exit_on_error=False
+            )
+        )
+
+    assert [(bucket, len(statements)) for bucket, statements in buckets] == [
+        ("my-bucket-2", 0),
+        ("my-bucket-3", 1),
+    ]
+
+
+def test_s3_access_denied_fail_on_error():
+    """a bucket failing to be fetched raises its error when exiting on error"""
+
+    client = boto3.client("s3", region_name="us-east-1")
+
+    with Stubber(client) as stubber:
+        stubber.add_client_error("get_bucket_policy", "AccessDenied")
+        with pytest.raises(client.exceptions.ClientError):
+            S3Client(client=client).get_policies(["my-bucket-1"])
+
+
+def test_get_client_max_workers(s3):
+    # pylint: disable=unused-argument
+    """factory sizes the botocore connection pool to the worker count"""
+
+    client = get_client("s3", max_workers=32)
+
+    assert client.max_workers == 32
+    assert client.client.meta.config.max_pool_connections == 32
+
+
+def test_s3_iter_policies_streams(s3, s3_client):
+    """policies are streamed lazily rather than returned as a list"""
+
+    s3.create_bucket(Bucket="my-bucket-1")
+    bucket_policy = {"Version": "2012-10-17", "Statement": [build_statement()]}
+    s3.put_bucket_policy(Bucket="my-bucket-1", Policy=json.dumps(bucket_policy))
+
+    policies = s3_client.iter_policies(["my-bucket-1"])
+
+    assert not isinstance(policies, list)
+    assert list(policies) == [build_policy_statement()]
+
+
+def test_iter_policies_expands_lazily():
+    """rows are yielded while a statement expands and counted once it is done"""
+
+    expanded = []
+
+    def statement():
+        for row in range(3):
+            expanded.append(row)
+            yield build_policy_statement(statement_id=str(row))
+
+    class StubClient(BaseClient):
+        """client with a single statement for any resource"""
+
+        service = "stub"
+
+        def list(self):
+            return ["resource"]
+
+        def iter_factored(self, resources, exit_on_error=True):
+            yield statement()
+
+    default_metrics.clear()
+    policies = StubClient().iter_policies(["resource"])
+
+    assert next(policies) == build_policy_statement(statement_id="0")
+    assert expanded == [0]
+    assert len(list(policies)) == 2
+    summary = default_metrics.summary()
+    assert summary["counters"]["rows_total"] == {"service=stub": 3}
+    default_metrics.clear()
+
+
+def test_s3_bucket_policy_read_json_literals(s3, s3_client):
+    """bucket policies with json boolean conditions are read"""
+
+    bucket_name = "my-test-bucket"
+    s3.create_bucket(Bucket=bucket_name)
+    statement = build_statement()
+    statement["Condition"] = {"Bool": {"aws:SecureTransport": False}}
+    bucket_policy = {"Version": "2012-10-17", "Statement": [statement]}
+    s3.put_bucket_policy(Bucket=bucket_name, Policy=json.dumps(bucket_policy))
+
+    policy = s3_client.get_policies([bucket_name])
+
+    assert policy == [
+        build_policy_statement(
+            conditions=[
+                Condition(key="aws:SecureTransport", operater="Bool", value=False)
+            ]
+        )
+    ]
+
+
+def test_s3_iter_factored(s3, s3_client):
+    """unexpanded statements report their row count before expanding"""
+
+    s3.create_bucket(Bucket="my-bucket-1")
+    statement = build_statement(action=["s3:GetObject", "s3:PutObject"])
+    bucket_policy = {"Version": "2012-10-17", "Statement": [statement]}
+    s3.put_bucket_policy(Bucket="my-bucket-1", Policy=json.dumps(bucket_policy))
+
+    statements = list(s3_client.iter_factored(["my-bucket-1"]))
+
+    assert [len(statement) for statement in statements] == [2]
+
+
+def test_s3_iter_by_resource(s3, s3_client):
+    """each bucket is streamed with its statements, without any when absent"""
+
+    create_bucket_with_policy(s3, "my-bucket-1")
+    s3.create_bucket(Bucket="my-bucket-2")
+
+    buckets = list(
+        s3_client.iter_by_resource(["my-bucket-1", "my-bucket-2"], exit_on_error=False)
+    )
+
+    assert [(bucket, len(statements)) for bucket, statements in buckets] == [
+        ("my-bucket-1", 1),
+        ("my-bucket-2", 0),
+    ]
+
+
+def test_s3_snapshot_skips_fresh_buckets(s3):
+    """buckets fetched within the snapshot ttl are not requested again"""
+
+    s3.create_bucket(Bucket="my-bucket-1")
+    s3.create_bucket(Bucket="my-bucket-2")
+    bucket_policy = {"Version": "2012-10-17", "Statement": [build_statement()]}
+    s3.put_bucket_policy(Bucket="my-bucket-1", Policy=json.dumps(bucket_policy))
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with SnapshotStore(f"{temp_dir}/snapshot.db", ttl=3600) as store:
+            S3Client(snapshot=store).get_policies(
+                ["my-bucket-1", "my-bucket-2"], exit_on_error=False
+            )
+            s3.delete_bucket_policy(Bucket="my-bucket-1")
+
+            policies = S3Client(snapshot=store).get_policies(
+                ["my-bucket-1", "my-bucket-2"], exit_on_error=False
+            )
+
+            assert policies == [build_policy_statement()]
+            assert store.stats.fresh == 2
+
+
+def test_s3_snapshot_reuses_unchanged_statements(s3, monkeypatch):
+    """statements of an unchanged bucket policy are read from the snapshot"""
+
+    create_bucket_with_policy(s3, "my-bucket-1")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with SnapshotStore(f"{temp_dir}/snapshot.db") as store:
+            expected_policies = S3Client(snapshot=store).get_policies(["my-bucket-1"])
+
+        def factor_bucket_policy(policy, bucket):
+            raise AssertionError(f"bucket [{bucket}] was factored again")
+
+        monkeypatch.setattr(
+            "awsiammapper.client.factor_bucket_policy", factor_bucket_policy
+        )
+
+        with SnapshotStore(f"{temp_dir}/snapshot.db") as store:
+            policies = S3Client(snapshot=store).get_policies(["my-bucket-1"])
+
+            assert policies == expected_policies
+            assert store.stats.unchanged == 1
+            assert store.stats.reused == 1
+
+
+def test_iam_snapshot_unsupported():
+    """the iam client rejects a snapshot rather than ignoring it"""
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with SnapshotStore(f"{temp_dir}/snapshot.db") as store:
+            with pytest.raises(ValueError):
+                IAMRoleClient(client=object(), snapshot=store)
+
+
+ASSUME_ROLE_POLICY = json.dumps(
+    {
+        "Version": "2012-10-17",
+        "Statement": [
+            {
+                "Effect": "Allow",
+                "Principal": {"Service": "lambda.amazonaws.com"},
+                "Action": "sts:AssumeRole",
+            }
+        ],
+    }
+)
+
+
+def create_role(iam, role_name):
+    """create a role, returning its arn"""
+    return iam.create_role(
+        RoleName=role_name, AssumeRolePolicyDocument=ASSUME_ROLE_POLICY
+    )["Role"]["Arn"]
+
+
+def identity_policy(action, resource="*", sid=None):
+    """identity policy document json"""
+    statement = {"Effect": "Allow", "Action": action, "Resource": resource}
+    if sid:
+        statement["Sid"] = sid
+
+    return json.dumps({"Version": "2012-10-17", "Statement": [statement]})
+
+
+def test_iam_list(iam):
+    """happy path listing roles"""
+
+    create_role(iam, "role-1")
+    create_role(iam, "role-2")
+
+    assert sorted(IAMRoleClient().list()) == ["role-1", "role-2"]
+
+
+def test_iam_inline_policy(iam):
+    """inline role policies are mapped with the role as principal"""
+
+    role_arn = create_role(iam, "role-1")
+    iam.put_role_policy(
+        RoleName="role-1",
+        PolicyName="inline",
+        PolicyDocument=identity_policy("s3:GetObject", sid="Read"),
+    )
+
+    policies = IAMRoleClient().get_policies(["role-1"])
+
+    assert policies == [
+        build_policy_statement(
+            statement_id="Read",
+            principle_authority="AWS",
+            principle_ref=role_arn,
+            action="s3:GetObject",
+            effect="Allow",
+        )
+    ]
+
+
+def test_iam_managed_policy_shared(iam):
+    """a managed policy attached to several roles is flattened once"""
+
+    policy_arn = iam.create_policy(
+        PolicyName="shared", PolicyDocument=identity_policy(["s3:GetObject"])
+    )["Policy"]["Arn"]
+    role_arns = [create_role(iam, f"role-{i}") for i in range(2)]
+    for i in range(2):
+        iam.attach_role_policy(RoleName=f"role-{i}", PolicyArn=policy_arn)
+
+    client = IAMRoleClient(max_workers=2)
+    statements = list(client.iter_factored(["role-0", "role-1"]))
+
+    assert [statement.principals for statement in statements] == [
+        (("AWS", role_arns[0]),),
+        (("AWS", role_arns[1]),),
+    ]
+    assert statements[0].actions is statements[1].actions
+    assert client.get_policies(["role-1"]) == [
+        build_policy_statement(
+            statement_id="",
+            principle_authority="AWS",
+            principle_ref=role_arns[1],
+            action="s3:GetObject",
+            effect="Allow",
+        )
+    ]
+
+
+def test_iam_missing_role_fail_on_error(iam):
+    # pylint: disable=unused-argument
+    """unknown roles raise when failing on error"""
+
+    with pytest.raises(KeyError):
+        IAMRoleClient().get_policies(["missing-role"])
+
+
+def test_iam_missing_role_continue_on_error(iam):
+    # pylint: disable=unused-argument
+    """unknown roles are skipped when continuing on error"""
+
+    assert not IAMRoleClient().get_policies(["missing-role"], exit_on_error=False)
+
+
+def test_get_client_cached(s3):
+    # pylint: disable=unused-argument
+    """boto3 clients are reused across calls to get_client"""
+
+    first = get_client("s3", region="us-east-1")
+    second = get_client("s3", region="us-east-1")
+
+    assert first is not second
+    assert first.client is second.client
@@ -0,0 +1,38 @@
+"""test the import cost of the Lambda entry point"""
+
+import json
+import subprocess
+import sys
+
+IMPORT_BUDGET = 0.25  # seconds to import the Lambda entry point in a new process
+LAZY_MODULES = ["boto3", "botocore", "pyarrow", "sqlite3", "awsiammapper.writer"]
+
+PROBE = f"""
+import json, sys, time
+start = time.perf_counter()
+import awsiammapper.mapper
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    "seconds": elapsed,
+    "loaded": [module for module in {LAZY_MODULES!r} if module in sys.modules],
+}}))
+"""
+
+
+def _probe():
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE], capture_output=True, check=True, text=True
+    )
+    return json.loads(result.stdout)
+
+
+def test_lazy_imports():
+    """heavy dependencies are imported on first use rather than with the handler"""
+
+    assert not _probe()["loaded"]
+
+
+def test_import_budget():
+    """the Lambda entry point imports within the budget, best of three"""
+
+    assert min(_probe()["seconds"] for _ in range(3)) < IMPORT_BUDGET
@@ -51,3 +51,62 @@ def test_environment_var(monkeypatch):
     )
 
     assert app_config == expect_app_config
+
+
+def test_cli_workers(monkeypatch):
+    """test cli configuration of the number of concurrent workers"""
+
+    monkeypatch.setattr(
+        sys, "argv", ["awsiammapper", "-s", "s3", "-o", "./myfile.csv", "-w", "16"]
+    )
+
+    app_config = config.from_cli()
+
+    expected_app_config = config.AppConfig(
+        file_path="./myfile.csv", services=["s3"], workers=16
+    )
+
+    assert app_config == expected_app_config
+
+
+def test_environment_var_workers(monkeypatch):
+    """test reading the worker count through environment variables"""
+
+    monkeypatch.setenv("awsiammapper_OUTPUT", "./output.csv")
+    monkeypatch.setenv("awsiammapper_SERVICES", "s3")
+    monkeypatch.setenv("awsiammapper_WORKERS", "4")
+
+    app_config = config.from_env()
+
+    assert app_config.workers == 4
+
+
+def test_cli_accounts(monkeypatch):
+    """test cli configuration of multi account fan out"""
+
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        [
+            "awsiammapper",
+            "-s",
+            "s3",
+            "-o",
+            "./myfile.csv",
+            "--roles",
+            "arn:aws:iam::111111111111:role/a,arn:aws:iam::222222222222:role/b",
+            "--regions",
+            "us-east-1,eu-west-1",
+            "-p",
+            "4",
+        ],
+    )
+
+    app_config = config.from_cli()
+
+    assert app_config.roles == [
+        "arn:aws:iam::111111111111:role/a",
+        "arn:aws:iam::222222222222:role/b",
+    ]
+    assert app_config.regions == ["us-east-1", "eu-west-1"]
+    assert app_config.processes == 4
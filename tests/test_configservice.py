@@ -0,0 +1,176 @@
+"""test the offline AWS Config snapshot client"""
+
+import gzip
+import json
+import urllib.parse
+
+import pytest
+
+from awsiammapper import mapper
+from awsiammapper.client import get_client
+from awsiammapper.config import AppConfig
+from awsiammapper.configservice import ConfigClient
+from tests.helper import build_policy_statement, build_statement
+
+ROLE_ARN = "arn:aws:iam::111111111111:role/reader"
+POLICY_ARN = "arn:aws:iam::111111111111:policy/read"
+READ_POLICY = {
+    "Version": "2012-10-17",
+    "Statement": [
+        {"Effect": "Allow", "Action": "s3:GetObject", "Resource": "arn:aws:s3:::b/*"}
+    ],
+}
+
+
+def bucket_item(name, statement=None, status="OK"):
+    """configuration item of a bucket, its policy within supplementary configuration"""
+    policy = (
+        json.dumps({"Version": "2012-10-17", "Statement": statement})
+        if statement
+        else None
+    )
+    return {
+        "configurationItemStatus": status,
+        "configuration": {"name": name, "owner": {"displayName": "[{"}},
+        "supplementaryConfiguration": {"BucketPolicy": {"policyText": policy}},
+        "resourceType": "AWS::S3::Bucket",
+        "resourceName": name,
+        "ARN": f"arn:aws:s3:::{name}",
+    }
+
+
+def snapshot():
+    """snapshot with a bucket policy and a role with inline and attached policies"""
+    return {
+        "fileVersion": "1.0",
+        "configSnapshotId": "1",
+        "configurationItems": [
+            bucket_item("my-bucket-1", build_statement()),
+            bucket_item("no-policy"),
+            {
+                "configurationItemStatus": "OK",
+                "configuration": json.dumps(
+                    {
+                        "roleName": "reader",
+                        "rolePolicyList": [],
+                        "attachedManagedPolicies": [
+                            {"policyName": "read", "policyArn": POLICY_ARN}
+                        ],
+                    }
+                ),
+                "resourceType": "AWS::IAM::Role",
+                "resourceName": "reader",
+                "ARN": ROLE_ARN,
+            },
+            {
+                "configurationItemStatus": "OK",
+                "configuration": {
+                    "policyName": "read",
+                    "policyVersionList": [
+                        {
+                            "document": urllib.parse.quote(json.dumps(READ_POLICY)),
+                            "isDefaultVersion": True,
+                        },
+                        {"document": "not json", "isDefaultVersion": False},
+                    ],
+                },
+                "resourceType": "AWS::IAM::Policy",
+                "resourceName": "read",
+                "ARN": POLICY_ARN,
+            },
+            {
+                "configurationItemStatus": "OK",
+                "configuration": {"policy": "not json"},
+                "resourceType": "AWS::EC2::Instance",
+                "resourceName": "i-1",
+            },
+        ],
+    }
+
+
+@pytest.mark.parametrize("file_name", ["snapshot.json", "snapshot.json.gz"])
+def test_config_snapshot(tmp_path, file_name):
+    """bucket policies and role policies are read from a snapshot"""
+
+    source = tmp_path / file_name
+    data = json.dumps(snapshot()).encode("utf-8")
+    source.write_bytes(gzip.compress(data) if file_name.endswith(".gz") else data)
+    client = ConfigClient(str(source))
+
+    assert client.list() == ["my-bucket-1", ROLE_ARN]
+    assert [
+        (statement.principle_ref, statement.action, statement.resource)
+        for statement in client.get_policies(client.list())
+    ] == [("*", "s3:*", "*"), (ROLE_ARN, "s3:GetObject", "arn:aws:s3:::b/*")]
+
+
+def test_config_history(tmp_path):
+    """files of a directory are read in order, deleted resources are removed"""
+
+    (tmp_path / "history").mkdir()
+    (tmp_path / "history" / "1.json").write_text(
+        json.dumps(snapshot()), encoding="utf-8"
+    )
+    (tmp_path / "history" / "2.json.gz").write_bytes(
+        gzip.compress(
+            json.dumps(
+                {
+                    "configurationItems": [
+                        bucket_item("my-bucket-1", status="ResourceDeleted"),
+                        bucket_item("my-bucket-2", build_statement(effect="Deny")),
+                        {
+                            "configurationItemStatus": "ResourceDeleted",
+                            "resourceType": "AWS::IAM::Role",
+                            "resourceName": "reader",
+                        },
+                    ]
+                }
+            ).encode("utf-8")
+        )
+    )
+
+    client = get_client("config", source=str(tmp_path / "history"))
+
+    assert client.list() == ["my-bucket-2"]
+    assert client.get_policies(client.list()) == [build_policy_statement(effect="Deny")]
+
+
+def test_config_bucket_and_role_sharing_a_name(tmp_path):
+    """a bucket and a role of the same name both keep their statements"""
+
+    source = tmp_path / "snapshot.json"
+    source.write_text(
+        json.dumps(
+            {
+                "configurationItems": [
+                    bucket_item("reader", build_statement()),
+                    *snapshot()["configurationItems"][2:4],
+                ]
+            }
+        ),
+        encoding="utf-8",
+    )
+    client = ConfigClient(str(source))
+
+    assert client.list() == ["reader", ROLE_ARN]
+    assert [
+        (statement.principle_ref, statement.effect)
+        for statement in client.get_policies(client.list())
+    ] == [("*", "Deny"), (ROLE_ARN, "Allow")]
+
+
+def test_mapper_config(tmp_path):
+    """access is mapped from a Config snapshot without calling AWS"""
+
+    source = tmp_path / "snapshot.json"
+    source.write_text(json.dumps(snapshot()), encoding="utf-8")
+
+    mapper.map_iam(
+        AppConfig(
+            file_path=str(tmp_path / "mapping.csv"),
+            services=["config"],
+            source=str(source),
+        )
+    )
+
+    assert len((tmp_path / "mapping.csv").read_text().splitlines()) == 3
@@ -0,0 +1,153 @@
+"""test the streaming diff of two mapping outputs"""
+
+import csv
+import sys
+
+import pytest
+
+from awsiammapper import diff, mapper
+from awsiammapper.policy import STATEMENT_COLUMNS, Condition
+from awsiammapper.writer import get_writer, open_text
+from tests.helper import build_policy_statement
+
+SECURE = Condition("aws:SecureTransport", "Bool", "false")
+PREFIX = Condition("s3:prefix", "StringLike", "home/*")
+
+
+def before_statements():
+    """mapping of last week"""
+    return [
+        build_policy_statement(resource="bucket-a", conditions=[SECURE, PREFIX]),
+        build_policy_statement(resource="bucket-b"),
+        build_policy_statement(resource="bucket-b"),
+        build_policy_statement(resource="bucket-c", effect="Allow"),
+    ]
+
+
+def after_statements():
+    """mapping of this week, conditions written in another order"""
+    return [
+        build_policy_statement(resource="bucket-d", action="s3:GetObject"),
+        build_policy_statement(resource="bucket-a", conditions=[PREFIX, SECURE]),
+        build_policy_statement(resource="bucket-c", effect="Deny"),
+        build_policy_statement(resource="bucket-b"),
+    ]
+
+
+def read_rows(fp):
+    """rows of a csv output"""
+    with open_text(str(fp)) as csvfile:
+        return list(csv.reader(csvfile))
+
+
+@pytest.mark.parametrize(
+    "output_format, module",
+    [("csv", None), ("sqlite", None), ("index", None), ("parquet", "pyarrow")],
+)
+def test_diff(tmp_path, output_format, module):
+    """added and removed rows are streamed in key order"""
+
+    if module:
+        pytest.importorskip(module)
+
+    write = get_writer(output_format)
+    write(before_statements(), str(tmp_path / "before"))
+    write(after_statements(), str(tmp_path / "after"))
+
+    counts = diff.diff(
+        str(tmp_path / "before"),
+        str(tmp_path / "after"),
+        str(tmp_path / "changes.csv.gz"),
+        output_format,
+        run_size=2,
+    )
+
+    assert counts == {"added": 2, "removed": 1}
+    assert read_rows(tmp_path / "changes.csv.gz") == [
+        [
+            "change",
+            *STATEMENT_COLUMNS,
+            "key 1",
+            "operator 1",
+            "value 1",
+            "key 2",
+            "operator 2",
+            "value 2",
+        ],
+        ["removed", "DefaultPolicy", "*", "*", "s3:*", "Allow", "bucket-c"] + [""] * 6,
+        ["added", "DefaultPolicy", "*", "*", "s3:*", "Deny", "bucket-c"] + [""] * 6,
+        ["added", "DefaultPolicy", "*", "*", "s3:GetObject", "Deny", "bucket-d"]
+        + [""] * 6,
+    ]
+
+
+def test_diff_identical(tmp_path):
+    """identical outputs have no changes"""
+
+    get_writer("csv")(before_statements(), str(tmp_path / "mapping.csv"))
+
+    assert diff.diff(
+        str(tmp_path / "mapping.csv"),
+        str(tmp_path / "mapping.csv"),
+        str(tmp_path / "changes.csv"),
+    ) == {"added": 0, "removed": 0}
+    assert len(read_rows(tmp_path / "changes.csv")) == 1
+
+
+def test_diff_command(tmp_path, monkeypatch):
+    """the diff command compares two outputs given on the command line"""
+
+    get_writer("csv")(before_statements(), str(tmp_path / "before.csv"))
+    get_writer("csv")(
+        [build_policy_statement(account="111111111111")], str(tmp_path / "after.csv")
+    )
+    monkeypatch.setattr(
+        sys,
+        "argv",
+        [
+            "awsiammapper",
+            "diff",
+            str(tmp_path / "before.csv"),
+            str(tmp_path / "after.csv"),
+            "-o",
+            str(tmp_path / "changes.csv"),
+        ],
+    )
+
+    mapper.main()
+    rows = read_rows(tmp_path / "changes.csv")
+
+    assert rows[0][:8] == ["change", *rows[0][1:7], "account"]
+    assert [row[0] for row in rows[1:]] == ["added", "removed", "removed", "removed"]
+    assert rows[1][7] == "111111111111"
+
+
+def test_diff_escaped_fields(tmp_path):
+    """fields holding separators or newlines compare and decode unchanged"""
+
+    statement = build_policy_statement(
+        resource="bucket-\x1f\x1e\nname",
+        conditions=[Condition("aws:UserAgent", "StringLike", "a\nb")],
+    )
+    get_writer("sqlite")([], str(tmp_path / "before.db"))
+    get_writer("sqlite")([statement], str(tmp_path / "after.db"))
+
+    diff.diff(
+        str(tmp_path / "before.db"),
+        str(tmp_path / "after.db"),
+        str(tmp_path / "changes.csv"),
+        "sqlite",
+    )
+
+    assert read_rows(tmp_path / "changes.csv")[1] == [
+        "added",
+        "DefaultPolicy",
+        "*",
+        "*",
+        "s3:*",
+        "Deny",
+        "bucket-\x1f\x1e\nname",
+        "aws:UserAgent",
+        "StringLike",
+        "a\nb",
+    ]
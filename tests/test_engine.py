@@ -0,0 +1,127 @@
+"""test the concurrent orchestration engine"""
+
+import asyncio
+import time
+
+import pytest
+
+from awsiammapper import engine
+from tests.helper import build_policy_statement
+
+
+class SlowClient:
+    """client stub which blocks on each call to mimic network latency"""
+
+    def __init__(self, service, delay, count=1):
+        self.service = service
+        self.delay = delay
+        self.count = count
+
+    def list(self):
+        """list resources named after the service"""
+        time.sleep(self.delay)
+        return [f"{self.service}-{i}" for i in range(self.count)]
+
+    def iter_policies(self, resources, exit_on_error=True):
+        # pylint: disable=unused-argument
+        """stream a statement per resource"""
+        time.sleep(self.delay)
+        for resource in resources:
+            yield build_policy_statement(resource=resource)
+
+
+def slow_client_factory(delay, count=1):
+    """build a get_service_client function returning SlowClients"""
+
+    def get_service_client(service, workers):
+        # pylint: disable=unused-argument
+        return SlowClient(service, delay, count)
+
+    return get_service_client
+
+
+def test_run_services_concurrently():
+    """services are mapped at the same time rather than one after another"""
+
+    output = []
+    start = time.perf_counter()
+    engine.run(slow_client_factory(0.2), ["s3", "iam", "kms"], output.extend)
+    elapsed = time.perf_counter() - start
+
+    assert output == [
+        build_policy_statement(resource="s3-0"),
+        build_policy_statement(resource="iam-0"),
+        build_policy_statement(resource="kms-0"),
+    ]
+    assert elapsed < 0.8
+
+
+def test_run_streams_in_service_order():
+    """statements beyond the channel bound stream through in service order"""
+
+    count = engine.BATCH_SIZE * (engine.QUEUE_SIZE + 2)
+    output = []
+    engine.run(slow_client_factory(0, count), ["s3", "iam"], output.extend)
+
+    assert [statement.resource for statement in output] == [
+        f"{service}-{i}" for service in ["s3", "iam"] for i in range(count)
+    ]
+
+
+def test_run_deadline():
+    """an overall deadline stops the run without waiting on blocked calls"""
+
+    start = time.perf_counter()
+
+    with pytest.raises(TimeoutError):
+        engine.run(slow_client_factory(1), ["s3"], list, timeout=0.1)
+
+    assert time.perf_counter() - start < 0.9
+
+
+def test_run_deadline_ends_output():
+    """on a deadline the output is ended with the statements gathered so far"""
+
+    def get_service_client(service, workers):
+        # pylint: disable=unused-argument
+        client = SlowClient(service, 0, engine.BATCH_SIZE)
+        gathered = client.iter_policies
+
+        def iter_policies(resources, exit_on_error=True):
+            yield from gathered(resources, exit_on_error)
+            time.sleep(1)
+
+        client.iter_policies = iter_policies
+        return client
+
+    output = []
+
+    with pytest.raises(TimeoutError):
+        engine.run(get_service_client, ["s3"], output.extend, timeout=0.3)
+
+    assert len(output) == engine.BATCH_SIZE
+
+
+def test_map_services_cancel():
+    """cancelling the orchestration task propagates to the caller"""
+
+    async def cancel_run():
+        task = asyncio.create_task(
+            engine.map_services(slow_client_factory(1), ["s3", "iam"], list)
+        )
+        await asyncio.sleep(0.05)
+        task.cancel()
+        await task
+
+    with pytest.raises(asyncio.CancelledError):
+        asyncio.run(cancel_run())
+
+
+def test_run_error():
+    """a failing service surfaces its error"""
+
+    def get_service_client(service, workers):
+        raise KeyError(service)
+
+    with pytest.raises(KeyError):
+        engine.run(get_service_client, ["s3"], list)
@@ -0,0 +1,135 @@
+"""test effective access evaluation"""
+
+from awsiammapper.evaluate import Decision, Evaluator, resource_matches
+from awsiammapper.policy import Condition
+from tests.helper import build_policy_statement
+
+ROLE = "arn:aws:iam::111111111111:role/reader"
+OTHER_ROLE = "arn:aws:iam::222222222222:role/writer"
+CONDITIONS = [Condition(key="aws:SecureTransport", operater="Bool", value="false")]
+
+
+def test_allow():
+    """a matching allow statement allows access"""
+
+    evaluator = Evaluator(
+        [
+            build_policy_statement(
+                principle_ref=ROLE,
+                action="s3:Get*",
+                effect="Allow",
+                resource="arn:aws:s3:::bucket/*",
+            )
+        ]
+    )
+
+    assert evaluator.evaluate(ROLE, "s3:GetObject", "arn:aws:s3:::bucket/key") == (
+        Decision("Allow")
+    )
+    assert evaluator.evaluate(ROLE, "s3:PutObject", "arn:aws:s3:::bucket/key") == (
+        Decision("ImplicitDeny")
+    )
+    assert evaluator.evaluate(OTHER_ROLE, "s3:GetObject", "arn:aws:s3:::bucket/k") == (
+        Decision("ImplicitDeny")
+    )
+
+
+def test_explicit_deny_precedence():
+    """a matching deny overrides any allow"""
+
+    evaluator = Evaluator(
+        [
+            build_policy_statement(
+                principle_ref=ROLE, action="s3:*", effect="Allow", resource="*"
+            ),
+            build_policy_statement(
+                principle_ref="*", action="s3:Delete*", effect="Deny", resource="*"
+            ),
+        ]
+    )
+
+    assert evaluator.evaluate_batch(
+        [
+            (ROLE, "s3:GetObject", "arn:aws:s3:::bucket"),
+            (ROLE, "s3:DeleteObject", "arn:aws:s3:::bucket"),
+        ]
+    ) == [Decision("Allow"), Decision("Deny")]
+
+
+def test_conditional_deny():
+    """conditional statements are assumed to apply and are flagged"""
+
+    evaluator = Evaluator(
+        [
+            build_policy_statement(
+                principle_ref=ROLE, action="s3:*", effect="Allow", resource="*"
+            ),
+            build_policy_statement(
+                principle_ref="*",
+                action="s3:*",
+                effect="Deny",
+                resource="*",
+                conditions=CONDITIONS,
+            ),
+        ]
+    )
+
+    assert evaluator.evaluate(ROLE, "s3:GetObject", "arn:aws:s3:::bucket") == (
+        Decision("Deny", conditional=True)
+    )
+
+
+def test_account_principal():
+    """account principals apply to every principal of the account"""
+
+    evaluator = Evaluator(
+        [
+            build_policy_statement(
+                principle_authority="AWS",
+                principle_ref="arn:aws:iam::111111111111:root",
+                action="s3:GetObject",
+                effect="Allow",
+                resource="*",
+            )
+        ]
+    )
+
+    assert evaluator.evaluate(ROLE, "s3:GetObject", "arn:aws:s3:::bucket") == (
+        Decision("Allow")
+    )
+    assert evaluator.evaluate(OTHER_ROLE, "s3:GetObject", "arn:aws:s3:::bucket") == (
+        Decision("ImplicitDeny")
+    )
+
+
+def test_evaluate_matrix():
+    """every principal and resource pair is evaluated"""
+
+    evaluator = Evaluator(
+        [
+            build_policy_statement(
+                principle_ref=ROLE,
+                action="s3:ListBucket",
+                effect="Allow",
+                resource="arn:aws:s3:::bucket-1",
+            )
+        ]
+    )
+
+    decisions = evaluator.evaluate_matrix(
+        [ROLE, OTHER_ROLE],
+        ["arn:aws:s3:::bucket-1", "arn:aws:s3:::bucket-2"],
+        "s3:ListBucket",
+    )
+
+    assert [
+        pair for pair, decision in decisions.items() if decision.effect == "Allow"
+    ] == [(ROLE, "arn:aws:s3:::bucket-1")]
+    assert len(decisions) == 4
+
+
+def test_resource_matches_case_sensitive():
+    """resource arns are matched case sensitively"""
+
+    assert resource_matches("arn:aws:s3:::bucket/*", "arn:aws:s3:::bucket/key")
+    assert not resource_matches("arn:aws:s3:::Bucket/*", "arn:aws:s3:::bucket/key")
@@ -0,0 +1,309 @@
+"""test the offline infrastructure as code clients"""
+
+import gzip
+import json
+
+import pytest
+
+from awsiammapper import mapper
+from awsiammapper.client import get_client
+from awsiammapper.config import AppConfig
+from awsiammapper.iac import CloudFormationClient, TerraformClient
+from tests.helper import build_policy_statement, build_statement
+
+ROLE_ARN = "arn:aws:iam::111111111111:role/reader"
+READ_POLICY = {
+    "Version": "2012-10-17",
+    "Statement": [
+        {"Effect": "Allow", "Action": "s3:GetObject", "Resource": "arn:aws:s3:::b/*"}
+    ],
+}
+
+
+def terraform_state():
+    """terraform state with a bucket policy and a role with an attached policy"""
+    return {
+        "version": 4,
+        "outputs": {"ignored": {"value": "[{"}},
+        "resources": [
+            {
+                "mode": "managed",
+                "type": "aws_s3_bucket_policy",
+                "name": "bucket",
+                "instances": [
+                    {
+                        "attributes": {
+                            "bucket": "my-bucket-1",
+                            "policy": json.dumps(
+                                {
+                                    "Version": "2012-10-17",
+                                    "Statement": build_statement(),
+                                }
+                            ),
+                        }
+                    }
+                ],
+            },
+            {
+                "mode": "managed",
+                "type": "aws_iam_role_policy_attachment",
+                "name": "reader",
+                "instances": [
+                    {"attributes": {"role": "reader", "policy_arn": "arn:policy"}}
+                ],
+            },
+            {
+                "mode": "managed",
+                "type": "aws_iam_role",
+                "name": "reader",
+                "instances": [
+                    {
+                        "attributes": {
+                            "name": "reader",
+                            "arn": ROLE_ARN,
+                            "inline_policy": [],
+                            "managed_policy_arns": [],
+                        }
+                    }
+                ],
+            },
+            {
+                "mode": "managed",
+                "type": "aws_iam_policy",
+                "name": "read",
+                "instances": [
+                    {
+                        "attributes": {
+                            "arn": "arn:policy",
+                            "policy": json.dumps(READ_POLICY),
+                        }
+                    }
+                ],
+            },
+            {
+                "mode": "data",
+                "type": "aws_iam_policy",
+                "name": "ignored",
+                "instances": [{"attributes": {"arn": "x", "policy": "not json"}}],
+            },
+            {
+                "mode": "managed",
+                "type": "aws_instance",
+                "name": "ignored",
+                "instances": [{"attributes": {"policy": "not json"}}],
+            },
+        ],
+    }
+
+
+@pytest.mark.parametrize("file_name", ["terraform.tfstate", "terraform.tfstate.gz"])
+def test_terraform_state(tmp_path, file_name):
+    """bucket policies and role policies are read from terraform state"""
+
+    source = tmp_path / file_name
+    data = json.dumps(terraform_state()).encode("utf-8")
+    source.write_bytes(gzip.compress(data) if file_name.endswith(".gz") else data)
+    client = TerraformClient(str(source))
+
+    assert client.list() == ["my-bucket-1", ROLE_ARN]
+    assert client.get_policies(client.list()) == [
+        build_policy_statement(),
+        build_policy_statement(
+            statement_id="",
+            principle_authority="AWS",
+            principle_ref=ROLE_ARN,
+            action="s3:GetObject",
+            effect="Allow",
+            resource="arn:aws:s3:::b/*",
+        ),
+    ]
+
+
+def terraform_resource(resource_type, attributes):
+    """managed terraform resource with a single instance"""
+    return {
+        "mode": "managed",
+        "type": resource_type,
+        "name": "app",
+        "instances": [{"attributes": attributes}],
+    }
+
+
+def test_terraform_bucket_and_role_sharing_a_name(tmp_path):
+    """a bucket and a role of the same name both keep their statements, a bucket
+    policy computed from its policy resource is only read once"""
+
+    bucket_policy = json.dumps({"Statement": [build_statement()]})
+    source = tmp_path / "terraform.tfstate"
+    source.write_text(
+        json.dumps(
+            {
+                "resources": [
+                    terraform_resource(
+                        "aws_s3_bucket", {"bucket": "app-data", "policy": bucket_policy}
+                    ),
+                    terraform_resource(
+                        "aws_s3_bucket_policy",
+                        {"bucket": "app-data", "policy": bucket_policy},
+                    ),
+                    terraform_resource(
+                        "aws_s3_bucket",
+                        {"bucket": "app-logs", "policy": bucket_policy},
+                    ),
+                    terraform_resource(
+                        "aws_iam_role",
+                        {
+                            "name": "app-data",
+                            "arn": ROLE_ARN,
+                            "inline_policy": [{"policy": json.dumps(READ_POLICY)}],
+                        },
+                    ),
+                ]
+            }
+        ),
+        encoding="utf-8",
+    )
+    client = TerraformClient(str(source))
+
+    assert client.list() == ["app-data", "app-logs", ROLE_ARN]
+    assert [
+        (statement.principle_ref, statement.effect)
+        for statement in client.get_policies(client.list())
+    ] == [("*", "Deny"), ("*", "Deny"), (ROLE_ARN, "Allow")]
+
+
+def test_terraform_plan(tmp_path):
+    """planned values of resource changes are read, deleted resources are not"""
+
+    source = tmp_path / "plan.json"
+    source.write_text(
+        json.dumps(
+            {
+                "format_version": "1.2",
+                "prior_state": {"values": {"root_module": {}}},
+                "resource_changes": [
+                    {
+                        "type": "aws_s3_bucket_policy",
+                        "name": name,
+                        "change": {
+                            "actions": actions,
+                            "after": {
+                                "bucket": name,
+                                "policy": json.dumps(
+                                    {"Statement": [build_statement(effect=name)]}
+                                ),
+                            },
+                        },
+                    }
+                    for name, actions in (("Allow", ["create"]), ("Deny", ["delete"]))
+                ],
+            }
+        ),
+        encoding="utf-8",
+    )
+
+    client = get_client("terraform", source=str(source))
+
+    assert client.get_policies(client.list()) == [
+        build_policy_statement(effect="Allow")
+    ]
+
+
+def test_cloudformation(tmp_path):
+    """policies are read from a template with intrinsic functions as references"""
+
+    source = tmp_path / "template.json"
+    source.write_text(
+        json.dumps(
+            {
+                "AWSTemplateFormatVersion": "2010-09-09",
+                "Resources": {
+                    "Bucket": {"Type": "AWS::S3::Bucket"},
+                    "BucketPolicy": {
+                        "Type": "AWS::S3::BucketPolicy",
+                        "Properties": {
+                            "Bucket": {"Ref": "Bucket"},
+                            "PolicyDocument": {
+                                "Statement": [
+                                    build_statement(
+                                        resource={"Fn::Sub": "${Bucket.Arn}/*"}
+                                    )
+                                ]
+                            },
+                        },
+                    },
+                    "Role": {
+                        "Type": "AWS::IAM::Role",
+                        "Properties": {
+                            "RoleName": "reader",
+                            "Policies": [
+                                {"PolicyName": "read", "PolicyDocument": READ_POLICY}
+                            ],
+                        },
+                    },
+                },
+            }
+        ),
+        encoding="utf-8",
+    )
+
+    client = CloudFormationClient(str(source))
+
+    assert client.list() == ["Bucket", "arn:aws:iam:::role/reader"]
+    assert [
+        (statement.principle_ref, statement.resource)
+        for statement in client.get_policies(client.list())
+    ] == [
+        ("*", "${Bucket.Arn}/*"),
+        ("arn:aws:iam:::role/reader", "arn:aws:s3:::b/*"),
+    ]
+
+
+def test_cloudformation_without_policy(tmp_path):
+    """resources without a policy document, such as a default kms key, are skipped"""
+
+    source = tmp_path / "template.json"
+    source.write_text(
+        json.dumps(
+            {
+                "Resources": {
+                    "Key": {"Type": "AWS::KMS::Key", "Properties": {}},
+                    "Queue": {"Type": "AWS::SQS::Queue"},
+                    "KeyWithPolicy": {
+                        "Type": "AWS::KMS::Key",
+                        "Properties": {"KeyPolicy": {"Statement": [build_statement()]}},
+                    },
+                }
+            }
+        ),
+        encoding="utf-8",
+    )
+
+    client = CloudFormationClient(str(source))
+
+    assert client.list() == ["KeyWithPolicy"]
+    assert len(client.get_policies(client.list())) == 1
+
+
+def test_source_required():
+    """offline clients require a source file"""
+
+    with pytest.raises(ValueError):
+        get_client("terraform")
+
+
+def test_mapper_source(tmp_path):
+    """access is mapped from a source file without calling AWS"""
+
+    source = tmp_path / "terraform.tfstate"
+    source.write_text(json.dumps(terraform_state()), encoding="utf-8")
+
+    mapper.map_iam(
+        AppConfig(
+            file_path=str(tmp_path / "mapping.csv"),
+            services=["terraform"],
+            source=str(source),
+        )
+    )
+
+    assert len((tmp_path / "mapping.csv").read_text().splitlines()) == 3
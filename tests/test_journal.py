@@ -0,0 +1,155 @@
+"""test the journal of completed resources and resuming interrupted runs"""
+
+import tempfile
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+from awsiammapper import mapper
+from awsiammapper.client import BaseClient, S3Client
+from awsiammapper.config import AppConfig
+from awsiammapper.journal import Journal, JournalClient
+from awsiammapper.policy import factor
+from tests.helper import (
+    build_statement,
+    build_statement_with_condition,
+    create_bucket_with_policy,
+)
+
+
+class FlakyClient(BaseClient):
+    """client stub failing once a number of resources have been fetched"""
+
+    service = "s3"
+
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+        self.fetched = []
+
+    def list(self):
+        """list four buckets"""
+        return [f"bucket-{i}" for i in range(4)]
+
+    def iter_factored(self, resources, exit_on_error=True):
+        """fetch a statement per resource, failing once fail_after is reached"""
+        for resource in resources:
+            if len(self.fetched) == self.fail_after:
+                raise ConnectionError("connection reset")
+            self.fetched.append(resource)
+            yield factor(build_statement(resource=f"arn:aws:s3:::{resource}"))
+
+
+def test_journal_round_trip():
+    """journaled statements are replayed unchanged when resuming"""
+
+    statements = [
+        factor(
+            build_statement_with_condition(
+                condition={"Bool": {"aws:SecureTransport": False}}
+            )
+        )
+    ]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with Journal(f"{temp_dir}/journal.db") as journal:
+            journal.record("s3", "bucket-0", statements)
+
+        with Journal(f"{temp_dir}/journal.db", resume=True) as journal:
+            assert journal.completed("s3") == {"bucket-0": statements}
+
+        with Journal(f"{temp_dir}/journal.db") as journal:
+            assert not journal.completed("s3")
+
+
+def test_resume_after_failure():
+    """resuming fetches only the resources not completed before the failure"""
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with Journal(f"{temp_dir}/journal.db") as journal:
+            client = JournalClient(FlakyClient(fail_after=2), journal)
+            with pytest.raises(ConnectionError):
+                list(client.iter_policies(client.list()))
+
+        with Journal(f"{temp_dir}/journal.db", resume=True) as journal:
+            flaky = FlakyClient()
+            client = JournalClient(flaky, journal)
+            statements = list(client.iter_policies(client.list()))
+
+            assert flaky.fetched == ["bucket-2", "bucket-3"]
+            assert journal.replayed == 2
+            assert [statement.resource for statement in statements] == [
+                f"arn:aws:s3:::bucket-{i}" for i in range(4)
+            ]
+
+
+def test_journal_skipped_resources():
+    """buckets without a policy are journaled, failed buckets are fetched again"""
+
+    client = boto3.client("s3", region_name="us-east-1")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with Journal(f"{temp_dir}/journal.db") as journal, Stubber(client) as stubber:
+            stubber.add_client_error("get_bucket_policy", "AccessDenied")
+            stubber.add_client_error("get_bucket_policy", "NoSuchBucketPolicy")
+            list(
+                JournalClient(S3Client(client=client), journal).iter_policies(
+                    ["my-bucket-1", "my-bucket-2"], exit_on_error=False
+                )
+            )
+
+            assert journal.completed("s3") == {"my-bucket-2": []}
+
+
+def test_mapper_resume(s3):
+    """a resumed run outputs the journaled resources without fetching them"""
+
+    create_bucket_with_policy(s3, "my-bucket-1")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        app_config = AppConfig(
+            file_path=f"{temp_dir}/mapping.csv",
+            services=["s3"],
+            journal=f"{temp_dir}/journal.db",
+        )
+        mapper.map_iam(app_config)
+        s3.delete_bucket_policy(Bucket="my-bucket-1")
+        mapper.map_iam(AppConfig(**{**vars(app_config), "resume": True}))
+
+        with open(f"{temp_dir}/mapping.csv", encoding="utf-8") as fp:
+            assert fp.read().splitlines()[1:] == [
+                "DefaultPolicy,*,*,s3:*,Deny,arn:aws:s3:::my-bucket-1"
+            ]
+
+
+def test_mapper_resume_bucket_without_policy(s3):
+    """a bucket without a policy is journaled empty and not fetched on resume"""
+
+    create_bucket_with_policy(s3, "my-bucket-1")
+    s3.create_bucket(Bucket="my-bucket-2")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        app_config = AppConfig(
+            file_path=f"{temp_dir}/mapping.csv",
+            services=["s3"],
+            journal=f"{temp_dir}/journal.db",
+        )
+        mapper.map_iam(app_config)
+
+        with Journal(f"{temp_dir}/journal.db", resume=True) as journal:
+            assert journal.completed("s3")["my-bucket-2"] == []
+
+        create_bucket_with_policy(s3, "my-bucket-2")
+        mapper.map_iam(AppConfig(**{**vars(app_config), "resume": True}))
+
+        with open(f"{temp_dir}/mapping.csv", encoding="utf-8") as fp:
+            assert fp.read().splitlines()[1:] == [
+                "DefaultPolicy,*,*,s3:*,Deny,arn:aws:s3:::my-bucket-1"
+            ]
+
+
+def test_resume_requires_journal():
+    """resume without a journal is rejected"""
+
+    with pytest.raises(ValueError):
+        mapper.map_iam(AppConfig(file_path="mapping.csv", services=[], resume=True))
@@ -5,9 +5,14 @@ import sys
 import tempfile
 from pathlib import Path
 
+import pytest
+
 from awsiammapper import mapper
 from awsiammapper.config import AppConfig
-from tests.helper import build_statement
+from awsiammapper.parser import default_parser
+from awsiammapper.snapshot import SnapshotStore
+from awsiammapper.template import default_templates
+from tests.helper import build_statement, create_bucket_with_policy
 
 
 def test_mapper(s3):
@@ -78,3 +83,138 @@ DefaultPolicy,*,*,s3:*,Deny,*
         with open(file_path, mode="r", encoding="utf-8") as fp:
             output = fp.read()
             assert output == expected_output
+
+
+@pytest.mark.parametrize("workers", [1, 4])
+def test_mapper_bucket_without_policy(s3, workers):
+    """a bucket without a policy is skipped, the other buckets are still mapped"""
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = f"{temp_dir}/mapping.csv"
+        s3.create_bucket(Bucket="my-bucket-1")
+        create_bucket_with_policy(s3, "my-bucket-2")
+        mapper.map_iam(AppConfig(file_path=file_path, services=["s3"], workers=workers))
+
+        with open(file_path, mode="r", encoding="utf-8") as fp:
+            assert fp.read().splitlines()[1:] == [
+                "DefaultPolicy,*,*,s3:*,Deny,arn:aws:s3:::my-bucket-2"
+            ]
+
+
+class LambdaContext:
+    # pylint: disable=too-few-public-methods
+    """minimal stand in for the AWS Lambda context object"""
+
+    def __init__(self, remaining_millis):
+        self.remaining_millis = remaining_millis
+
+    def get_remaining_time_in_millis(self):
+        """remaining execution time in milliseconds"""
+        return self.remaining_millis
+
+
+def test_lambda_timeout_from_context(monkeypatch):
+    """lambda deadline reserves time to write output before the hard timeout"""
+
+    app_configs = []
+    monkeypatch.setattr(mapper, "map_iam", app_configs.append)
+    monkeypatch.setenv("awsiammapper_OUTPUT", "./output.csv")
+    monkeypatch.setenv("awsiammapper_SERVICES", "s3")
+
+    mapper.lambda_handler(None, LambdaContext(900_000))
+
+    assert app_configs[0].timeout == 900 - mapper.LAMBDA_OUTPUT_MARGIN
+
+
+def test_lambda_timeout_configured_lower(monkeypatch):
+    """a configured timeout lower than the lambda deadline is kept"""
+
+    app_configs = []
+    monkeypatch.setattr(mapper, "map_iam", app_configs.append)
+    monkeypatch.setenv("awsiammapper_OUTPUT", "./output.csv")
+    monkeypatch.setenv("awsiammapper_SERVICES", "s3")
+    monkeypatch.setenv("awsiammapper_TIMEOUT", "60")
+
+    mapper.lambda_handler(None, LambdaContext(900_000))
+
+    assert app_configs[0].timeout == 60
+
+
+def test_mapper_snapshot(s3):
+    """mapping with a snapshot records each fetched bucket policy"""
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        s3.create_bucket(Bucket="my-bucket-1")
+        bucket_policy = {"Version": "2012-10-17", "Statement": [build_statement()]}
+        s3.put_bucket_policy(Bucket="my-bucket-1", Policy=json.dumps(bucket_policy))
+
+        mapper.map_iam(
+            AppConfig(
+                file_path=f"{temp_dir}/mapping.csv",
+                services=["s3"],
+                snapshot=f"{temp_dir}/snapshot.db",
+            )
+        )
+
+        with SnapshotStore(f"{temp_dir}/snapshot.db") as store:
+            assert store.get("s3", "my-bucket-1").policy == json.dumps(bucket_policy)
+
+
+def test_mapper_snapshot_iam():
+    """a snapshot is rejected when mapping iam rather than ignored"""
+
+    with pytest.raises(ValueError):
+        mapper.map_iam(
+            AppConfig(file_path="mapping.csv", services=["iam"], snapshot="s.db")
+        )
+
+
+def test_mapper_parquet(s3):
+    """the output format selects the writer"""
+
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = f"{temp_dir}/mapping.parquet"
+        create_bucket_with_policy(s3, "my-bucket-1")
+
+        mapper.map_iam(
+            AppConfig(file_path=file_path, services=["s3"], output_format="parquet")
+        )
+
+        assert pq.read_table(file_path).column("resource").to_pylist() == [
+            "arn:aws:s3:::my-bucket-1"
+        ]
+
+
+def test_mapper_metrics(s3):
+    """a run exports its metrics and profile"""
+
+    default_parser.clear()
+    default_templates.clear()
+    with tempfile.TemporaryDirectory() as temp_dir:
+        create_bucket_with_policy(s3, "my-bucket-1")
+
+        mapper.map_iam(
+            AppConfig(
+                file_path=f"{temp_dir}/mapping.csv",
+                services=["s3"],
+                metrics=f"{temp_dir}/metrics",
+                profile=f"{temp_dir}/run.prof",
+            )
+        )
+
+        with open(f"{temp_dir}/metrics.json", encoding="utf-8") as fp:
+            summary = json.load(fp)
+        prometheus = Path(f"{temp_dir}/metrics.prom").read_text(encoding="utf-8")
+
+        assert summary["counters"]["api_calls_total"] == {
+            "operation=GetBucketPolicy,service=s3": 1,
+            "operation=ListBuckets,service=s3": 1,
+        }
+        assert summary["counters"]["rows_total"] == {"service=s3": 1}
+        assert {"run", "list", "fetch", "flattern", "parse", "write"} <= {
+            key.removeprefix("stage=") for key in summary["histograms"]["stage_seconds"]
+        }
+        assert 'awsiammapper_rows_total{service="s3"} 1' in prometheus
+        assert Path(f"{temp_dir}/run.prof").stat().st_size > 0
@@ -0,0 +1,121 @@
+"""test the run instrumentation and its export formats"""
+
+import pstats
+import sys
+import threading
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+from awsiammapper import metrics
+from awsiammapper.metrics import Histogram, Metrics
+
+
+def test_histogram():
+    """observations are counted in the first bucket bounding them"""
+
+    histogram = Histogram(buckets=(0.1, 1.0), counts=[0, 0, 0])
+    for seconds in (0.05, 0.1, 0.5, 5):
+        histogram.observe(seconds)
+
+    assert histogram.cumulative() == [("0.1", 2), ("1.0", 3), ("+Inf", 4)]
+    assert histogram.sum == 5.65
+
+
+def test_summary():
+    """series are grouped by name and keyed by their labels"""
+
+    run_metrics = Metrics()
+    run_metrics.inc("rows_total", 3, service="s3")
+    run_metrics.inc("rows_total", 2, service="s3")
+    with run_metrics.stage("list"):
+        pass
+
+    summary = run_metrics.summary()
+
+    assert summary["counters"] == {"rows_total": {"service=s3": 5}}
+    assert summary["histograms"]["stage_seconds"]["stage=list"]["count"] == 1
+    assert summary["peak_rss_bytes"] > 0
+
+
+def test_to_prometheus():
+    """metrics are exported in the prometheus text format"""
+
+    run_metrics = Metrics()
+    run_metrics.inc("rows_total", 5, service="s3")
+    run_metrics.observe("stage_seconds", 0.2, stage="write")
+
+    lines = run_metrics.to_prometheus().splitlines()
+
+    assert "# TYPE awsiammapper_rows_total counter" in lines
+    assert 'awsiammapper_rows_total{service="s3"} 5' in lines
+    assert 'awsiammapper_stage_seconds_bucket{stage="write",le="0.1"} 0' in lines
+    assert 'awsiammapper_stage_seconds_bucket{stage="write",le="+Inf"} 1' in lines
+    assert 'awsiammapper_stage_seconds_count{stage="write"} 1' in lines
+
+
+def test_instrument_client():
+    """api calls, errors and their latency are recorded from botocore events"""
+
+    run_metrics = Metrics()
+    client = run_metrics.instrument(boto3.client("s3", region_name="us-east-1"))
+
+    with Stubber(client) as stubber:
+        stubber.add_response("list_buckets", {"Buckets": []})
+        stubber.add_client_error("get_bucket_policy", "NoSuchBucketPolicy")
+        client.list_buckets()
+        try:
+            client.get_bucket_policy(Bucket="my-bucket-1")
+        except client.exceptions.ClientError:
+            pass
+
+    summary = run_metrics.summary()
+
+    assert summary["counters"]["api_calls_total"] == {
+        "operation=GetBucketPolicy,service=s3": 1,
+        "operation=ListBuckets,service=s3": 1,
+    }
+    assert summary["counters"]["api_errors_total"] == {
+        "operation=GetBucketPolicy,service=s3": 1
+    }
+    assert (
+        summary["histograms"]["api_call_seconds"]["operation=ListBuckets,service=s3"][
+            "count"
+        ]
+        == 1
+    )
+
+
+def test_throttles():
+    """throttled attempts are counted from the retry handler"""
+
+    run_metrics = Metrics()
+    # pylint: disable-next=protected-access
+    run_metrics._needs_retry(
+        "needs-retry.s3.GetBucketPolicy",
+        response=(None, {"Error": {"Code": "SlowDown"}}),
+    )
+
+    assert run_metrics.summary()["counters"]["api_throttles_total"] == {
+        "operation=GetBucketPolicy,service=s3": 1
+    }
+
+
+@pytest.mark.skipif(
+    sys.version_info < (3, 12), reason="cProfile covers threads from python 3.12"
+)
+def test_profile_threads(tmp_path):
+    """the profile includes work done within threads"""
+
+    def threaded_work():
+        return sum(range(1000))
+
+    with metrics.profile(str(tmp_path / "run.prof")):
+        thread = threading.Thread(target=threaded_work)
+        thread.start()
+        thread.join()
+
+    stats = pstats.Stats(str(tmp_path / "run.prof"))
+
+    assert any(function == "threaded_work" for _, _, function in stats.stats)
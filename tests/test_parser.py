@@ -0,0 +1,68 @@
+"""test policy document parsing"""
+
+import json
+
+from awsiammapper.parser import PolicyParser
+from tests.helper import build_statement_with_condition
+
+
+def test_parse_json_literals():
+    """json literals such as true, false and null are parsed"""
+
+    policy = {
+        "Version": "2012-10-17",
+        "Statement": [
+            build_statement_with_condition(
+                condition={"Bool": {"aws:SecureTransport": False}}
+            ),
+        ],
+        "Id": None,
+    }
+
+    document = PolicyParser().parse(json.dumps(policy))
+
+    assert document == policy
+
+
+def test_parse_cache_hit():
+    """identical policy text is only decoded once"""
+
+    calls = []
+
+    def loads(text):
+        calls.append(text)
+        return json.loads(text)
+
+    parser = PolicyParser(loads=loads)
+    text = json.dumps({"Statement": [build_statement_with_condition()]})
+
+    first = parser.parse(text)
+    second = parser.parse(text.encode("utf-8"))
+
+    assert first is second
+    assert len(calls) == 1
+    assert parser.stats.documents == 2
+    assert parser.stats.cache_hits == 1
+    assert parser.stats.seconds >= 0
+
+
+def test_parse_cache_eviction():
+    """the least recently used document is evicted once the cache is full"""
+
+    parser = PolicyParser(cache_size=1)
+
+    parser.parse('{"Sid": "1"}')
+    parser.parse('{"Sid": "2"}')
+    parser.parse('{"Sid": "1"}')
+
+    assert parser.stats.cache_hits == 0
+
+
+def test_parse_clear():
+    """clearing resets the statistics"""
+
+    parser = PolicyParser()
+    parser.parse('{"Sid": "1"}')
+    parser.clear()
+
+    assert parser.stats.documents == 0
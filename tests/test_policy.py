@@ -1,6 +1,8 @@
 """test policy statement generation"""
 
-from awsiammapper.policy import Condition, flattern
+import json
+
+from awsiammapper.policy import Condition, factor, flattern
 from tests.helper import (
     build_policy_statement,
     build_statement,
@@ -217,3 +219,43 @@ def test_flattern_with_conditional_multi_operators():
     ]
 
     assert policy == expected_policy
+
+
+def test_flattern_compact_statements():
+    """flatterned statements are slotted and share interned field values"""
+
+    first = flattern(json.loads(json.dumps(build_statement(action="s3:GetObject"))))
+    second = flattern(json.loads(json.dumps(build_statement(action="s3:GetObject"))))
+
+    assert not hasattr(first[0], "__dict__")
+    assert first[0].action is second[0].action
+    assert first[0].statement_id is second[0].statement_id
+
+
+def test_factor_row_count():
+    """factored statement reports its expanded row count without expanding"""
+
+    statement = factor(
+        build_statement(
+            resource=[f"arn:aws:s3:::resource{i}" for i in range(50)],
+            action=[f"s3:Action{i}" for i in range(40)],
+            principal={"AWS": [f"arn:aws:iam::{i:012d}:root" for i in range(20)]},
+        )
+    )
+
+    assert len(statement) == 40_000
+
+
+def test_factor_lazy_rows():
+    """factored statement yields the same rows as flattern on demand"""
+
+    aws_statement = build_statement(
+        action=["s3:ListObject", "s3:GetObject"],
+        resource=["arn:aws:s3:::resource1", "arn:aws:s3:::resource2"],
+    )
+    rows = iter(factor(aws_statement))
+
+    assert next(rows) == build_policy_statement(
+        action="s3:ListObject", resource="arn:aws:s3:::resource1"
+    )
+    assert [next(rows)] + list(rows) == flattern(aws_statement)[1:]
@@ -0,0 +1,142 @@
+"""test indexed queries over policy statements"""
+
+import tempfile
+
+from awsiammapper.policy import Condition
+from awsiammapper.query import StatementIndex
+from tests.helper import build_policy_statement
+
+STATEMENTS = [
+    build_policy_statement(
+        principle_ref="role-a", action="s3:GetObject", effect="Allow", resource="b1"
+    ),
+    build_policy_statement(
+        principle_ref="role-a", action="s3:*", effect="Allow", resource="b2"
+    ),
+    build_policy_statement(
+        principle_ref="role-b",
+        action="s3:*",
+        effect="Allow",
+        resource="b2",
+        conditions=[Condition(key="aws:SecureTransport", operater="Bool", value=True)],
+    ),
+    build_policy_statement(principle_ref="role-c", action="s3:*", resource="b2"),
+]
+
+
+def test_lookup_single_field():
+    """postings of a single field are returned in row order"""
+
+    index = StatementIndex(STATEMENTS)
+
+    assert index.lookup(resource="b2") == [1, 2, 3]
+    assert index.lookup(principal="role-a") == [0, 1]
+    assert not index.lookup(action="s3:PutObject")
+
+
+def test_query_intersection():
+    """queries intersect the postings of every given field"""
+
+    index = StatementIndex(STATEMENTS)
+
+    assert index.query(principal="role-a", action="s3:*") == [STATEMENTS[1]]
+    assert not index.query(principal="role-c", resource="b1")
+
+
+def test_query_all():
+    """a query without fields returns every statement"""
+
+    assert StatementIndex(STATEMENTS).query() == STATEMENTS
+
+
+def test_who_can_access():
+    """principals with allow statements on a resource"""
+
+    assert StatementIndex(STATEMENTS).who_can_access("b2") == {"role-a", "role-b"}
+
+
+def test_who_can_access_wildcards_and_deny():
+    """allows apply through wildcards and are overridden by a matching deny"""
+
+    index = StatementIndex(
+        [
+            build_policy_statement(
+                principle_ref="role-a", effect="Allow", resource="arn:aws:s3:::b1/*"
+            ),
+            build_policy_statement(
+                principle_ref="*", action="s3:List*", effect="Allow"
+            ),
+            build_policy_statement(
+                principle_ref="role-b", action="*", effect="Allow", resource="*"
+            ),
+            build_policy_statement(principle_ref="role-b", action="s3:*"),
+            build_policy_statement(principle_ref="role-c", effect="Allow"),
+            build_policy_statement(principle_ref="role-c", action="s3:GetObject"),
+        ]
+    )
+
+    assert index.who_can_access("arn:aws:s3:::b1/key") == {
+        "role-a",
+        "*",
+        "role-b",
+        "role-c",
+    }
+    assert index.who_can_access("arn:aws:s3:::b1/key", "s3:GetObject") == {"role-a"}
+    assert index.who_can_access("arn:aws:s3:::b1/key", "s3:ListBucket") == {
+        "*",
+        "role-a",
+        "role-c",
+    }
+
+
+def test_who_can_access_conditional_deny():
+    """a conditional deny, such as denying insecure transport, keeps principals"""
+
+    index = StatementIndex(
+        [
+            build_policy_statement(
+                conditions=[Condition("aws:SecureTransport", "Bool", "false")]
+            ),
+            build_policy_statement(
+                principle_ref="arn:aws:iam::111111111111:role/reader",
+                action="s3:GetObject",
+                effect="Allow",
+                resource="arn:aws:s3:::b/*",
+            ),
+        ]
+    )
+
+    assert index.who_can_access("arn:aws:s3:::b/*", "s3:GetObject") == {
+        "arn:aws:iam::111111111111:role/reader"
+    }
+    assert index.who_can_access("arn:aws:s3:::b/key", "s3:GetObject") == {
+        "arn:aws:iam::111111111111:role/reader"
+    }
+
+
+def test_who_can_access_loaded(tmp_path):
+    """wildcard resources are matched by a loaded index and after adding rows"""
+
+    index = StatementIndex(
+        [build_policy_statement(effect="Allow", resource="arn:aws:s3:::b/*")]
+    )
+    index.save(str(tmp_path / "index.json.gz"))
+    loaded = StatementIndex.load(str(tmp_path / "index.json.gz"))
+
+    assert loaded.who_can_access("arn:aws:s3:::b/key") == {"*"}
+
+    loaded.add(build_policy_statement(resource="arn:aws:s3:::b/k*"))
+
+    assert not loaded.who_can_access("arn:aws:s3:::b/key")
+
+
+def test_save_load():
+    """a saved index is loaded with the same statements and postings"""
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        StatementIndex(STATEMENTS).save(f"{temp_dir}/index.json.gz")
+        index = StatementIndex.load(f"{temp_dir}/index.json.gz")
+
+    assert index.statements == STATEMENTS
+    assert index.lookup(principal="role-a", resource="b2") == [1]
+    assert len(index) == len(STATEMENTS)
@@ -0,0 +1,118 @@
+"""test the pacing of API calls by the shared scheduler"""
+
+import threading
+import time
+
+import boto3
+from botocore.awsrequest import AWSResponse
+from moto import mock_aws
+from moto.core.botocore_stubber import MockRawResponse
+
+from awsiammapper.client import S3Client
+from awsiammapper.metrics import default_metrics
+from awsiammapper.scheduler import AdaptiveLimit, Scheduler, TokenBucket
+from tests.helper import create_bucket_with_policy
+
+SLOW_DOWN = (
+    b"<Error><Code>SlowDown</Code><Message>Please reduce your request rate."
+    b"</Message></Error>"
+)
+
+
+def test_token_bucket():
+    """tokens beyond the burst are admitted at the rate"""
+
+    bucket = TokenBucket(rate=50, burst=1)
+    start = time.monotonic()
+    waits = [bucket.acquire() for _ in range(6)]
+
+    assert waits[0] == 0
+    assert time.monotonic() - start >= 0.09
+
+
+def test_adaptive_limit():
+    """the limit grows additively and halves once per round of throttles"""
+
+    limit = AdaptiveLimit(max_limit=8)
+    started = [limit.acquire() for _ in range(4)]
+
+    assert limit.decrease(started[0])
+    assert not limit.decrease(started[1])
+    assert limit.limit == 4
+
+    for _ in range(4):
+        limit.release(True)
+
+    assert 4 < limit.limit < 5
+    assert limit.in_flight == 0
+
+
+def test_adaptive_limit_blocks():
+    """calls beyond the limit wait for a call in flight to complete"""
+
+    limit = AdaptiveLimit(max_limit=1)
+    limit.acquire()
+    admitted = threading.Event()
+
+    def call():
+        limit.acquire()
+        admitted.set()
+
+    thread = threading.Thread(target=call)
+    thread.start()
+
+    assert not admitted.wait(0.05)
+    limit.release(True)
+    assert admitted.wait(1)
+    thread.join()
+
+
+def test_throttle_decreases_limit():
+    """a throttled attempt lowers the limit of its service"""
+
+    scheduler = Scheduler(max_concurrency=8)
+    context = {}
+    # pylint: disable=protected-access
+    scheduler._before_call("before-call.s3.GetBucketPolicy", context=context)
+    scheduler._needs_retry(
+        "needs-retry.s3.GetBucketPolicy",
+        response=(None, {"Error": {"Code": "SlowDown"}}),
+        request_dict={"context": context},
+    )
+    scheduler._after_call(context=context)
+
+    assert scheduler.limit("s3").limit == 4
+    assert scheduler.limit("s3").in_flight == 0
+
+
+def test_scheduled_client():
+    """throttled calls of a client are retried and lower the limit"""
+
+    scheduler = Scheduler(rate=100, max_concurrency=16)
+    default_metrics.clear()
+
+    with mock_aws():
+        s3 = boto3.client("s3")
+        create_bucket_with_policy(s3, "my-bucket-1")
+        client = scheduler.attach(
+            boto3.client(
+                "s3", config=boto3.session.Config(retries={"mode": "standard"})
+            )
+        )
+        throttles = iter([True])
+
+        def throttle(request, **kwargs):
+            # pylint: disable=unused-argument
+            if next(throttles, False):
+                return AWSResponse(request.url, 503, {}, MockRawResponse(SLOW_DOWN))
+            return None
+
+        client.meta.events.register_first("before-send.s3.GetBucketPolicy", throttle)
+
+        assert len(S3Client(client=client).get_policies(["my-bucket-1"])) == 1
+
+    assert scheduler.limit("s3").limit == 8
+    assert scheduler.limit("s3").in_flight == 0
+    assert default_metrics.summary()["counters"]["scheduler_decreases_total"] == {
+        "service=s3": 1
+    }
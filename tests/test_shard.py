@@ -0,0 +1,188 @@
+"""test sharded runs and the merge of their partial outputs"""
+
+import sqlite3
+import tempfile
+
+import pytest
+
+from awsiammapper import mapper, shard
+from awsiammapper.client import S3Client
+from awsiammapper.config import AppConfig
+from awsiammapper.policy import Condition
+from awsiammapper.query import StatementIndex, write_index
+from awsiammapper.writer import merge_csv, write_csv, write_parquet, write_sqlite
+from tests.helper import build_policy_statement, create_bucket_with_policy
+
+CONDITION = Condition(key="aws:SecureTransport", operater="Bool", value="false")
+
+
+def test_in_shard():
+    """every resource belongs to exactly one shard"""
+
+    resources = [f"bucket-{i}" for i in range(100)]
+    shards = [
+        [resource for resource in resources if shard.in_shard(resource, i, 4)]
+        for i in range(4)
+    ]
+
+    assert sorted(sum(shards, [])) == sorted(resources)
+    assert all(shards)
+
+
+def test_check_shard():
+    """the shard index must be within the shard count"""
+
+    shard.check_shard(3, 4)
+    with pytest.raises(ValueError):
+        shard.check_shard(4, 4)
+
+
+def test_partial_path():
+    """partial outputs keep the extensions of the output"""
+
+    assert (
+        shard.partial_path("out/mapping.csv.gz", 1, 4)
+        == "out/mapping.part-0001-of-0004.csv.gz"
+    )
+
+
+def test_shard_client(s3):
+    """a shard client lists only the resources within its shard"""
+
+    for i in range(10):
+        s3.create_bucket(Bucket=f"bucket-{i}")
+
+    listed = [shard.ShardClient(S3Client(), i, 3).list() for i in range(3)]
+
+    assert sorted(sum(listed, [])) == sorted(S3Client().list())
+
+
+def test_merge_csv():
+    """partials are aligned to the widest condition and account columns"""
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        partials = [f"{temp_dir}/a.csv", f"{temp_dir}/b.csv", f"{temp_dir}/c.csv"]
+        write_csv([build_policy_statement()], partials[0])
+        write_csv(
+            [build_policy_statement(conditions=[CONDITION, CONDITION])], partials[1]
+        )
+        write_csv([build_policy_statement(account="111111111111")], partials[2])
+
+        merge_csv(partials, f"{temp_dir}/mapping.csv")
+
+        with open(f"{temp_dir}/mapping.csv", encoding="utf-8") as fp:
+            assert fp.read().splitlines() == [
+                "statement_id,principle_authority,principle_ref,action,effect,"
+                "resource,account,key 1,operator 1,value 1,key 2,operator 2,value 2",
+                "DefaultPolicy,*,*,s3:*,Deny,*,,,,,,,",
+                "DefaultPolicy,*,*,s3:*,Deny,*,,aws:SecureTransport,Bool,false,"
+                "aws:SecureTransport,Bool,false",
+                "DefaultPolicy,*,*,s3:*,Deny,*,111111111111,,,,,,",
+            ]
+
+
+def test_merge_parquet():
+    """parquet partials are combined in shard order"""
+
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for i, effect in enumerate(["Allow", "Deny"]):
+            write_parquet(
+                [build_policy_statement(effect=effect)],
+                shard.partial_path(f"{temp_dir}/mapping.parquet", i, 2),
+            )
+
+        shard.merge(f"{temp_dir}/mapping.parquet", 2, "parquet")
+
+        assert pq.read_table(f"{temp_dir}/mapping.parquet").column(
+            "effect"
+        ).to_pylist() == ["Allow", "Deny"]
+
+
+def test_merge_index():
+    """index partials are combined into a single index"""
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for i, resource in enumerate(["bucket-a", "bucket-b"]):
+            write_index(
+                [build_policy_statement(resource=resource)],
+                shard.partial_path(f"{temp_dir}/mapping.idx", i, 2),
+            )
+
+        shard.merge(f"{temp_dir}/mapping.idx", 2, "index")
+        index = StatementIndex.load(f"{temp_dir}/mapping.idx")
+
+        assert index.lookup(resource="bucket-b") == [1]
+
+
+def test_merge_sqlite():
+    """sqlite partials are combined, renumbering the statements of each"""
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for i, resource in enumerate(["bucket-a", "bucket-b"]):
+            write_sqlite(
+                [
+                    build_policy_statement(
+                        resource=resource,
+                        conditions=[Condition("s3:prefix", "StringLike", resource)],
+                    )
+                ]
+                * 2,
+                shard.partial_path(f"{temp_dir}/mapping.db", i, 2),
+            )
+
+        shard.merge(f"{temp_dir}/mapping.db", 2, "sqlite")
+
+        with sqlite3.connect(f"{temp_dir}/mapping.db") as connection:
+            rows = connection.execute(
+                "SELECT s.id, s.resource, c.value FROM statements s"
+                " JOIN conditions c ON c.statement = s.id ORDER BY s.id"
+            ).fetchall()
+        connection.close()
+
+        assert rows == [
+            (1, "bucket-a", "bucket-a"),
+            (2, "bucket-a", "bucket-a"),
+            (3, "bucket-b", "bucket-b"),
+            (4, "bucket-b", "bucket-b"),
+        ]
+
+
+def test_sharded_run(s3):
+    """merging the shards of a run covers every bucket"""
+
+    for i in range(6):
+        create_bucket_with_policy(s3, f"bucket-{i}")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = f"{temp_dir}/mapping.csv"
+        for i in range(3):
+            mapper.map_iam(
+                AppConfig(
+                    file_path=file_path, services=["s3"], shard_index=i, shard_count=3
+                )
+            )
+        shard.merge(file_path, 3)
+
+        with open(file_path, encoding="utf-8") as fp:
+            rows = fp.read().splitlines()
+
+    assert len(rows) == 7
+    assert sorted(row.split(",")[5] for row in rows[1:]) == [
+        f"arn:aws:s3:::bucket-{i}" for i in range(6)
+    ]
+
+
+def test_lambda_shard_event(monkeypatch):
+    """the shard of a lambda invocation is read from its event"""
+
+    app_configs = []
+    monkeypatch.setenv("awsiammapper_OUTPUT", "./output.csv")
+    monkeypatch.setenv("awsiammapper_SERVICES", "s3")
+    monkeypatch.setenv("awsiammapper_SHARD_COUNT", "4")
+    monkeypatch.setattr(mapper, "map_iam", app_configs.append)
+
+    mapper.lambda_handler({"shard_index": 2}, None)
+
+    assert (app_configs[0].shard_index, app_configs[0].shard_count) == (2, 4)
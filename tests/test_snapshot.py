@@ -0,0 +1,93 @@
+"""test the persistent policy snapshot store"""
+
+import sqlite3
+import tempfile
+
+from awsiammapper.policy import factor
+from awsiammapper.snapshot import SnapshotStore, policy_hash
+from tests.helper import build_statement
+
+
+def test_snapshot_put_get():
+    """recorded policy documents are returned with their hash"""
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with SnapshotStore(f"{temp_dir}/snapshot.db") as store:
+            store.put("s3", "my-bucket-1", '{"Statement": []}')
+
+        with SnapshotStore(f"{temp_dir}/snapshot.db") as store:
+            snapshot = store.get("s3", "my-bucket-1")
+
+        assert snapshot.policy == '{"Statement": []}'
+        assert snapshot.policy_hash == policy_hash('{"Statement": []}')
+
+
+def test_snapshot_changed():
+    """a document is only reported as changed when its hash differs"""
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with SnapshotStore(f"{temp_dir}/snapshot.db") as store:
+            assert store.put("s3", "my-bucket-1", '{"Statement": []}')
+            assert not store.put("s3", "my-bucket-1", '{"Statement": []}')
+            assert store.put("s3", "my-bucket-1", '{"Statement": [{}]}')
+
+            assert store.stats.changed == 2
+            assert store.stats.unchanged == 1
+
+
+def test_snapshot_freshness():
+    """documents are only fresh within the ttl"""
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with SnapshotStore(f"{temp_dir}/snapshot.db", ttl=3600) as store:
+            store.put("s3", "my-bucket-1", None)
+
+            assert store.get_fresh("s3", "my-bucket-1").policy is None
+            assert store.get_fresh("s3", "my-bucket-2") is None
+
+        with SnapshotStore(f"{temp_dir}/snapshot.db", ttl=-1) as store:
+            assert store.get_fresh("s3", "my-bucket-1") is None
+
+
+def test_snapshot_statements():
+    """statements are kept while the document is unchanged, dropped on change"""
+
+    statements = [factor(build_statement())]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with SnapshotStore(f"{temp_dir}/snapshot.db") as store:
+            store.put("s3", "my-bucket-1", '{"Statement": []}')
+            store.put_statements("s3", "my-bucket-1", '{"Statement": []}', statements)
+
+        with SnapshotStore(f"{temp_dir}/snapshot.db") as store:
+            store.put("s3", "my-bucket-1", '{"Statement": []}')
+            assert (
+                store.get_statements("s3", "my-bucket-1", '{"Statement": []}')
+                == statements
+            )
+            assert store.stats.reused == 1
+
+            store.put("s3", "my-bucket-1", '{"Statement": [{}]}')
+            assert not store.get_statements("s3", "my-bucket-1", '{"Statement": [{}]}')
+            assert not store.get_statements("s3", "my-bucket-1", '{"Statement": []}')
+
+
+def test_snapshot_adds_statements_column():
+    """a store created before statements were stored gains the column"""
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with sqlite3.connect(f"{temp_dir}/snapshot.db") as connection:
+            connection.execute(
+                "CREATE TABLE snapshot (service TEXT NOT NULL, resource TEXT NOT NULL,"
+                " policy TEXT, policy_hash TEXT, fetched_at REAL NOT NULL,"
+                " PRIMARY KEY (service, resource))"
+            )
+            connection.execute(
+                "INSERT INTO snapshot VALUES ('s3', 'my-bucket-1', '{}', ?, 0)",
+                (policy_hash("{}"),),
+            )
+        connection.close()
+
+        with SnapshotStore(f"{temp_dir}/snapshot.db") as store:
+            assert not store.put("s3", "my-bucket-1", "{}")
+            assert store.get_statements("s3", "my-bucket-1", "{}") is None
@@ -0,0 +1,67 @@
+"""test the incremental json scanner"""
+
+import io
+import json
+
+import pytest
+
+from awsiammapper.stream import JsonScanner
+
+DOCUMENT = {
+    "version": 4,
+    "skipped": {"nested": ["[{", '"quoted" \\ }]', {"deep": [1, 2.5e3, None]}]},
+    "resources": [
+        {"type": "a", "values": {"text": '{"escaped": [1]}'}},
+        {"type": "b", "values": [True, False, -1]},
+    ],
+    "unicode": "café 😀",
+}
+
+
+@pytest.mark.parametrize("chunk_size", [1, 3, 7, 1024])
+def test_iter_path(chunk_size):
+    """members at the path are decoded across any chunk boundary"""
+
+    scanner = JsonScanner(io.StringIO(json.dumps(DOCUMENT)), chunk_size=chunk_size)
+
+    assert list(scanner.iter_path(("resources", "*"))) == [
+        (0, DOCUMENT["resources"][0]),
+        (1, DOCUMENT["resources"][1]),
+    ]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 1024])
+def test_iter_object(chunk_size):
+    """members are consumed one at a time, skipped without decoding"""
+
+    scanner = JsonScanner(
+        io.StringIO(json.dumps(DOCUMENT, indent=2)), chunk_size=chunk_size
+    )
+    decoded = {}
+    for key in scanner.iter_object():
+        if key in ("version", "unicode"):
+            decoded[key] = scanner.decode()
+        else:
+            scanner.skip()
+
+    assert decoded == {"version": 4, "unicode": DOCUMENT["unicode"]}
+
+
+def test_empty_containers():
+    """empty objects and arrays have no members"""
+
+    scanner = JsonScanner(io.StringIO('{"a": {}, "b": []}'))
+
+    assert [(key, scanner.decode()) for key in scanner.iter_object()] == [
+        ("a", {}),
+        ("b", []),
+    ]
+
+
+def test_truncated_document():
+    """a truncated document is reported rather than silently ending"""
+
+    scanner = JsonScanner(io.StringIO('{"resources": [{"type": "a"'), chunk_size=4)
+
+    with pytest.raises(ValueError):
+        list(scanner.iter_path(("resources", "*")))
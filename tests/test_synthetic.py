@@ -0,0 +1,43 @@
+"""test the synthetic policy generator"""
+
+import json
+import random
+
+from awsiammapper.client import S3Client
+from awsiammapper.policy import flattern
+from tests.synthetic import StubS3, generate_account, generate_statement
+
+
+def test_generate_account_seeded():
+    """the same seed generates the same account"""
+
+    assert generate_account(seed=1, buckets=10) == generate_account(seed=1, buckets=10)
+    assert generate_account(seed=1, buckets=10) != generate_account(seed=2, buckets=10)
+
+
+def test_generate_statement_fan_out():
+    """statements flattern to the product of their fan out"""
+
+    statement = generate_statement(
+        random.Random(0),
+        "bucket",
+        resources=3,
+        actions=4,
+        principals=5,
+        conditions=2,
+    )
+
+    assert len(flattern(statement)) == 60
+    assert len(flattern(statement)[0].conditions) == 2
+
+
+def test_stub_s3_client():
+    """generated accounts are served through the stub S3 client"""
+
+    policies = generate_account(buckets=5, statements=1, resources=1, actions=1)
+    client = S3Client(client=StubS3(policies))
+
+    statements = client.get_policies(client.list())
+
+    assert len(statements) == 5 * 2
+    assert json.loads(policies[client.list()[0]])["Version"] == "2012-10-17"
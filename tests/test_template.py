@@ -0,0 +1,99 @@
+"""test the factoring of bucket policies through shared templates"""
+
+import json
+
+import pytest
+
+from awsiammapper.policy import factor
+from awsiammapper.template import PLACEHOLDER, PolicyTemplates
+from tests.helper import build_statement, build_statement_with_condition
+from tests.synthetic import generate_account
+
+
+def policy(bucket, condition=None, sid="DefaultPolicy"):
+    """bucket policy templated on the bucket name"""
+    return json.dumps(
+        {
+            "Version": "2012-10-17",
+            "Statement": [
+                build_statement_with_condition(
+                    sid=sid,
+                    resource=[f"arn:aws:s3:::{bucket}", f"arn:aws:s3:::{bucket}/*"],
+                    condition=condition or {},
+                ),
+                build_statement(effect="Allow", action="s3:GetObject"),
+            ],
+        }
+    )
+
+
+def expected(text):
+    """statements factored without the templates"""
+    return [factor(statement) for statement in json.loads(text)["Statement"]]
+
+
+def test_shared_template():
+    """buckets sharing a template are factored once and rebound to their arn"""
+
+    templates = PolicyTemplates()
+
+    for bucket in ("my-bucket-1", "my-bucket-2", "my-bucket-1-logs"):
+        text = policy(bucket)
+        assert templates.factor_bucket_policy(text, bucket) == expected(text)
+
+    assert templates.stats.documents == 3
+    assert templates.stats.cache_hits == 2
+    assert templates.stats.unsafe == 0
+
+
+def test_statements_shared_between_buckets():
+    """statements not referring to the bucket are shared rather than copied"""
+
+    templates = PolicyTemplates()
+    first, second, third = (
+        templates.factor_bucket_policy(policy(bucket), bucket)
+        for bucket in ("my-bucket-1", "my-bucket-2", "my-bucket-3")
+    )
+
+    assert first[1] == second[1]
+    assert second[0].resources != third[0].resources
+    assert second[1] is third[1]
+
+
+@pytest.mark.parametrize(
+    "bucket, text",
+    [
+        (
+            "my-bucket-1",
+            policy(
+                "my-bucket-1",
+                condition={"ArnLike": {"aws:SourceArn": "arn:aws:s3:::my-bucket-1"}},
+            ),
+        ),
+        ("my-bucket-1", policy("my-bucket-1", sid="arn:aws:s3:::my-bucket-1")),
+        ("my-bucket-1", policy("my-bucket-1").replace("/*", "\\/*")),
+        ("my-bucket-1", policy("my-bucket-1").replace("DefaultPolicy", PLACEHOLDER)),
+    ],
+)
+def test_unsafe_documents(bucket, text):
+    """documents that cannot be rebound are factored as written"""
+
+    templates = PolicyTemplates()
+
+    for _ in range(3):
+        assert templates.factor_bucket_policy(text, bucket) == expected(text)
+
+    assert templates.stats.cache_hits == 0
+    assert templates.stats.unsafe >= 2
+
+
+def test_generated_account():
+    """a generated account factors the same through the templates"""
+
+    templates = PolicyTemplates()
+    policies = generate_account(seed=1, buckets=50, shared=0.5)
+
+    for bucket, text in policies.items():
+        assert templates.factor_bucket_policy(text, bucket) == expected(text)
+
+    assert templates.stats.cache_hits > 0
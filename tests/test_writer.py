@@ -1,9 +1,21 @@
 """test application outputs defined by the write module"""
 
+import sqlite3
 import tempfile
 
+import pytest
+
+from awsiammapper import writer
 from awsiammapper.policy import Condition
-from awsiammapper.writer import write_csv
+from awsiammapper.query import write_index
+from awsiammapper.writer import (
+    get_reader,
+    get_writer,
+    open_text,
+    write_csv,
+    write_parquet,
+    write_sqlite,
+)
 from tests.helper import build_policy_statement
 
 
@@ -49,3 +61,277 @@ DefaultPolicy,*,*,s3:*,Allow,*,,,
 """
         with open(f"{temp_dir}/output.csv", "r", encoding="utf-8") as f:
             assert f.read() == expected_output
+
+
+def test_csv_from_generator():
+    """statements are streamed from an iterator in a single pass"""
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        statements = iter(
+            [
+                build_policy_statement(effect="Allow"),
+                build_policy_statement(
+                    conditions=[
+                        Condition(
+                            key="S3:Prefix", operater="StringLike", value="janedoe/*"
+                        )
+                    ]
+                ),
+            ]
+        )
+        write_csv(statements, f"{temp_dir}/output.csv")
+
+        # pylint: disable=line-too-long
+        expected_output = """statement_id,principle_authority,principle_ref,action,effect,resource,key 1,operator 1,value 1
+DefaultPolicy,*,*,s3:*,Allow,*,,,
+DefaultPolicy,*,*,s3:*,Deny,*,S3:Prefix,StringLike,janedoe/*
+"""
+        with open(f"{temp_dir}/output.csv", "r", encoding="utf-8") as f:
+            assert f.read() == expected_output
+
+
+def test_csv_no_statements():
+    """no statements writes the header only"""
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        write_csv(iter([]), f"{temp_dir}/output.csv")
+
+        expected_output = """statement_id,principle_authority,principle_ref,action,effect,resource
+"""
+        with open(f"{temp_dir}/output.csv", "r", encoding="utf-8") as f:
+            assert f.read() == expected_output
+
+
+def test_csv_declared_max_conditions():
+    """declared condition columns are padded without spooling"""
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        write_csv(
+            [build_policy_statement()], f"{temp_dir}/output.csv", max_conditions=1
+        )
+
+        # pylint: disable=line-too-long
+        expected_output = """statement_id,principle_authority,principle_ref,action,effect,resource,key 1,operator 1,value 1
+DefaultPolicy,*,*,s3:*,Deny,*,,,
+"""
+        with open(f"{temp_dir}/output.csv", "r", encoding="utf-8") as f:
+            assert f.read() == expected_output
+
+
+def test_csv_declared_max_conditions_exceeded():
+    """statements with more conditions than declared are rejected"""
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        with pytest.raises(ValueError):
+            write_csv(
+                [
+                    build_policy_statement(
+                        conditions=[
+                            Condition(key="aws:SourceIp", operater="IpAddress", value=v)
+                            for v in ["10.0.0.0/8", "192.168.0.0/16"]
+                        ]
+                    )
+                ],
+                f"{temp_dir}/output.csv",
+                max_conditions=1,
+            )
+
+
+def test_csv_condition_values_as_json():
+    """non string condition values are written as in the policy document"""
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        write_csv(
+            [
+                build_policy_statement(
+                    conditions=[
+                        Condition("aws:SecureTransport", "Bool", False),
+                        Condition("s3:max-keys", "NumericLessThan", 10),
+                        Condition("aws:TokenIssueTime", "Null", None),
+                    ]
+                )
+            ],
+            f"{temp_dir}/output.csv",
+        )
+
+        with open(f"{temp_dir}/output.csv", "r", encoding="utf-8") as f:
+            assert f.read().splitlines()[1].split(",")[6:] == [
+                "aws:SecureTransport",
+                "Bool",
+                "false",
+                "s3:max-keys",
+                "NumericLessThan",
+                "10",
+                "aws:TokenIssueTime",
+                "Null",
+                "null",
+            ]
+
+
+def test_parquet():
+    """parquet output with dictionary encoded columns and nested conditions"""
+
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        write_parquet(
+            [
+                build_policy_statement(
+                    conditions=[
+                        Condition(
+                            key="aws:SecureTransport", operater="Bool", value=False
+                        )
+                    ]
+                ),
+                build_policy_statement(effect="Allow"),
+                build_policy_statement(effect="Allow", account="111111111111"),
+            ],
+            f"{temp_dir}/output.parquet",
+            row_group_size=2,
+        )
+
+        parquet_file = pq.ParquetFile(f"{temp_dir}/output.parquet")
+        table = parquet_file.read()
+
+        assert parquet_file.num_row_groups == 2
+        assert table.column("effect").to_pylist() == ["Deny", "Allow", "Allow"]
+        assert table.column("account").to_pylist() == [None, None, "111111111111"]
+        assert table.column("conditions").to_pylist() == [
+            [{"key": "aws:SecureTransport", "operator": "Bool", "value": "false"}],
+            [],
+            [],
+        ]
+        assert "RLE_DICTIONARY" in str(
+            parquet_file.metadata.row_group(0).column(4).encodings
+        )
+
+
+def test_parquet_no_statements():
+    """no statements writes a parquet file with the schema only"""
+
+    pq = pytest.importorskip("pyarrow.parquet")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        write_parquet(iter([]), f"{temp_dir}/output.parquet")
+
+        assert pq.read_table(f"{temp_dir}/output.parquet").num_rows == 0
+
+
+def test_get_writer():
+    """writer factory returns the writer of each format"""
+
+    assert get_writer("csv") is write_csv
+    assert get_writer("parquet") is write_parquet
+    assert get_writer("index") is write_index
+    assert get_writer("sqlite") is write_sqlite
+
+
+@pytest.mark.parametrize("output_format", ["csv", "sqlite", "index"])
+def test_read_output(output_format):
+    """statements read back from an output equal those written"""
+
+    statements = [
+        build_policy_statement(
+            conditions=[Condition("s3:prefix", "StringLike", "home/*")] * 2,
+            account="111111111111",
+        ),
+        build_policy_statement(effect="Allow"),
+    ]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        get_writer(output_format)(statements, f"{temp_dir}/output")
+
+        assert list(get_reader(output_format)(f"{temp_dir}/output")) == statements
+
+
+def test_sqlite():
+    """statements and their conditions are written to related tables"""
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = f"{temp_dir}/output.db"
+        for effect in ("Allow", "Deny"):  # an existing database is replaced
+            write_sqlite(
+                (
+                    build_policy_statement(
+                        effect=effect,
+                        resource=f"bucket-{i}",
+                        conditions=[
+                            Condition("aws:SecureTransport", "Bool", False),
+                            Condition("s3:prefix", "StringLike", "home/*"),
+                        ][: i % 3],
+                        account="111111111111" if i else None,
+                    )
+                    for i in range(5)
+                ),
+                file_path,
+                transaction_size=2,
+            )
+
+        with sqlite3.connect(file_path) as connection:
+            statements = connection.execute(
+                "SELECT id, effect, resource, account FROM statements"
+            ).fetchall()
+            conditions = connection.execute(
+                "SELECT s.resource, c.key, c.operator, c.value FROM conditions c"
+                " JOIN statements s ON s.id = c.statement WHERE s.resource = ?",
+                ("bucket-2",),
+            ).fetchall()
+            plan = connection.execute(
+                "EXPLAIN QUERY PLAN SELECT * FROM statements WHERE action = ?",
+                ("s3:*",),
+            ).fetchall()
+        connection.close()
+
+        assert statements[:2] == [
+            (1, "Deny", "bucket-0", None),
+            (2, "Deny", "bucket-1", "111111111111"),
+        ]
+        assert len(statements) == 5
+        assert conditions == [
+            ("bucket-2", "aws:SecureTransport", "Bool", "false"),
+            ("bucket-2", "s3:prefix", "StringLike", "home/*"),
+        ]
+        assert "statements_action" in plan[0][-1]
+
+
+@pytest.mark.parametrize(
+    "extension,module", [("csv.gz", "gzip"), ("csv.zst", "zstandard")]
+)
+def test_csv_compressed(extension, module):
+    """compression is chosen from the output file extension"""
+
+    pytest.importorskip(module)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        file_path = f"{temp_dir}/output.{extension}"
+        write_csv(
+            [build_policy_statement(), build_policy_statement(effect="Allow")],
+            file_path,
+        )
+
+        expected_output = """statement_id,principle_authority,principle_ref,action,effect,resource
+DefaultPolicy,*,*,s3:*,Deny,*
+DefaultPolicy,*,*,s3:*,Allow,*
+"""
+        with open(file_path, "rb") as f:
+            assert not f.read().startswith(b"statement_id")
+
+        with open_text(file_path) as f:
+            assert f.read().splitlines() == expected_output.splitlines()
+
+
+def test_csv_batches(monkeypatch):
+    """statements spanning several batches are written in order"""
+
+    monkeypatch.setattr(writer, "BATCH_SIZE", 2)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        write_csv(
+            (build_policy_statement(resource=str(i)) for i in range(5)),
+            f"{temp_dir}/output.csv",
+        )
+
+        with open(f"{temp_dir}/output.csv", "r", encoding="utf-8") as f:
+            rows = f.read().splitlines()
+
+        assert [row.rsplit(",", 1)[1] for row in rows[1:]] == [str(i) for i in range(5)]